@@ -14,6 +14,8 @@ setup(
         "singer-python==6.3.0",
         "requests==2.32.4",
         "backoff==2.2.1",
+        # zoneinfo needs it where the system has no time zone database
+        "tzdata==2025.2",
     ],
     extras_require={
         'dev': [
@@ -1,9 +1,14 @@
+import asyncio
 import json
+import sys
 import singer
 from singer import utils
 from singer.catalog import Catalog
+from tap_ga4.async_sync import sync_async
+from tap_ga4.cache import CompatibilityCache, MetadataCache
 from tap_ga4.client import Client
 from tap_ga4.discover import discover
+from tap_ga4.quota import DailyQuotaExhausted
 from tap_ga4.sync import sync
 
 LOGGER = singer.get_logger()
@@ -33,16 +38,36 @@ def main_impl():
     config = args.config
     maybe_parse_report_definitions(config)
 
-    client = Client(config)
+    # The asyncio engine builds and warms up its own AsyncClient
+    client = None
+    if args.discover or config.get("sync_engine") != "asyncio":
+        client = Client(config)
+        # Gets a token and a connection ready while the catalog and state
+        # are prepared
+        client.warm_up()
 
     if args.state:
         state.update(args.state)
     if args.discover:
-        discover(client, config.get("report_definitions", []), config["property_id"])
+        discover(client,
+                 config.get("report_definitions", []),
+                 config["property_id"],
+                 CompatibilityCache.from_config(config),
+                 MetadataCache.from_config(config))
         LOGGER.info("Discovery complete")
     elif args.catalog:
-        sync(client, config, catalog, state)
-        LOGGER.info("Sync Completed")
+        try:
+            if config.get("sync_engine") == "asyncio":
+                asyncio.run(sync_async(config, catalog, state))
+            else:
+                sync(client, config, catalog, state)
+            LOGGER.info("Sync Completed")
+        except DailyQuotaExhausted as ex:
+            # The last STATE message resumes the sync, so stop now rather
+            # than wait for the quota to reset, and fail so schedulers
+            # don't count the partial sync as a success
+            LOGGER.critical("%s. Stopping the sync, the next run resumes from the last bookmark.", ex)
+            sys.exit(1)
     else:
         LOGGER.info("No properties were selected")
 
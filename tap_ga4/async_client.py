@@ -0,0 +1,138 @@
+import asyncio
+import time
+import backoff
+from google.analytics.data_v1beta import BetaAnalyticsDataAsyncClient
+from google.analytics.data_v1beta.types import (CheckCompatibilityRequest,
+                                                GetMetadataRequest,
+                                                RunReportRequest)
+from google.api_core.exceptions import (ResourceExhausted, ServerError,
+                                        TooManyRequests)
+
+from tap_ga4.auth import TokenRefresher
+from tap_ga4.client import BaseClient, get_credentials
+from tap_ga4.transport import TransportProfile
+
+
+class AsyncClient(BaseClient):  # pylint: disable=too-many-instance-attributes
+    """
+    asyncio counterpart of Client, built on BetaAnalyticsDataAsyncClient.
+
+    At most max_concurrent_requests requests are in flight at once across
+    every coroutine using the client, and each request is cancelled after
+    request_timeout seconds. Requests go through the same quota governor,
+    coordinator and adaptive concurrency limits as Client's, whose
+    blocking waits run in the event loop's default executor. Requests
+    that exhaust a quota are parked there until it resets, without
+    blocking the event loop, and exhausting the daily quota raises
+    DailyQuotaExhausted.
+    """
+
+    DEFAULT_REQUEST_TIMEOUT = 300
+
+    def __init__(self, config):
+        super().__init__(config)
+        credentials = get_credentials(config)
+        self.client = BetaAnalyticsDataAsyncClient(credentials=credentials,
+                                                   transport=TransportProfile.from_config(config).get_async_transport())
+        self.token_refresher = TokenRefresher(credentials)
+        self.request_timeout = float(config.get("request_timeout", self.DEFAULT_REQUEST_TIMEOUT))
+        self.init_request_controls(config)
+        max_concurrent_requests = int(config.get("max_concurrent_requests", self.DEFAULT_MAX_CONCURRENT_REQUESTS))
+        self.request_semaphore = asyncio.Semaphore(max_concurrent_requests)
+
+
+    def start_channel_warm_up(self):
+        """Schedules connect_channel on the event loop, so warm_up must be called from it."""
+        return asyncio.ensure_future(self.connect_channel())
+
+
+    async def connect_channel(self):
+        try:
+            await asyncio.wait_for(self.client.transport.grpc_channel.channel_ready(),
+                                   self.CHANNEL_WARM_UP_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.log_channel_warm_up_timeout()
+
+
+    @backoff.on_exception(backoff.expo,
+                          (ServerError, TooManyRequests, ResourceExhausted),
+                          max_tries=5,
+                          logger=None)
+    async def _make_request(self, request):
+        async with self.request_semaphore:
+            acquire = asyncio.get_running_loop().run_in_executor(None, self.acquire_request_slots)
+            try:
+                await asyncio.shield(acquire)
+            except asyncio.CancelledError:
+                # The executor still takes the slots, free them once it has
+                acquire.add_done_callback(self.cancel_acquired_slots)
+                raise
+            # Taken right before the RPC, so the latency the controllers see
+            # doesn't include waiting for slots or pacing
+            start_time = time.monotonic()
+            try:
+                response = await self._send_request(request)
+            except BaseException as ex:
+                # Cancellations too, the slots are taken by then
+                self.release_request_slots(request, start_time, error=ex)
+                raise
+            self.release_request_slots(request, start_time, response)
+            return response
+
+
+    def cancel_acquired_slots(self, acquire):
+        if not acquire.cancelled() and acquire.exception() is None:
+            self.cancel_request_slots()
+
+
+    async def _send_request(self, request):
+        if isinstance(request, RunReportRequest):
+            return await self.client.run_report(request, timeout=self.request_timeout)
+        if isinstance(request, GetMetadataRequest):
+            return await self.client.get_metadata(request, timeout=self.request_timeout)
+        if isinstance(request, CheckCompatibilityRequest):
+            return await self.client.check_compatibility(request, timeout=self.request_timeout)
+        raise TypeError(f"Unrecognized request type: {type(request)}")
+
+
+    async def get_report(self, report, range_start_date, range_end_date):
+        """
+        Async generator over the pages of a report. The pages after the
+        first are requested page_concurrency at a time and yielded in
+        offset order.
+        """
+        date_ranges = [(range_start_date, range_end_date)]
+        request = self.build_report_request(report, date_ranges, 0)
+        response = await self._make_request(request)
+        self.record_page(report, date_ranges, response)
+        yield response
+
+        page_size = self.get_page_size(report)
+        offsets = list(range(len(response.rows), response.row_count, page_size)) if response.rows else []
+        pending = []
+        try:
+            while offsets or pending:
+                while offsets and len(pending) < self.page_concurrency:
+                    request = self.build_report_request(report, date_ranges, offsets.pop(0), page_size)
+                    pending.append(asyncio.ensure_future(self._make_request(request)))
+                response = await pending.pop(0)
+                self.record_page(report, date_ranges, response)
+                yield response
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+    async def get_dimensions_and_metrics(self, property_id):
+        request = self.build_metadata_request(property_id)
+        return await self._make_request(request)
+
+
+    async def check_metric_compatibility(self, property_id, metric):
+        request = self.build_metric_compatibility_request(property_id, metric)
+        return await self._make_request(request)
+
+
+    async def check_dimension_compatibility(self, property_id, dimension):
+        request = self.build_dimension_compatibility_request(property_id, dimension)
+        return await self._make_request(request)
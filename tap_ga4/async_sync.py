@@ -0,0 +1,106 @@
+import asyncio
+import singer
+
+from tap_ga4.async_client import AsyncClient
+from tap_ga4.quota import DailyQuotaExhausted
+from tap_ga4.sync import (DEFAULT_REQUEST_WINDOW_SIZE,
+                          DEFAULT_STREAM_CONCURRENCY, generate_report_dates,
+                          get_selected_streams, prepare_stream,
+                          validate_selected_fields, write_response_records)
+from tap_ga4.writer import Writer
+
+LOGGER = singer.get_logger()
+
+DEFAULT_WINDOW_CONCURRENCY = 1
+
+# Options of the threaded sync engine the asyncio engine doesn't support,
+# and whether a configured value turns them on
+UNSUPPORTED_OPTIONS = {"prefetch_depth": lambda value: int(value) > 0,
+                       "report_batch_size": lambda value: int(value) > 1,
+                       "date_ranges_per_request": lambda value: int(value) > 1,
+                       "adaptive_request_window": lambda value: str(value).lower() == "true"}
+
+
+def validate_async_config(config):
+    """Raises ValueError when config turns on options the asyncio engine doesn't support."""
+    unsupported_options = [option for option, is_enabled in UNSUPPORTED_OPTIONS.items()
+                           if config.get(option) is not None and is_enabled(config[option])]
+    if unsupported_options:
+        raise ValueError(f"sync_engine asyncio doesn't support {', '.join(unsupported_options)}. "
+                         "Remove them or use the default sync engine.")
+
+
+async def get_window_pages(client, report, range_start_date, range_end_date):
+    return [response async for response in client.get_report(report, range_start_date, range_end_date)]
+
+
+async def sync_report_async(client, schema, report, start_date, end_date, request_window_size, writer, window_concurrency):
+    """
+    asyncio version of sync_report. Up to window_concurrency date windows
+    are fetched at once, while records and bookmarks are still written one
+    window at a time in date order.
+    """
+    LOGGER.info("Syncing %s for property_id %s", report['name'], report['property_id'])
+
+    windows = list(generate_report_dates(start_date, end_date, request_window_size))
+    pending = []
+    try:
+        for i, (_, range_end_date) in enumerate(windows):
+            while len(pending) < window_concurrency and i + len(pending) < len(windows):
+                range_start, range_end = windows[i + len(pending)]
+                pending.append(asyncio.ensure_future(get_window_pages(client, report, range_start, range_end)))
+            for response in await pending.pop(0):
+                write_response_records(writer, schema, report, response)
+            writer.write_bookmark(report["id"],
+                                  report["property_id"],
+                                  {"last_report_date": range_end_date})
+    finally:
+        for task in pending:
+            task.cancel()
+    LOGGER.info("Done syncing %s for property_id %s", report["name"], report["property_id"])
+
+
+async def sync_stream_async(client, config, stream, writer, stream_semaphore):
+    async with stream_semaphore:
+        report, schema, start_date, end_date = prepare_stream(config, stream, writer)
+        request_window_size = int(config.get("request_window_size", DEFAULT_REQUEST_WINDOW_SIZE))
+        window_concurrency = max(1, int(config.get("window_concurrency", DEFAULT_WINDOW_CONCURRENCY)))
+
+        await sync_report_async(client, schema, report, start_date, end_date, request_window_size, writer,
+                                window_concurrency)
+        writer.finish_stream(stream.tap_stream_id)
+
+
+async def sync_async(config, catalog, state, client=None):
+    """
+    Syncs the selected streams from a single event loop. Up to
+    stream_concurrency streams run at once, and every request goes through
+    one AsyncClient. The first failure cancels all other streams.
+
+    Prefetching, report batches, multiple date ranges per request and
+    adaptive request windows are only supported by the threaded engine,
+    and raise ValueError when configured.
+    """
+    validate_async_config(config)
+    if client is None:
+        client = AsyncClient(config)
+        client.warm_up()
+    selected_streams = get_selected_streams(catalog, state)
+    validate_selected_fields(config, selected_streams)
+    stream_concurrency = int(config.get("stream_concurrency", DEFAULT_STREAM_CONCURRENCY))
+
+    writer = Writer(state, concurrent=stream_concurrency > 1)
+    # Keep emitting STATE while requests are parked on an exhausted quota
+    client.quota_governor.heartbeat = writer.write_state
+    stream_semaphore = asyncio.Semaphore(stream_concurrency)
+    tasks = [asyncio.ensure_future(sync_stream_async(client, config, stream, writer, stream_semaphore))
+             for stream in selected_streams]
+    try:
+        await asyncio.gather(*tasks)
+    except DailyQuotaExhausted:
+        writer.write_state()
+        raise
+    finally:
+        for task in tasks:
+            task.cancel()
+    writer.finish_sync()
@@ -0,0 +1,67 @@
+import threading
+from datetime import datetime, timezone
+import singer
+from google.auth.transport.requests import Request
+
+LOGGER = singer.get_logger()
+
+
+def utcnow():
+    # google-auth keeps credential expiry as a naive UTC datetime
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class TokenRefresher:
+    """
+    Keeps OAuth credentials valid from a daemon thread.
+
+    The access token is fetched as soon as the thread starts, then
+    refreshed REFRESH_MARGIN seconds before it expires. That is earlier
+    than google-auth refreshes on its own, so requests don't wait for a
+    refresh. A failed refresh is retried every RETRY_INTERVAL seconds, and
+    requests still refresh the token themselves if it expires meanwhile.
+    """
+
+    REFRESH_MARGIN = 300
+    RETRY_INTERVAL = 30
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self.stopped = threading.Event()
+        self.thread = None
+
+
+    def get_refresh_delay(self, now):
+        """Seconds until the token should be refreshed, None if it never expires."""
+        if not self.credentials.token:
+            return 0
+        if self.credentials.expiry is None:
+            return None
+        return max(0, (self.credentials.expiry - now).total_seconds() - self.REFRESH_MARGIN)
+
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="tap-ga4-token-refresher", daemon=True)
+            self.thread.start()
+
+
+    def stop(self):
+        self.stopped.set()
+
+
+    def run(self):
+        while not self.stopped.is_set():
+            delay = self.get_refresh_delay(utcnow())
+            if delay is None:
+                return
+            if delay > 0:
+                self.stopped.wait(delay)
+                continue
+            try:
+                self.credentials.refresh(Request())
+            except Exception as ex:
+                LOGGER.warning("Failed to refresh the OAuth access token, retrying in %s seconds: %s",
+                               self.RETRY_INTERVAL,
+                               ex)
+                self.stopped.wait(self.RETRY_INTERVAL)
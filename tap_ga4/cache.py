@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import time
+import singer
+from google.analytics.data_v1beta.types import Metadata
+
+LOGGER = singer.get_logger()
+
+
+def hash_field(field):
+    """SHA 256 of a DimensionMetadata or MetricMetadata message."""
+    return hashlib.sha256(type(field).serialize(field)).hexdigest()
+
+
+def hash_fields(fields):
+    """SHA 256 over every field returned by a GetMetadataRequest."""
+    digest = hashlib.sha256()
+    for field in fields:
+        digest.update(type(field).serialize(field))
+    return digest.hexdigest()
+
+
+def write_bytes_atomically(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as outfile:
+        outfile.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_json_atomically(path, data):
+    write_bytes_atomically(path, json.dumps(data).encode("utf-8"))
+
+
+class MetadataCache:
+    """
+    On-disk cache of the GetMetadata response of one property, stored as
+    serialized protobuf bytes and reused while younger than ttl seconds.
+    """
+
+    DEFAULT_TTL_HOURS = 24
+
+    def __init__(self, cache_dir, property_id, ttl, refresh=False):
+        self.path = os.path.join(cache_dir, f"metadata_{property_id}.pb")
+        self.ttl = ttl
+        # Ignore the cached metadata, but still save the new response
+        self.refresh = refresh
+
+    @classmethod
+    def from_config(cls, config):
+        """Returns a cache when `cache_dir` is configured, None otherwise."""
+        if not config.get("cache_dir"):
+            return None
+        os.makedirs(config["cache_dir"], exist_ok=True)
+        ttl_hours = float(config.get("metadata_cache_ttl_hours", cls.DEFAULT_TTL_HOURS))
+        refresh = str(config.get("refresh_metadata_cache", False)).lower() == "true"
+        return cls(config["cache_dir"], config["property_id"], ttl_hours * 3600, refresh)
+
+    def get(self):
+        """Returns the cached Metadata, or None if it is missing, expired or refreshed."""
+        if self.refresh or not os.path.exists(self.path):
+            return None
+        if time.time() - os.path.getmtime(self.path) > self.ttl:
+            return None
+        with open(self.path, "rb") as infile:
+            return Metadata.deserialize(infile.read())
+
+    def put(self, response):
+        write_bytes_atomically(self.path, Metadata.serialize(response))
+        LOGGER.info("Saved property metadata cache to %s", self.path)
+
+
+class CompatibilityCache:
+    """
+    On-disk cache of CheckCompatibility results for one property, keyed
+    by field api_name.
+
+    An entry is reused while it is younger than ttl seconds and the
+    field's metadata hash is unchanged. The hash of all fields returned by
+    GetMetadata is stored alongside, so discovery can tell when fields were
+    added or changed since the cache was written.
+    """
+
+    DEFAULT_TTL_HOURS = 168
+
+    def __init__(self, cache_dir, property_id, ttl):
+        self.path = os.path.join(cache_dir, f"compatibility_{property_id}.json")
+        self.ttl = ttl
+        self.metadata_hash = None
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as infile:
+                cached = json.load(infile)
+            self.metadata_hash = cached.get("metadata_hash")
+            self.entries = cached.get("fields", {})
+
+    @classmethod
+    def from_config(cls, config):
+        """Returns a cache when `cache_dir` is configured, None otherwise."""
+        if not config.get("cache_dir"):
+            return None
+        os.makedirs(config["cache_dir"], exist_ok=True)
+        ttl_hours = float(config.get("compatibility_cache_ttl_hours", cls.DEFAULT_TTL_HOURS))
+        return cls(config["cache_dir"], config["property_id"], ttl_hours * 3600)
+
+    def get(self, field):
+        """Returns the cached exclusions of field, or None if it must be checked again."""
+        entry = self.entries.get(field.api_name)
+        if not entry:
+            return None
+        if entry["field_hash"] != hash_field(field) or time.time() - entry["checked_at"] > self.ttl:
+            return None
+        return list(entry["exclusions"])
+
+    def put(self, field, exclusions):
+        self.entries[field.api_name] = {"field_hash": hash_field(field),
+                                        "checked_at": time.time(),
+                                        "exclusions": list(exclusions)}
+
+    def update(self, field, exclusions):
+        """Replaces the exclusions of a cached field, keeping when it was checked."""
+        self.entries[field.api_name]["exclusions"] = list(exclusions)
+
+    def save(self, metadata_hash, api_names):
+        """Writes the cache, dropping entries for fields that no longer exist."""
+        self.metadata_hash = metadata_hash
+        self.entries = {api_name: entry for api_name, entry in self.entries.items()
+                        if api_name in api_names}
+        write_json_atomically(self.path, {"metadata_hash": metadata_hash, "fields": self.entries})
+        LOGGER.info("Saved field compatibility cache to %s", self.path)
@@ -1,117 +1,279 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time
 import backoff
+import grpc
 import singer
 from google.analytics.data_v1beta import BetaAnalyticsDataClient
-from google.analytics.data_v1beta.types import (CheckCompatibilityRequest,
+from google.analytics.data_v1beta.types import (BatchRunReportsRequest,
+                                                CheckCompatibilityRequest,
                                                 DateRange, Dimension,
                                                 GetMetadataRequest, Metric,
                                                 OrderBy, RunReportRequest,
-                                                Filter, FilterExpression)
+                                                RunReportResponse, Filter,
+                                                FilterExpression)
 from google.api_core.exceptions import (ResourceExhausted, ServerError,
                                         TooManyRequests)
 from google.oauth2.credentials import Credentials
+from tap_ga4.auth import TokenRefresher
+from tap_ga4.concurrency import AIMDController, get_project_controller
+from tap_ga4.coordinator import QuotaCoordinator
+from tap_ga4.quota import (QuotaGovernor, classify_quota_error,
+                           get_property_quotas)
+from tap_ga4.rate_limit import RateLimiter
+from tap_ga4.transport import TransportProfile
 
 LOGGER = singer.get_logger()
 
 
-def sleep_if_quota_reached(ex):
-    if isinstance(ex, ResourceExhausted):
-        # Wait 1 hour for google to reset api quota
-        seconds = 3600
-        LOGGER.info("Reached hourly quota limit. Sleeping %s seconds.", seconds)
-        time.sleep(seconds)
-    return False
+def get_credentials(config):
+    return Credentials(None,
+                       refresh_token=config["refresh_token"],
+                       token_uri='https://www.googleapis.com/oauth2/v4/token',
+                       client_id=config["oauth_client_id"],
+                       client_secret=config["oauth_client_secret"])
 
-class Client:
+
+class BaseClient:  # pylint: disable=too-many-instance-attributes
+    """Builds the GA4 Data API requests shared by Client and AsyncClient."""
 
     PAGE_SIZE = 100000
+    DEFAULT_PAGE_CONCURRENCY = 1
+    # Limits set by the GA4 Data API for BatchRunReportsRequest and
+    # RunReportRequest.date_ranges
+    MAX_BATCH_REPORTS = 5
+    MAX_DATE_RANGES = 4
+    # Page size bounds when page_memory_budget_mb is set. GA4 returns at most
+    # 250000 rows per page.
+    MIN_PAGE_SIZE = 1000
+    MAX_PAGE_SIZE = 250000
+    # Rough ratio between the memory a page takes once decoded into
+    # proto-plus objects and its serialized size
+    PAGE_MEMORY_OVERHEAD = 4
+    # Serialized bytes assumed per row value before a report's first page
+    DEFAULT_VALUE_BYTES = 32
+    # GA4 allows 10 concurrent requests per standard property
+    DEFAULT_MAX_CONCURRENT_REQUESTS = 10
+    # Seconds the warm-up waits for the gRPC channel to connect
+    CHANNEL_WARM_UP_TIMEOUT = 30
 
     def __init__(self, config):
-        credentials = Credentials(None,
-                              refresh_token=config["refresh_token"],
-                              token_uri='https://www.googleapis.com/oauth2/v4/token',
-                              client_id=config["oauth_client_id"],
-                              client_secret=config["oauth_client_secret"])
+        # Number of report pages requested at once after the first page of a
+        # date window tells us the total row_count. 1 keeps the sequential walk.
+        self.page_concurrency = max(1, int(config.get("page_concurrency", self.DEFAULT_PAGE_CONCURRENCY)))
+        # When set, the limit of every report request is picked so a page
+        # fits in this many bytes, based on the row size of the last page
+        # of the same report
+        self.page_memory_budget = None
+        if config.get("page_memory_budget_mb"):
+            self.page_memory_budget = int(config["page_memory_budget_mb"]) * 1024 * 1024
+        self.row_bytes_estimates = {}
+        self.peak_page_bytes = 0
+        # Set by subclasses, along with their credentials
+        self.token_refresher = None
+        # Set up by init_request_controls, as they need the OAuth client id
+        self.property_concurrency = None
+        self.project_concurrency = None
+        self.quota_governor = None
 
-        self.client = BetaAnalyticsDataClient(credentials=credentials)
 
+    def warm_up(self):
+        """
+        Fetches an access token and connects the gRPC channel in the
+        background, so the first request waits for neither, and keeps the
+        token refreshed ahead of expiry for the rest of the run. Returns
+        what start_channel_warm_up returns.
+        """
+        self.token_refresher.start()
+        return self.start_channel_warm_up()
 
-    @backoff.on_exception(backoff.expo,
-                          (ServerError, TooManyRequests, ResourceExhausted),
-                          max_tries=5,
-                          jitter=None,
-                          giveup=sleep_if_quota_reached,
-                          logger=None)
-    def _make_request(self, request):
-        if isinstance(request, RunReportRequest):
-            return self.client.run_report(request)
-        if isinstance(request, GetMetadataRequest):
-            return self.client.get_metadata(request)
-        if isinstance(request, CheckCompatibilityRequest):
-            return self.client.check_compatibility(request)
-        raise TypeError(f"Unrecognized request type: {type(request)}")
 
+    def start_channel_warm_up(self):
+        """Starts waiting for the gRPC channel to connect, for at most CHANNEL_WARM_UP_TIMEOUT seconds."""
+        raise NotImplementedError
 
-    def get_report(self, report, range_start_date, range_end_date):
+
+    def log_channel_warm_up_timeout(self):
+        LOGGER.info("The gRPC channel did not connect within %s seconds of warming up, "
+                    "the first request will connect it.",
+                    self.CHANNEL_WARM_UP_TIMEOUT)
+
+
+    def init_request_controls(self, config):
+        # Adaptive limits on the requests in flight for the property, and
+        # for every property synced with the same OAuth client
+        max_concurrent_requests = int(config.get("max_concurrent_requests", self.DEFAULT_MAX_CONCURRENT_REQUESTS))
+        self.property_concurrency = AIMDController(f"property:{config.get('property_id')}", max_concurrent_requests)
+        self.project_concurrency = get_project_controller(config["oauth_client_id"], max_concurrent_requests)
+        # Shared by every request, so pacing accounts for all streams and pages
+        pacing_threshold = float(config.get("quota_pacing_threshold", QuotaGovernor.DEFAULT_PACING_THRESHOLD))
+        self.quota_governor = QuotaGovernor(pacing_threshold,
+                                            QuotaCoordinator.from_config(config, pacing_threshold))
+
+
+    def acquire_request_slots(self):
+        """Waits until quota pacing and the concurrency limits let a request go out."""
+        self.quota_governor.acquire()
+        self.property_concurrency.acquire()
+        self.project_concurrency.acquire()
+
+
+    def release_request_slots(self, request, start_time, response=None, error=None):
         """
-        Calls _make_request and paginates over the request if the
-        response.row_count is greater than the PAGE_SIZE
+        Frees the slots of a request sent at start_time, and tells the
+        concurrency limits and the quota governor what its response or
+        error says about congestion and quota. A ResourceExhausted error
+        parks later requests until the quota resets, or raises
+        DailyQuotaExhausted, which is not retried.
         """
-        offset = 0
-        has_more_rows = True
-        dimension_filters = None
-        # Dimension filters are hardcoded for premade reports
+        property_congestion = None
+        project_congestion = None
+        quota_name = None
+        if isinstance(error, ResourceExhausted):
+            quota_name = classify_quota_error(error)
+            if quota_name == "concurrent_requests":
+                property_congestion = quota_name
+        elif isinstance(error, TooManyRequests):
+            property_congestion = "too_many_requests"
+        elif isinstance(error, ServerError):
+            # Server errors count against a per project quota
+            project_congestion = "server_error"
+        elif any("concurrent_requests" in quota and quota.concurrent_requests.remaining == 0
+                 for quota in get_property_quotas(response)):
+            property_congestion = "concurrent_requests"
+        try:
+            if quota_name:
+                self.quota_governor.exhaust(quota_name)
+        finally:
+            request_kind = type(request).__name__
+            self.project_concurrency.release(start_time, request_kind, project_congestion)
+            self.property_concurrency.release(start_time, request_kind, property_congestion)
+            self.quota_governor.release(get_property_quotas(response))
+
+
+    def cancel_request_slots(self):
+        """Frees the slots of a request that was never sent."""
+        self.project_concurrency.cancel()
+        self.property_concurrency.cancel()
+        self.quota_governor.release()
+
+
+    def get_quota_state(self):
+        return self.quota_governor.get_state()
+
+
+    def get_page_size(self, report):
+        """Returns the number of rows to request per page of report."""
+        if not self.page_memory_budget:
+            return self.PAGE_SIZE
+        row_bytes = self.row_bytes_estimates.get(report["id"])
+        if row_bytes is None:
+            values_per_row = len(report["dimensions"]) + len(report["metrics"])
+            row_bytes = max(1, values_per_row) * self.DEFAULT_VALUE_BYTES * self.PAGE_MEMORY_OVERHEAD
+        return max(self.MIN_PAGE_SIZE, min(self.MAX_PAGE_SIZE, self.page_memory_budget // row_bytes))
+
+
+    def estimate_page_bytes(self, response):
+        """Estimated in-memory size of a decoded RunReportResponse."""
+        return RunReportResponse.pb(response).ByteSize() * self.PAGE_MEMORY_OVERHEAD
+
+
+    def record_page(self, report, date_ranges, response):
+        """
+        Logs the quota a report page consumed and updates the row size
+        estimate used by get_page_size.
+        """
+        self.log_report_quota(report, date_ranges, response)
+        if not response.rows:
+            return
+        page_bytes = self.estimate_page_bytes(response)
+        self.row_bytes_estimates[report["id"]] = max(1, page_bytes // len(response.rows))
+        if page_bytes > self.peak_page_bytes:
+            self.peak_page_bytes = page_bytes
+            LOGGER.info("Peak report page memory is now ~%s MB (%s rows of report: %s)",
+                        round(page_bytes / 1024 / 1024, 1),
+                        len(response.rows),
+                        report["name"])
+
+
+    def build_report_request(self, report, date_ranges, offset, limit=None):
+        """
+        Builds the RunReportRequest for one page of a report over a list of
+        (range_start_date, range_end_date) tuples. The page size defaults to
+        get_page_size.
+        """
+        # Dimension filters are hardcoded for premade reports, custom
+        # reports carry the filters of their report definition
+        dimension_filters = report.get("dimension_filter")
         if report["name"] in ["conversions_report", "in_app_purchases"]:
             dimension_filters = self.get_premade_report_dimension_filter(report["name"])
 
-        while has_more_rows:
-            request = RunReportRequest(
-                property=f"properties/{report['property_id']}",
-                dimensions=report["dimensions"],
-                metrics=report["metrics"],
-                date_ranges=[DateRange(start_date=range_start_date, end_date=range_end_date)],
-                limit=self.PAGE_SIZE,
-                offset=offset,
-                return_property_quota=True,
-                order_bys=[OrderBy(dimension=OrderBy.DimensionOrderBy(dimension_name="date", order_type="NUMERIC"))],
-                dimension_filter= dimension_filters
-            )
-            response = self._make_request(request)
-            has_more_rows = response.row_count > self.PAGE_SIZE + offset
-            offset += self.PAGE_SIZE
+        return RunReportRequest(
+            property=f"properties/{report['property_id']}",
+            dimensions=report["dimensions"],
+            metrics=report["metrics"],
+            date_ranges=[DateRange(start_date=range_start_date, end_date=range_end_date)
+                         for range_start_date, range_end_date in date_ranges],
+            limit=limit or self.get_page_size(report),
+            offset=offset,
+            return_property_quota=True,
+            order_bys=[OrderBy(dimension=OrderBy.DimensionOrderBy(dimension_name="date", order_type="NUMERIC"))],
+            dimension_filter= dimension_filters,
+            metric_filter=report.get("metric_filter")
+        )
 
-            LOGGER.info("Request for report: %s from %s -> %s consumed %s GA4 quota tokens",
-                        report["name"],
-                        range_start_date,
-                        range_end_date,
-                        response.property_quota.tokens_per_hour.consumed)
 
-            yield response
+    def build_batch_report_request(self, reports, range_start_date, range_end_date):
+        """Builds one BatchRunReportsRequest for the first page of every report."""
+        return BatchRunReportsRequest(
+            property=f"properties/{reports[0]['property_id']}",
+            requests=[self.build_report_request(report, [(range_start_date, range_end_date)], 0)
+                      for report in reports]
+        )
 
 
-    def get_dimensions_and_metrics(self, property_id):
-        request = GetMetadataRequest(
+    @staticmethod
+    def log_report_quota(report, date_ranges, response):
+        LOGGER.info("Request for report: %s from %s -> %s consumed %s GA4 quota tokens",
+                    report["name"],
+                    date_ranges[0][0],
+                    date_ranges[-1][1],
+                    response.property_quota.tokens_per_hour.consumed)
+
+
+    @staticmethod
+    def build_metadata_request(property_id):
+        return GetMetadataRequest(
             name=f"properties/{property_id}/metadata",
         )
-        return self._make_request(request)
 
 
-    def check_metric_compatibility(self, property_id, metric):
-        request = CheckCompatibilityRequest(
+    @staticmethod
+    def build_metric_compatibility_request(property_id, metric):
+        return CheckCompatibilityRequest(
             property=f"properties/{property_id}",
             metrics=[Metric(name=metric.api_name)],
             compatibility_filter="INCOMPATIBLE"
             )
-        return self._make_request(request)
 
 
-    def check_dimension_compatibility(self, property_id, dimension):
-        request = CheckCompatibilityRequest(
+    @staticmethod
+    def build_dimension_compatibility_request(property_id, dimension):
+        return CheckCompatibilityRequest(
             property=f"properties/{property_id}",
             dimensions=[Dimension(name=dimension.api_name)],
             compatibility_filter="INCOMPATIBLE"
             )
-        return self._make_request(request)
+
+
+    @staticmethod
+    def build_fields_compatibility_request(property_id, dimension_names, metric_names):
+        return CheckCompatibilityRequest(
+            property=f"properties/{property_id}",
+            dimensions=[Dimension(name=name) for name in dimension_names],
+            metrics=[Metric(name=name) for name in metric_names],
+            compatibility_filter="INCOMPATIBLE"
+            )
 
 
     def get_premade_report_dimension_filter(self, report_name):
@@ -131,3 +293,195 @@ class Client:
                 )
             )
         return None
+
+
+class Client(BaseClient):  # pylint: disable=too-many-instance-attributes
+
+    DEFAULT_COMPATIBILITY_CONCURRENCY = 1
+    DEFAULT_COMPATIBILITY_GROUP_SIZE = 1
+
+    def __init__(self, config):
+        super().__init__(config)
+        credentials = get_credentials(config)
+        self.client = BetaAnalyticsDataClient(credentials=credentials,
+                                              transport=TransportProfile.from_config(config).get_transport())
+        self.token_refresher = TokenRefresher(credentials)
+        self.init_request_controls(config)
+        # Number of CheckCompatibility requests discovery runs at once
+        self.compatibility_concurrency = max(1, int(config.get("compatibility_concurrency",
+                                                               self.DEFAULT_COMPATIBILITY_CONCURRENCY)))
+        # Number of fields discovery puts in one CheckCompatibility request.
+        # 1 checks every field on its own.
+        self.compatibility_group_size = max(1, int(config.get("compatibility_group_size",
+                                                              self.DEFAULT_COMPATIBILITY_GROUP_SIZE)))
+        # When set, CheckCompatibility requests, retries included, are
+        # spaced out to at most this many per second across all workers
+        self.compatibility_rate_limiter = None
+        if config.get("compatibility_requests_per_second"):
+            self.compatibility_rate_limiter = RateLimiter(float(config["compatibility_requests_per_second"]))
+
+
+    def start_channel_warm_up(self):
+        channel = getattr(self.client.transport, "grpc_channel", None)
+        if channel is not None:
+            threading.Thread(target=self.connect_channel,
+                             args=(channel,),
+                             name="tap-ga4-channel-warm-up",
+                             daemon=True).start()
+
+
+    def connect_channel(self, channel):
+        try:
+            grpc.channel_ready_future(channel).result(timeout=self.CHANNEL_WARM_UP_TIMEOUT)
+        except grpc.FutureTimeoutError:
+            self.log_channel_warm_up_timeout()
+
+
+    @backoff.on_exception(backoff.expo,
+                          (ServerError, TooManyRequests, ResourceExhausted),
+                          max_tries=5,
+                          logger=None)
+    def _make_request(self, request):
+        # Wait for the rate limit before taking quota and concurrency slots,
+        # which would otherwise sit unused while the rate limit sleeps
+        if self.compatibility_rate_limiter and isinstance(request, CheckCompatibilityRequest):
+            self.compatibility_rate_limiter.acquire()
+        self.acquire_request_slots()
+        # Taken right before the RPC, so the latency the controllers see
+        # doesn't include waiting for slots or pacing
+        start_time = time.monotonic()
+        response = None
+        error = None
+        try:
+            response = self._send_request(request)
+            return response
+        except Exception as ex:
+            error = ex
+            raise
+        finally:
+            self.release_request_slots(request, start_time, response, error)
+
+
+    def _send_request(self, request):
+        if isinstance(request, RunReportRequest):
+            return self.client.run_report(request)
+        if isinstance(request, BatchRunReportsRequest):
+            return self.client.batch_run_reports(request)
+        if isinstance(request, GetMetadataRequest):
+            return self.client.get_metadata(request)
+        if isinstance(request, CheckCompatibilityRequest):
+            return self.client.check_compatibility(request)
+        raise TypeError(f"Unrecognized request type: {type(request)}")
+
+
+    def get_report(self, report, range_start_date, range_end_date):
+        """
+        Calls _make_request and paginates over the request if the
+        response.row_count is greater than the page size.
+
+        When page_concurrency is greater than 1, the pages after the first
+        are requested through a bounded thread pool, but are still yielded
+        in offset order.
+        """
+        yield from self.get_date_ranges_report(report, [(range_start_date, range_end_date)])
+
+
+    def get_date_ranges_report(self, report, date_ranges):
+        """
+        Paginates over a report requesting up to MAX_DATE_RANGES
+        (range_start_date, range_end_date) tuples at once. GA4 tags every
+        row of a multiple date range response with a `dateRange` dimension.
+        """
+        request = self.build_report_request(report, date_ranges, 0)
+        response = self._make_request(request)
+        self.record_page(report, date_ranges, response)
+        yield response
+        yield from self.get_remaining_pages(report, date_ranges, response)
+
+
+    def get_remaining_pages(self, report, date_ranges, first_response):
+        """
+        Yields the pages of a report that come after first_response. Each
+        page size is picked by get_page_size from the pages seen so far.
+        """
+        offset = len(first_response.rows)
+        page_size = self.get_page_size(report)
+        if self.page_concurrency > 1 and first_response.row_count - offset > page_size:
+            offsets = range(offset, first_response.row_count, page_size)
+            yield from self._get_pages_concurrently(report, date_ranges, offsets, page_size)
+            return
+
+        while 0 < offset < first_response.row_count:
+            request = self.build_report_request(report, date_ranges, offset)
+            response = self._make_request(request)
+            self.record_page(report, date_ranges, response)
+            yield response
+            if not response.rows:
+                break
+            offset += len(response.rows)
+
+
+    def batch_get_reports(self, reports, range_start_date, range_end_date):
+        """
+        Requests the first page of up to MAX_BATCH_REPORTS reports in one
+        BatchRunReports call. Returns the responses in the order of reports.
+        """
+        request = self.build_batch_report_request(reports, range_start_date, range_end_date)
+        batch_response = self._make_request(request)
+        for report, response in zip(reports, batch_response.reports):
+            self.record_page(report, [(range_start_date, range_end_date)], response)
+        return list(batch_response.reports)
+
+
+    def _get_pages_concurrently(self, report, date_ranges, offsets, page_size):
+        """
+        Requests the pages at `offsets` with at most page_concurrency
+        requests in flight, yielding the responses in offset order.
+        """
+        max_workers = min(self.page_concurrency, len(offsets))
+        LOGGER.info("Requesting %s remaining pages for report: %s with %s workers",
+                    len(offsets),
+                    report["name"],
+                    max_workers)
+        remaining_offsets = iter(offsets)
+        pending = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+            def submit_next_page():
+                offset = next(remaining_offsets, None)
+                if offset is not None:
+                    request = self.build_report_request(report, date_ranges, offset, page_size)
+                    pending.append(executor.submit(self._make_request, request))
+
+            try:
+                for _ in range(max_workers):
+                    submit_next_page()
+                while pending:
+                    response = pending.pop(0).result()
+                    # Keep the pool full before handing the page back to the caller
+                    submit_next_page()
+                    self.record_page(report, date_ranges, response)
+                    yield response
+            finally:
+                for future in pending:
+                    future.cancel()
+
+
+    def get_dimensions_and_metrics(self, property_id):
+        request = self.build_metadata_request(property_id)
+        return self._make_request(request)
+
+
+    def check_metric_compatibility(self, property_id, metric):
+        request = self.build_metric_compatibility_request(property_id, metric)
+        return self._make_request(request)
+
+
+    def check_dimension_compatibility(self, property_id, dimension):
+        request = self.build_dimension_compatibility_request(property_id, dimension)
+        return self._make_request(request)
+
+
+    def check_fields_compatibility(self, property_id, dimension_names, metric_names):
+        request = self.build_fields_compatibility_request(property_id, dimension_names, metric_names)
+        return self._make_request(request)
@@ -0,0 +1,160 @@
+from collections import Counter
+import singer
+from google.api_core.exceptions import BadRequest
+
+LOGGER = singer.get_logger()
+
+
+def get_incompatible_fields(response):
+    """Returns the api_names listed in a CheckCompatibility response."""
+    incompatible_fields = [field.dimension_metadata.api_name for field in response.dimension_compatibilities]
+    incompatible_fields.extend(field.metric_metadata.api_name for field in response.metric_compatibilities)
+    return incompatible_fields
+
+
+class FieldGroup:
+    """Fields checked together, and the fields their last request listed."""
+
+    def __init__(self, members, incompatible_fields):
+        self.members = members
+        self.incompatible_fields = incompatible_fields
+
+
+class GroupCompatibilitySolver:
+    """
+    Finds the exclusions of many dimensions and metrics with fewer
+    CheckCompatibility requests than checking every field on its own.
+
+    A request for a group of fields lists every field that is incompatible
+    with at least one member. Compatibility is symmetric, so once every
+    field a group lists has been checked on its own, the exclusions of each
+    member are the checked fields that list it. The solver checks the
+    fields listed by the most unresolved groups first, and re-requests a
+    group without the members that got checked along the way.
+
+    A group whose response disagrees with the checked fields is ambiguous,
+    and its members are checked one by one, as is a group the API rejects.
+
+    known_exclusions are the exclusions of fields that need no check, from
+    field_exclusions.json or the compatibility cache. They count as checked
+    fields, so the groups listing them resolve without requests.
+    """
+
+    def __init__(self, client, property_id, group_size, known_exclusions=None):
+        self.client = client
+        self.property_id = property_id
+        self.group_size = group_size
+        # api_name -> exclusions, for fields checked on their own or known
+        self.exclusions = {api_name: list(exclusions) for api_name, exclusions in (known_exclusions or {}).items()}
+        self.exclusion_sets = {api_name: set(exclusions) for api_name, exclusions in self.exclusions.items()}
+        self.metric_names = set()
+        self.request_count = 0
+
+
+    def check_fields(self, api_names):
+        """Returns the fields incompatible with api_names, in response order."""
+        self.request_count += 1
+        response = self.client.check_fields_compatibility(
+            self.property_id,
+            [name for name in api_names if name not in self.metric_names],
+            [name for name in api_names if name in self.metric_names])
+        self.metric_names.update(field.metric_metadata.api_name for field in response.metric_compatibilities)
+        return get_incompatible_fields(response)
+
+
+    def check_field(self, api_name):
+        if api_name not in self.exclusions:
+            self.exclusions[api_name] = self.check_fields([api_name])
+            self.exclusion_sets[api_name] = set(self.exclusions[api_name])
+
+
+    def check_group(self, members):
+        """Requests a group, checking its members one by one when the API rejects it."""
+        try:
+            return FieldGroup(members, self.check_fields(members))
+        except BadRequest as ex:
+            LOGGER.info("Checking %s fields one by one after a rejected group request: %s", len(members), ex)
+            for api_name in members:
+                self.check_field(api_name)
+            return FieldGroup([], [])
+
+
+    def is_resolved(self, group):
+        return all(api_name in self.exclusions for api_name in group.incompatible_fields)
+
+
+    def refresh(self, group):
+        """
+        Returns True once group needs no more checks, re-requesting it when
+        members were checked since its last request.
+        """
+        if self.is_resolved(group):
+            return True
+        members = [api_name for api_name in group.members if api_name not in self.exclusions]
+        if len(members) < len(group.members):
+            if not members:
+                return True
+            checked_group = self.check_group(members)
+            group.members = checked_group.members
+            group.incompatible_fields = checked_group.incompatible_fields
+            return self.is_resolved(group)
+        return False
+
+
+    def resolve(self, group):
+        """Sets the exclusions of every unchecked member of a resolved group."""
+        members = [api_name for api_name in group.members if api_name not in self.exclusions]
+        # Fields listed because of members checked after the group request
+        claimed_fields = {field for api_name in group.members if api_name not in members
+                          for field in self.exclusions[api_name]}
+        listed_fields = set(group.incompatible_fields)
+        derived_exclusions = {}
+        for api_name in members:
+            derived_exclusions[api_name] = [field for field in group.incompatible_fields
+                                            if api_name in self.exclusion_sets[field]]
+            claimed_fields.update(derived_exclusions[api_name])
+            if any(api_name in exclusion_set and field not in listed_fields
+                   for field, exclusion_set in self.exclusion_sets.items()):
+                claimed_fields = None
+                break
+        if claimed_fields != listed_fields:
+            LOGGER.info("Checking %s fields one by one after an ambiguous group response", len(members))
+            for api_name in members:
+                self.check_field(api_name)
+            return
+        for api_name, exclusions in derived_exclusions.items():
+            self.exclusions[api_name] = exclusions
+            self.exclusion_sets[api_name] = set(exclusions)
+
+
+    def solve(self, dimensions, metrics):
+        """
+        Returns the incompatible fields of every dimension and metric, keyed
+        by api_name in the order of dimensions and metrics, as checking each
+        field on its own would.
+        """
+        api_names = [field.api_name for field in dimensions + metrics]
+        self.metric_names.update(metric.api_name for metric in metrics)
+        groups = [self.check_group(api_names[i:i + self.group_size])
+                  for i in range(0, len(api_names), self.group_size)]
+
+        while groups:
+            unresolved_groups = []
+            for group in groups:
+                if self.refresh(group):
+                    self.resolve(group)
+                else:
+                    unresolved_groups.append(group)
+            groups = unresolved_groups
+            if groups:
+                # The field listed by the most unresolved groups is likely
+                # incompatible with many fields, so checking it resolves the most
+                listed_counts = Counter(api_name for group in groups
+                                        for api_name in group.incompatible_fields
+                                        if api_name not in self.exclusions)
+                self.check_field(listed_counts.most_common(1)[0][0])
+
+        LOGGER.info("Found the exclusions of %s fields with %s CheckCompatibility requests",
+                    len(api_names),
+                    self.request_count)
+        return {api_name: self.exclusions[api_name] for api_name in api_names}
@@ -0,0 +1,152 @@
+import collections
+import threading
+import time
+import singer
+from singer import metrics
+from tap_ga4.coordinator import get_project_key
+
+LOGGER = singer.get_logger()
+
+
+class LatencyMonitor:
+    """
+    Tells when the latency of a kind of request stays high.
+
+    The baseline is a high percentile of the recent latencies, so the
+    usual spread, such as full report pages taking seconds longer than
+    small ones, stays under it. Only LATENCY_STREAK requests in a row well
+    above the baseline count as congestion. Every latency joins the
+    window, so the baseline follows a lasting change after a while.
+    """
+
+    # Number of recent latencies the baseline is computed from, and the
+    # number needed before any latency counts as high
+    WINDOW = 50
+    MIN_SAMPLES = 10
+    BASELINE_PERCENTILE = 0.9
+    # A latency is high above this multiple of the baseline, when that is
+    # also at least MIN_INCREASE seconds more
+    TOLERANCE = 3
+    MIN_INCREASE = 0.5
+    LATENCY_STREAK = 3
+
+    def __init__(self):
+        self.latencies = collections.deque(maxlen=self.WINDOW)
+        self.streak = 0
+
+
+    def get_baseline(self):
+        if len(self.latencies) < self.MIN_SAMPLES:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[int(self.BASELINE_PERCENTILE * (len(latencies) - 1))]
+
+
+    def record(self, latency):
+        """Adds a latency, returning True when it ends a run of LATENCY_STREAK high latencies."""
+        baseline = self.get_baseline()
+        self.latencies.append(latency)
+        if baseline is None or latency <= baseline * self.TOLERANCE or latency - baseline < self.MIN_INCREASE:
+            self.streak = 0
+            return False
+        self.streak += 1
+        if self.streak < self.LATENCY_STREAK:
+            return False
+        self.streak = 0
+        return True
+
+
+class AIMDController:
+    """
+    Limits the number of requests in flight with additive increase,
+    multiplicative decrease.
+
+    Every successful request raises the limit by 1 / limit, about one more
+    request per round of requests. Throttling errors halve it, and latency
+    staying well above the recent latencies lowers it by a quarter. Only
+    requests sent after the last decrease can lower the limit again, so
+    a burst of failures counts once. Latency is tracked per kind of
+    request, since metadata requests are much faster than report pages.
+    Limit changes are logged as singer metrics tagged with the scope and
+    the reason.
+    """
+
+    MIN_LIMIT = 1
+    DECREASE_FACTOR = 0.5
+    LATENCY_DECREASE_FACTOR = 0.75
+
+    def __init__(self, scope, max_limit, initial_limit=None):
+        self.scope = scope
+        self.max_limit = max_limit
+        self.limit = float(initial_limit or max(self.MIN_LIMIT, max_limit // 2))
+        self.in_flight = 0
+        # request kind -> LatencyMonitor
+        self.latency_monitors = {}
+        self.last_decrease_time = 0
+        self.condition = threading.Condition()
+
+
+    def acquire(self):
+        """Waits for a free slot."""
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+
+    def release(self, start_time, kind, congestion=None):
+        """
+        Frees the slot of a request of `kind` sent at start_time, a
+        time.monotonic() taken right before the RPC, so the latency doesn't
+        include waiting for slots or pacing.
+        The limit decreases if the request reported a congestion reason or
+        ended a run of slow requests, and increases otherwise.
+        """
+        with self.condition:
+            now = time.monotonic()
+            self.in_flight -= 1
+            if congestion:
+                self.decrease(start_time, now, self.DECREASE_FACTOR, congestion)
+            elif self.latency_monitors.setdefault(kind, LatencyMonitor()).record(now - start_time):
+                self.decrease(start_time, now, self.LATENCY_DECREASE_FACTOR, "latency")
+            else:
+                self.set_limit(self.limit + 1 / self.limit, "success")
+            self.condition.notify_all()
+
+
+    def cancel(self):
+        """Frees the slot of a request that was never sent, leaving the limit as is."""
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+
+    def decrease(self, start_time, now, factor, reason):
+        if start_time < self.last_decrease_time:
+            return
+        self.last_decrease_time = now
+        self.set_limit(self.limit * factor, reason)
+
+
+    def set_limit(self, limit, reason):
+        old_limit = int(self.limit)
+        self.limit = min(float(self.max_limit), max(float(self.MIN_LIMIT), limit))
+        if int(self.limit) != old_limit:
+            metrics.log(LOGGER, metrics.Point("gauge",
+                                              "concurrency_limit",
+                                              int(self.limit),
+                                              {"scope": self.scope, "reason": reason}))
+
+
+# Controllers for project wide limits, shared by every client in the
+# process that uses the same OAuth client
+PROJECT_CONTROLLERS = {}
+PROJECT_CONTROLLERS_LOCK = threading.Lock()
+
+
+def get_project_controller(project_id, max_limit):
+    with PROJECT_CONTROLLERS_LOCK:
+        if project_id not in PROJECT_CONTROLLERS:
+            # The scope tags metrics, which must not carry the OAuth client id
+            PROJECT_CONTROLLERS[project_id] = AIMDController(f"project:{get_project_key(project_id)}", max_limit)
+        return PROJECT_CONTROLLERS[project_id]
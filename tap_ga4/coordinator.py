@@ -0,0 +1,133 @@
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import json
+import os
+import time
+import singer
+from tap_ga4.quota import (DAILY_QUOTAS, TOKEN_QUOTAS, DailyQuotaExhausted,
+                           get_request_interval, update_budget,
+                           update_tokens_per_request)
+
+LOGGER = singer.get_logger()
+
+# Budgets shared by every property of a Google Cloud project. All others
+# belong to the property.
+PROJECT_QUOTAS = ("tokens_per_project_per_hour", "server_errors_per_project_per_hour")
+
+
+def get_project_key(project_id):
+    """Identifies the project of an OAuth client id without revealing the id."""
+    return hashlib.sha256(project_id.encode("utf-8")).hexdigest()[:16]
+
+
+def get_scope(quota_name):
+    return "project" if quota_name in PROJECT_QUOTAS else "property"
+
+
+class QuotaCoordinator:
+    """
+    Shares GA4 quota between the tap-ga4 processes of one host through a
+    JSON state file per project and per property, each locked with flock
+    while it is read and written.
+
+    Every request reserves the next slot of both schedules, and the tokens
+    it is expected to use, before it is sent. Every response replaces the
+    reserved budgets with the remaining quota GA4 reported, so all
+    processes pace against the same budgets. Quotas a process finds
+    exhausted are parked for all of them until they reset.
+    """
+
+    def __init__(self, coordination_dir, property_id, project_id, pacing_threshold):
+        # The OAuth client identifies the project without writing it to disk
+        self.paths = {"project": os.path.join(coordination_dir, f"project_{get_project_key(project_id)}.json"),
+                      "property": os.path.join(coordination_dir, f"property_{property_id}.json")}
+        self.pacing_threshold = pacing_threshold
+
+    @classmethod
+    def from_config(cls, config, pacing_threshold):
+        """Returns a coordinator when `quota_coordination_dir` is configured, None otherwise."""
+        if not config.get("quota_coordination_dir"):
+            return None
+        os.makedirs(config["quota_coordination_dir"], exist_ok=True)
+        return cls(config["quota_coordination_dir"],
+                   config["property_id"],
+                   config["oauth_client_id"],
+                   pacing_threshold)
+
+    @contextmanager
+    def locked_state(self, scope):
+        """Yields the state of scope, writing it back once the block exits."""
+        with open(self.paths[scope], "a+", encoding="utf-8") as state_file:
+            fcntl.flock(state_file, fcntl.LOCK_EX)
+            try:
+                state_file.seek(0)
+                content = state_file.read()
+                try:
+                    state = json.loads(content) if content else {}
+                except json.JSONDecodeError:
+                    LOGGER.warning("Resetting unreadable quota coordination state %s", self.paths[scope])
+                    state = {}
+                state.setdefault("budgets", {})
+                state.setdefault("parked_until", {})
+                yield state
+                state_file.seek(0)
+                state_file.truncate()
+                json.dump(state, state_file)
+                state_file.flush()
+            finally:
+                fcntl.flock(state_file, fcntl.LOCK_UN)
+
+    def reserve(self, now):
+        """
+        Takes the next request slot of the project and property schedules
+        and returns the time at which the request may be sent. Raises
+        DailyQuotaExhausted, reserving nothing, when either scope ran out
+        of daily quota.
+        """
+        # Both states stay locked until both are reserved. The project is
+        # always locked first, so processes can't deadlock.
+        with self.locked_state("project") as project_state, self.locked_state("property") as property_state:
+            states = (project_state, property_state)
+            for state in states:
+                daily_reset_time = state.get("daily_reset_time")
+                if daily_reset_time and now < daily_reset_time:
+                    raise DailyQuotaExhausted(daily_reset_time)
+            return max(self.reserve_slot(state, now) for state in states)
+
+    def reserve_slot(self, state, now):
+        """Takes the next request slot of a scope state and returns its time."""
+        state["parked_until"] = {quota_name: reset_time
+                                 for quota_name, reset_time in state["parked_until"].items()
+                                 if reset_time > now}
+        request_time = max([now, state.get("next_request_time", 0)] + list(state["parked_until"].values()))
+        tokens_per_request = state.get("tokens_per_request")
+        state["next_request_time"] = request_time + get_request_interval(
+            state["budgets"], tokens_per_request, self.pacing_threshold, now)
+        for quota_name in TOKEN_QUOTAS:
+            budget = state["budgets"].get(quota_name)
+            if budget and tokens_per_request:
+                budget["remaining"] = max(0, budget["remaining"] - tokens_per_request)
+        return request_time
+
+    def release(self, property_quotas):
+        """Records the remaining quota GA4 reported for a finished request."""
+        now = time.time()
+        for scope in ("project", "property"):
+            with self.locked_state(scope) as state:
+                for property_quota in property_quotas:
+                    for quota_name in type(property_quota).meta.fields:
+                        if quota_name == "concurrent_requests" or quota_name not in property_quota:
+                            continue
+                        if get_scope(quota_name) == scope:
+                            update_budget(state["budgets"], quota_name, getattr(property_quota, quota_name), now)
+                    state["tokens_per_request"] = update_tokens_per_request(state.get("tokens_per_request"),
+                                                                            property_quota)
+
+    def exhaust(self, quota_name, reset_time):
+        """Parks quota_name for every process until reset_time."""
+        with self.locked_state(get_scope(quota_name)) as state:
+            if quota_name in DAILY_QUOTAS:
+                state["daily_reset_time"] = reset_time
+            else:
+                state["parked_until"][quota_name] = max(reset_time, state["parked_until"].get(quota_name, 0))
@@ -1,4 +1,5 @@
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 import json
 import re
@@ -6,6 +7,11 @@ import os
 import singer
 from singer import Catalog, CatalogEntry, Schema, metadata
 from singer.catalog import write_catalog
+from tap_ga4.cache import hash_fields
+from tap_ga4.compatibility import GroupCompatibilitySolver, get_incompatible_fields
+from tap_ga4.filters import (FILTER_METADATA_KEYS, REPORT_FILTERS,
+                             get_report_filter_field_names,
+                             validate_report_filters)
 from tap_ga4.reports import PREMADE_REPORTS
 
 LOGGER = singer.get_logger()
@@ -171,6 +177,9 @@ def generate_catalog(reports, dimensions, metrics, invalid_metrics, field_exclus
                                             metadata=metadata.to_list(mdata)))
     for report in reports:
         schema, mdata = generate_schema_and_metadata(dimensions, metrics, invalid_metrics, field_exclusions, report)
+        for key in REPORT_FILTERS:
+            if report.get(key) is not None:
+                mdata = metadata.write(mdata, (), FILTER_METADATA_KEYS[key], report[key])
         catalog_entries.append(CatalogEntry(schema=Schema.from_dict(schema),
                                             key_properties=["_sdc_record_hash"],
                                             stream=report["name"],
@@ -180,38 +189,143 @@ def generate_catalog(reports, dimensions, metrics, invalid_metrics, field_exclus
     return Catalog(catalog_entries)
 
 
-def get_field_exclusions(client, property_id, dimensions, metrics):
+def validate_filter_compatibility(report, field_exclusions, field_names=()):
+    """
+    Raises ValueError when a field the filters of a report use can't be
+    combined with another filter field or one of field_names, which GA4
+    would reject at the first RunReport. field_exclusions and field_names
+    use the snake_case names of the catalog.
+    """
+    filter_field_names = [to_snake_case(field_name) for field_name in get_report_filter_field_names(report)]
+    requested_field_names = set(filter_field_names).union(field_names)
+    for field_name in filter_field_names:
+        incompatible_fields = sorted(requested_field_names.intersection(field_exclusions.get(field_name, [])))
+        if incompatible_fields:
+            raise ValueError(f"The filters of report {report['name']} use {field_name}, which is "
+                             f"incompatible with {', '.join(incompatible_fields)}")
+
+
+def reconcile_cached_exclusions(cached_exclusions, checked_exclusions):
+    """
+    Compatibility is symmetric, so a cached field is incompatible with a
+    newly checked field exactly when the checked field lists it. Checked
+    fields that list a cached field are added to its exclusions, which
+    predate them, and checked fields that no longer list it, e.g. after
+    GA4 changed them, are removed.
+    """
+    for api_name, exclusions in cached_exclusions.items():
+        for checked_api_name, incompatible_fields in checked_exclusions.items():
+            if api_name in incompatible_fields and checked_api_name not in exclusions:
+                exclusions.append(checked_api_name)
+            elif api_name not in incompatible_fields and checked_api_name in exclusions:
+                exclusions.remove(checked_api_name)
+
+
+def check_compatibilities(client, property_id, dimensions, metrics, max_workers=1):
+    """
+    Runs a CheckCompatibility request for every dimension and metric with
+    up to max_workers requests in flight. Every request retries on its own
+    through the client's backoff, and the results are returned keyed by
+    api_name in the order of dimensions and metrics.
+    """
+    checks = [(dimension, client.check_dimension_compatibility) for dimension in dimensions]
+    checks.extend((metric, client.check_metric_compatibility) for metric in metrics)
+    if not checks:
+        return {}
+
+    max_workers = min(max_workers, len(checks))
+    LOGGER.info("Checking compatibility of %s dimensions and %s metrics with %s workers",
+                len(dimensions),
+                len(metrics),
+                max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(check_compatibility, property_id, field)
+                   for field, check_compatibility in checks]
+        try:
+            return {field.api_name: get_incompatible_fields(future.result())
+                    for (field, _), future in zip(checks, futures)}
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def get_field_exclusions(client, property_id, dimensions, metrics, compatibility_cache=None, max_workers=1,
+                         group_size=1):
+    """
+    Returns the incompatible fields of every dimension and metric, keyed by
+    snake_case name. Fields missing from field_exclusions.json are checked
+    with the API, unless compatibility_cache has a valid entry for them.
+    With a group_size above 1, they are checked in groups through a
+    GroupCompatibilitySolver.
+    """
     field_exclusions = defaultdict(list)
     field_exclusions_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "field_exclusions.json")
     with open(field_exclusions_path, "r", encoding="utf-8") as infile:
         field_exclusions.update(json.load(infile))
 
-    LOGGER.info("Discovering dimension field exclusions")
-    for dimension in dimensions:
-        if dimension.api_name in field_exclusions:
-            continue
-        res = client.check_dimension_compatibility(property_id, dimension)
-        for field in res.dimension_compatibilities:
-            field_exclusions[dimension.api_name].append(
-                field.dimension_metadata.api_name)
-        for field in res.metric_compatibilities:
-            field_exclusions[dimension.api_name].append(
-                field.metric_metadata.api_name)
-
-    LOGGER.info("Discovering metric field exclusions")
-    for metric in metrics:
-        if metric.api_name in field_exclusions:
-            continue
-        res = client.check_metric_compatibility(property_id, metric)
-        for field in res.dimension_compatibilities:
-            field_exclusions[metric.api_name].append(field.dimension_metadata.api_name)
-        for field in res.metric_compatibilities:
-            field_exclusions[metric.api_name].append(field.metric_metadata.api_name)
+    cached_exclusions = {}
+    for field in dimensions + metrics:
+        if field.api_name not in field_exclusions and compatibility_cache is not None:
+            exclusions = compatibility_cache.get(field)
+            if exclusions is not None:
+                cached_exclusions[field.api_name] = exclusions
+
+    LOGGER.info("Discovering dimension and metric field exclusions")
+    unchecked_dimensions = [dimension for dimension in dimensions
+                            if dimension.api_name not in field_exclusions
+                            and dimension.api_name not in cached_exclusions]
+    unchecked_metrics = [metric for metric in metrics
+                         if metric.api_name not in field_exclusions
+                         and metric.api_name not in cached_exclusions]
+    if group_size > 1:
+        # Fields listed by the groups are mostly ones whose exclusions are
+        # already known, which the solver then doesn't check again
+        known_exclusions = {field.api_name: field_exclusions.get(field.api_name, cached_exclusions.get(field.api_name))
+                            for field in dimensions + metrics
+                            if field.api_name in field_exclusions or field.api_name in cached_exclusions}
+        solver = GroupCompatibilitySolver(client, property_id, group_size, known_exclusions)
+        checked_exclusions = solver.solve(unchecked_dimensions, unchecked_metrics)
+    else:
+        checked_exclusions = check_compatibilities(client,
+                                                   property_id,
+                                                   unchecked_dimensions,
+                                                   unchecked_metrics,
+                                                   max_workers)
+
+    for field in dimensions + metrics:
+        if field.api_name in checked_exclusions:
+            field_exclusions[field.api_name] = checked_exclusions[field.api_name]
+        elif field.api_name in cached_exclusions:
+            field_exclusions[field.api_name] = cached_exclusions[field.api_name]
+
+    if compatibility_cache is not None:
+        LOGGER.info("Reused %s cached and checked %s field compatibilities",
+                    len(cached_exclusions), len(checked_exclusions))
+        update_compatibility_cache(compatibility_cache, dimensions + metrics, cached_exclusions, checked_exclusions)
 
     field_exclusions = {to_snake_case(key):[to_snake_case(v) for v in value] for (key,value) in field_exclusions.items()}
     return field_exclusions
 
 
+def update_compatibility_cache(compatibility_cache, fields, cached_exclusions, checked_exclusions):
+    """
+    Saves the newly checked fields. When the property metadata changed since
+    the cache was written, the cached exclusions are reconciled with the
+    fields checked again, see reconcile_cached_exclusions.
+    """
+    metadata_hash = hash_fields(fields)
+    if compatibility_cache.metadata_hash not in (None, metadata_hash):
+        LOGGER.info("Property metadata changed since the field compatibility cache was written")
+        reconcile_cached_exclusions(cached_exclusions, checked_exclusions)
+    for field in fields:
+        if field.api_name in checked_exclusions:
+            compatibility_cache.put(field, checked_exclusions[field.api_name])
+        elif field.api_name in cached_exclusions:
+            compatibility_cache.update(field, cached_exclusions[field.api_name])
+    compatibility_cache.save(metadata_hash, {field.api_name for field in fields})
+
+
 # We've observed failures in metric compatiblity requests
 # where the api_name contains non-alphanumeric, non-ascii characters.
 # see: https://support.google.com/analytics/thread/176551995/conversion-event-api-calls-should-use-event-id-not-name-sessionconversionrate-conversion-event-name
@@ -223,8 +337,27 @@ def is_valid_alphanumeric_name(name):
     return re.match(r"^[a-zA-Z0-9\[\]_:]+$", name)
 
 
-def get_dimensions_and_metrics(client, property_id):
+def get_metadata(client, property_id, metadata_cache=None):
+    """Returns the property metadata, from metadata_cache when it is fresh."""
+    response = metadata_cache.get() if metadata_cache else None
+    if response is not None:
+        LOGGER.info("Using cached metadata of property %s", property_id)
+        return response
     response = client.get_dimensions_and_metrics(property_id)
+    if metadata_cache is not None:
+        metadata_cache.put(response)
+    return response
+
+
+def get_api_names(response):
+    """Returns the api_names of every dimension and metric in a Metadata response."""
+    api_names = {dimension.api_name for dimension in response.dimensions}
+    api_names.update(metric.api_name for metric in response.metrics)
+    return api_names
+
+
+def get_dimensions_and_metrics(client, property_id, metadata_cache=None):
+    response = get_metadata(client, property_id, metadata_cache)
     dimensions = [dimension for dimension in response.dimensions
                   if dimension.category not in INCOMPATIBLE_CATEGORIES]
     metrics = [metric for metric in response.metrics
@@ -236,8 +369,23 @@ def get_dimensions_and_metrics(client, property_id):
     return dimensions, metrics, invalid_metrics
 
 
-def discover(client, reports, property_id):
-    dimensions, metrics, invalid_metrics = get_dimensions_and_metrics(client, property_id)
-    field_exclusions = get_field_exclusions(client, property_id, dimensions, metrics)
+def discover(client, reports, property_id, compatibility_cache=None, metadata_cache=None):
+    dimensions, metrics, invalid_metrics = get_dimensions_and_metrics(client, property_id, metadata_cache)
+    # Fail before the compatibility checks rather than at the first sync
+    for report in reports:
+        validate_report_filters(report,
+                                [dimension.api_name for dimension in dimensions],
+                                [metric.api_name for metric in metrics + invalid_metrics])
+    field_exclusions = get_field_exclusions(client,
+                                            property_id,
+                                            dimensions,
+                                            metrics,
+                                            compatibility_cache,
+                                            client.compatibility_concurrency,
+                                            client.compatibility_group_size)
+    # The fields a filter uses are requested together, whichever fields
+    # end up selected
+    for report in reports:
+        validate_filter_compatibility(report, field_exclusions)
     catalog = generate_catalog(reports, dimensions, metrics, invalid_metrics, field_exclusions)
     write_catalog(catalog)
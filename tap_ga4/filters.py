@@ -0,0 +1,92 @@
+import json
+from google.analytics.data_v1beta.types import FilterExpression
+from google.protobuf.json_format import ParseError
+
+# report_definitions keys of the filters GA4 applies before returning rows,
+# and the kind of field each one may reference
+REPORT_FILTERS = {"dimension_filter": "dimension",
+                  "metric_filter": "metric"}
+# Stream metadata keys discovery saves the filters of a report under
+FILTER_METADATA_KEYS = {"dimension_filter": "tap-ga4.dimension-filter",
+                        "metric_filter": "tap-ga4.metric-filter"}
+
+
+def compile_filter_expression(expression):
+    """
+    Returns the FilterExpression for a filter written in the JSON form of
+    the GA4 Data API, as a dict or a JSON string. Raises ValueError when
+    it isn't a valid FilterExpression.
+    """
+    if isinstance(expression, str):
+        payload = expression
+    else:
+        payload = json.dumps(expression)
+    try:
+        filter_expression = FilterExpression.from_json(payload)
+    except (ParseError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid filter expression {payload}: {e}") from e
+    for expr in iter_expressions(filter_expression):
+        kind = FilterExpression.pb(expr).WhichOneof("expr")
+        if kind is None:
+            raise ValueError(f"Invalid filter expression {payload}: every expression needs one of "
+                             "and_group, or_group, not_expression or filter")
+        if kind == "filter" and not expr.filter.field_name:
+            raise ValueError(f"Invalid filter expression {payload}: every filter needs a field_name")
+    return filter_expression
+
+
+def iter_expressions(filter_expression):
+    """Yields filter_expression and every expression nested in it."""
+    yield filter_expression
+    kind = FilterExpression.pb(filter_expression).WhichOneof("expr")
+    if kind == "and_group":
+        for expr in filter_expression.and_group.expressions:
+            yield from iter_expressions(expr)
+    elif kind == "or_group":
+        for expr in filter_expression.or_group.expressions:
+            yield from iter_expressions(expr)
+    elif kind == "not_expression":
+        yield from iter_expressions(filter_expression.not_expression)
+
+
+def get_filter_field_names(filter_expression):
+    """Returns the api_names of the fields filter_expression filters on."""
+    return [expr.filter.field_name for expr in iter_expressions(filter_expression)
+            if FilterExpression.pb(expr).WhichOneof("expr") == "filter"]
+
+
+def get_report_filter_field_names(report):
+    """
+    Returns the api_names of the fields the filters of a report use, as
+    JSON from a report definition or as compiled FilterExpressions.
+    """
+    field_names = []
+    for key in REPORT_FILTERS:
+        expression = report.get(key)
+        if expression is None:
+            continue
+        if not isinstance(expression, FilterExpression):
+            expression = compile_filter_expression(expression)
+        field_names.extend(get_filter_field_names(expression))
+    return field_names
+
+
+def validate_report_filters(report, dimension_names, metric_names):
+    """
+    Checks that the filters of a report definition compile, and that a
+    dimension_filter only uses dimensions of the property and a
+    metric_filter only metrics. Raises ValueError otherwise.
+    """
+    field_names = {"dimension": set(dimension_names), "metric": set(metric_names)}
+    for key, kind in REPORT_FILTERS.items():
+        if report.get(key) is None:
+            continue
+        try:
+            filter_expression = compile_filter_expression(report[key])
+        except ValueError as e:
+            raise ValueError(f"Report {report['name']} has an invalid {key}: {e}") from e
+        unknown_fields = [field_name for field_name in get_filter_field_names(filter_expression)
+                          if field_name not in field_names[kind]]
+        if unknown_fields:
+            raise ValueError(f"The {key} of report {report['name']} uses fields that are not "
+                             f"{kind}s of the property: {', '.join(unknown_fields)}")
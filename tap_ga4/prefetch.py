@@ -0,0 +1,89 @@
+import threading
+from collections import deque
+import singer
+
+LOGGER = singer.get_logger()
+
+
+class Prefetcher:  # pylint: disable=too-many-instance-attributes
+    """
+    Drains an iterator on a background thread so the next items are
+    fetched while the current one is being processed.
+
+    At most `depth` items are buffered ahead of the consumer, and the
+    buffer stops growing once the items in it add up to `max_bytes` as
+    measured by `sizeof`. A single item larger than `max_bytes` is still
+    let through when the buffer is empty so the sync can make progress.
+
+    Exceptions raised by the iterator are re-raised in the consumer.
+    """
+
+    def __init__(self, iterable, depth, max_bytes=None, sizeof=None):
+        self.iterable = iterable
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda item: 0)
+        self.buffer = deque()
+        self.buffered_bytes = 0
+        self.peak_buffered_bytes = 0
+        self.done = False
+        self.error = None
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._produce, name="ga4-prefetch", daemon=True)
+
+    def _has_room(self, size):
+        if not self.buffer:
+            return True
+        if len(self.buffer) >= self.depth:
+            return False
+        return self.max_bytes is None or self.buffered_bytes + size <= self.max_bytes
+
+    def _produce(self):
+        try:
+            for item in self.iterable:
+                size = self.sizeof(item)
+                with self.condition:
+                    while not (self.stopped or self._has_room(size)):
+                        self.condition.wait()
+                    if self.stopped:
+                        return
+                    self.buffer.append((item, size))
+                    self.buffered_bytes += size
+                    self.peak_buffered_bytes = max(self.peak_buffered_bytes, self.buffered_bytes)
+                    self.condition.notify_all()
+        except Exception as ex:
+            with self.condition:
+                self.error = ex
+        finally:
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    def __iter__(self):
+        self.thread.start()
+        try:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.buffer or self.done)
+                    if self.buffer:
+                        item, size = self.buffer.popleft()
+                        self.buffered_bytes -= size
+                        self.condition.notify_all()
+                    elif self.error is not None:
+                        raise self.error
+                    else:
+                        break
+                yield item
+        finally:
+            with self.condition:
+                self.stopped = True
+                self.condition.notify_all()
+            LOGGER.debug("Prefetch buffer peaked at %s bytes", self.peak_buffered_bytes)
+
+
+def prefetch(iterable, depth, max_bytes=None, sizeof=None):
+    """Wraps iterable in a Prefetcher, or returns it unchanged if depth is 0."""
+    if depth < 1:
+        return iterable
+    return Prefetcher(iterable, depth, max_bytes, sizeof)
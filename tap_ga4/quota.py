@@ -0,0 +1,263 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import singer
+
+LOGGER = singer.get_logger()
+
+# Daily GA4 quotas reset at midnight Pacific time
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+DAILY_QUOTAS = ("tokens_per_day",)
+TOKEN_QUOTAS = ("tokens_per_hour", "tokens_per_project_per_hour", "tokens_per_day")
+
+
+def get_reset_time(quota_name, now):
+    """Epoch timestamp at which quota_name is next replenished after `now`."""
+    current_time = datetime.fromtimestamp(now, tz=timezone.utc)
+    if quota_name in DAILY_QUOTAS:
+        local_time = current_time.astimezone(QUOTA_TIMEZONE)
+        next_reset = (local_time + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        next_reset = (current_time + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+    return next_reset.timestamp()
+
+
+class DailyQuotaExhausted(Exception):
+    """Raised once the daily token quota of the property is used up."""
+
+    def __init__(self, reset_time):
+        self.reset_time = reset_time
+        reset = datetime.fromtimestamp(reset_time, tz=timezone.utc).isoformat()
+        super().__init__(f"Exhausted the GA4 daily token quota of the property until {reset}")
+
+
+def classify_quota_error(ex):
+    """Returns the name of the PropertyQuota budget a ResourceExhausted error ran out of."""
+    message = str(ex).lower()
+    if "concurrent" in message:
+        return "concurrent_requests"
+    if "server error" in message:
+        return "server_errors_per_project_per_hour"
+    if "thresholded" in message:
+        return "potentially_thresholded_requests_per_hour"
+    if "per day" in message or "daily" in message:
+        return "tokens_per_day"
+    if "project" in message:
+        return "tokens_per_project_per_hour"
+    return "tokens_per_hour"
+
+
+def get_property_quotas(response):
+    """Returns the PropertyQuota messages of a RunReport or BatchRunReports response."""
+    if response is None:
+        return []
+    if hasattr(response, "reports"):
+        return [report.property_quota for report in response.reports if "property_quota" in report]
+    if hasattr(response, "property_quota") and "property_quota" in response:
+        return [response.property_quota]
+    return []
+
+
+def update_budget(budgets, quota_name, status, now):
+    """
+    Records the remaining quota a response reported in budgets, a dict of
+    quota name -> {"remaining", "capacity", "resets_at"}.
+    """
+    budget = budgets.get(quota_name)
+    resets_at = get_reset_time(quota_name, now)
+    if budget is None or budget["resets_at"] != resets_at:
+        budget = {"capacity": 0, "resets_at": resets_at}
+        budgets[quota_name] = budget
+    budget["remaining"] = status.remaining
+    budget["capacity"] = max(budget["capacity"], status.remaining + status.consumed)
+
+
+def update_tokens_per_request(tokens_per_request, property_quota, weight=0.2):
+    """Moves the tokens per request average towards what property_quota consumed."""
+    tokens = property_quota.tokens_per_hour.consumed if "tokens_per_hour" in property_quota else 0
+    if not tokens:
+        return tokens_per_request
+    if tokens_per_request is None:
+        return tokens
+    return tokens_per_request + weight * (tokens - tokens_per_request)
+
+
+def get_request_interval(budgets, tokens_per_request, pacing_threshold, now):
+    """
+    Seconds to leave between requests so that no budget below
+    pacing_threshold of its size runs out before its reset.
+    """
+    interval = 0
+    for quota_name, budget in budgets.items():
+        if now >= budget["resets_at"] or budget["remaining"] > budget["capacity"] * pacing_threshold:
+            continue
+        if quota_name in TOKEN_QUOTAS:
+            requests_left = budget["remaining"] / (tokens_per_request or 1)
+        else:
+            # Assume every request could use one of the remaining errors
+            # or thresholded requests
+            requests_left = budget["remaining"]
+        interval = max(interval, (budget["resets_at"] - now) / max(1, requests_left))
+    return interval
+
+
+class QuotaGovernor:  # pylint: disable=too-many-instance-attributes
+    """
+    Paces GA4 requests from the property_quota returned with every report,
+    so that budgets run out at their reset rather than in a
+    ResourceExhausted error.
+
+    While every budget is above pacing_threshold of its size, requests go
+    out unchanged. Below it, requests are spaced so the remaining tokens,
+    at the observed tokens per request, last until the budget resets. The
+    concurrent_requests budget caps the number of requests in flight.
+    acquire() and release() wrap every request, from any thread.
+
+    When a request still runs out of quota, exhaust() parks every later
+    request until that quota resets, calling heartbeat regularly while
+    they wait, or raises DailyQuotaExhausted if the daily quota ran out.
+
+    With a QuotaCoordinator, budgets, pacing and parked quotas are also
+    shared with the other tap-ga4 processes on the host.
+    """
+
+    DEFAULT_PACING_THRESHOLD = 0.2
+    # Seconds between heartbeat calls while requests are parked
+    HEARTBEAT_INTERVAL = 60
+
+    def __init__(self, pacing_threshold=DEFAULT_PACING_THRESHOLD, coordinator=None):
+        self.pacing_threshold = pacing_threshold
+        self.coordinator = coordinator
+        self.condition = threading.Condition()
+        # quota name -> {"remaining", "capacity", "resets_at"}
+        self.budgets = {}
+        self.tokens_per_request = None
+        self.in_flight = 0
+        self.concurrency_limit = None
+        self.next_request_time = 0
+        # quota name -> time at which parked requests may resume
+        self.parked_until = {}
+        self.daily_reset_time = None
+        # Called while requests are parked, e.g. to keep emitting STATE
+        self.heartbeat = None
+
+
+    def get_request_interval(self, now):
+        return get_request_interval(self.budgets, self.tokens_per_request, self.pacing_threshold, now)
+
+
+    def get_reset_time(self, quota_name, now):
+        budget = self.budgets.get(quota_name)
+        if budget and budget["resets_at"] > now:
+            return budget["resets_at"]
+        return get_reset_time(quota_name, now)
+
+
+    def exhaust(self, quota_name):
+        """Parks requests until quota_name resets after a ResourceExhausted error."""
+        with self.condition:
+            now = time.time()
+            reset_time = self.get_reset_time(quota_name, now)
+            if quota_name == "concurrent_requests":
+                # Frees up as soon as other requests finish, so the regular
+                # backoff retries are enough
+                return
+            if self.coordinator:
+                self.coordinator.exhaust(quota_name, reset_time)
+            if quota_name in DAILY_QUOTAS:
+                self.daily_reset_time = reset_time
+                raise DailyQuotaExhausted(reset_time)
+            self.parked_until[quota_name] = reset_time
+        LOGGER.info("Exhausted GA4 quota %s. Parking requests for %s seconds until it resets.",
+                    quota_name,
+                    round(reset_time - now))
+
+
+    def wait_for_parked_quotas(self):
+        while True:
+            with self.condition:
+                now = time.time()
+                if self.daily_reset_time and now < self.daily_reset_time:
+                    raise DailyQuotaExhausted(self.daily_reset_time)
+                self.parked_until = {quota_name: reset_time for quota_name, reset_time in self.parked_until.items()
+                                     if reset_time > now}
+                if not self.parked_until:
+                    return
+                resume_time = max(self.parked_until.values())
+            time.sleep(min(resume_time - now, self.HEARTBEAT_INTERVAL))
+            if self.heartbeat:
+                self.heartbeat()
+
+
+    def sleep_until(self, resume_time, now):
+        """Sleeps until resume_time, calling heartbeat every HEARTBEAT_INTERVAL."""
+        while now < resume_time:
+            seconds = min(resume_time - now, self.HEARTBEAT_INTERVAL)
+            time.sleep(seconds)
+            now += seconds
+            if now >= resume_time:
+                break
+            if self.heartbeat:
+                self.heartbeat()
+
+
+    def acquire(self):
+        """Waits until a request may be sent under the current budgets."""
+        self.wait_for_parked_quotas()
+        shared_request_time = self.coordinator.reserve(time.time()) if self.coordinator else 0
+        with self.condition:
+            while self.concurrency_limit is not None and self.in_flight >= self.concurrency_limit:
+                self.condition.wait()
+            now = time.time()
+            local_request_time = max(now, self.next_request_time)
+            self.next_request_time = local_request_time + self.get_request_interval(now)
+            self.in_flight += 1
+        request_time = max(local_request_time, shared_request_time)
+        if request_time > now:
+            LOGGER.info("Pacing GA4 requests to stay within quota. Sleeping %s seconds.",
+                        round(request_time - now, 1))
+            self.sleep_until(request_time, now)
+
+
+    def release(self, property_quotas=()):
+        """Records the quota a finished request reported and frees its slot."""
+        with self.condition:
+            now = time.time()
+            for property_quota in property_quotas:
+                self.update(property_quota, now)
+            self.in_flight -= 1
+            self.condition.notify_all()
+        if self.coordinator and property_quotas:
+            self.coordinator.release(property_quotas)
+
+
+    def update(self, property_quota, now):
+        for quota_name in type(property_quota).meta.fields:
+            if quota_name not in property_quota:
+                continue
+            status = getattr(property_quota, quota_name)
+            if quota_name == "concurrent_requests":
+                # Requests still in flight here, this one included, plus
+                # the ones GA4 says are left
+                self.concurrency_limit = max(1, self.in_flight + status.remaining)
+            else:
+                update_budget(self.budgets, quota_name, status, now)
+        self.tokens_per_request = update_tokens_per_request(self.tokens_per_request, property_quota)
+
+
+    def get_state(self):
+        """Returns a snapshot of the budgets and pacing for schedulers and logs."""
+        with self.condition:
+            now = time.time()
+            return {"budgets": {quota_name: {"remaining": budget["remaining"],
+                                             "capacity": budget["capacity"],
+                                             "resets_in": max(0, round(budget["resets_at"] - now))}
+                                for quota_name, budget in self.budgets.items()
+                                if now < budget["resets_at"]},
+                    "tokens_per_request": self.tokens_per_request,
+                    "in_flight": self.in_flight,
+                    "concurrency_limit": self.concurrency_limit,
+                    "parked_until": dict(self.parked_until),
+                    "request_interval": self.get_request_interval(now)}
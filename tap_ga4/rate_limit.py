@@ -0,0 +1,22 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Spaces out calls to acquire() so that at most requests_per_second
+    of them return per second, across every thread sharing the limiter.
+    """
+
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
@@ -1,38 +1,83 @@
+import functools
 import hashlib
 import json
+import threading
+from json.encoder import encode_basestring_ascii
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from itertools import chain, islice
 from datetime import datetime, timedelta
 import singer
 from singer import Transformer, get_bookmark, metadata, utils
-from google.analytics.data_v1beta.types import (Metric, Dimension)
+from google.analytics.data_v1beta.types import (Metric, Dimension, RunReportResponse)
 
-from tap_ga4.discover import to_snake_case
+from tap_ga4.cache import MetadataCache
+from tap_ga4.client import BaseClient
+from tap_ga4.discover import (get_api_names, to_snake_case,
+                              validate_filter_compatibility)
+from tap_ga4.filters import (FILTER_METADATA_KEYS, REPORT_FILTERS,
+                             compile_filter_expression)
+from tap_ga4.prefetch import prefetch
+from tap_ga4.quota import DailyQuotaExhausted
+from tap_ga4.transform import get_schema_transformer
+from tap_ga4.windows import AdaptiveWindowPlanner
+from tap_ga4.writer import Writer
 
 
 LOGGER = singer.get_logger()
 
 DEFAULT_CONVERSION_WINDOW = 90
 DEFAULT_REQUEST_WINDOW_SIZE = 7
+DEFAULT_PREFETCH_DEPTH = 0
+DEFAULT_PREFETCH_MAX_MB = 256
+DEFAULT_STREAM_CONCURRENCY = 1
+DEFAULT_REPORT_BATCH_SIZE = 1
+DEFAULT_DATE_RANGES_PER_REQUEST = 1
+DEFAULT_MAX_REQUEST_WINDOW_SIZE = 30
+
+# Dimension GA4 adds to every row of a response with multiple date ranges
+DATE_RANGE_DIMENSION = "dateRange"
+
+
+class SyncStopped(Exception):
+    """Raised by a stream worker that stopped because another stream failed."""
+
+
+def check_stop(stop):
+    """Raises SyncStopped once stop, a threading.Event shared by the stream workers, is set."""
+    if stop is not None and stop.is_set():
+        raise SyncStopped()
 
 
 def sort_and_shuffle_streams(currently_syncing, selected_streams):
     """
     Order selected streams and shuffle if currently_syncing is set.
+
+    currently_syncing is either a single tap_stream_id, or the list of
+    tap_stream_ids that were in flight when a concurrent sync was
+    interrupted. Interrupted streams are resumed first, followed by the
+    remaining streams in order starting from the oldest interrupted one.
     """
     stream_list = list(selected_streams)
     sorted_selected_streams = sorted(stream_list, key=lambda x: x.tap_stream_id)
 
     if not currently_syncing:
         return sorted_selected_streams
+    if isinstance(currently_syncing, str):
+        currently_syncing = [currently_syncing]
 
-    currently_syncing_idx = None
-    for i, stream in enumerate(sorted_selected_streams):
-        if currently_syncing == stream.tap_stream_id:
-            currently_syncing_idx = i
-            break
+    interrupted_streams = []
+    for tap_stream_id in currently_syncing:
+        for stream in sorted_selected_streams:
+            if tap_stream_id == stream.tap_stream_id:
+                interrupted_streams.append(stream)
+                break
 
-    if currently_syncing_idx:
-        return sorted_selected_streams[currently_syncing_idx:] + sorted_selected_streams[:currently_syncing_idx]
-    return sorted_selected_streams
+    if not interrupted_streams:
+        return sorted_selected_streams
+
+    currently_syncing_idx = sorted_selected_streams.index(interrupted_streams[0])
+    shuffled_streams = sorted_selected_streams[currently_syncing_idx:] + sorted_selected_streams[:currently_syncing_idx]
+    return interrupted_streams + [stream for stream in shuffled_streams if stream not in interrupted_streams]
 
 
 def generate_sdc_record_hash(record, dimension_pairs):
@@ -58,6 +103,75 @@ def generate_sdc_record_hash(record, dimension_pairs):
     return hashlib.sha256(hash_source_bytes).hexdigest()
 
 
+class RecordHasher:
+    """
+    Computes generate_sdc_record_hash for the records of a stream, from
+    the same bytes, without sorting and JSON encoding every row.
+
+    The dimension keys of a stream are fixed, so the sorted order of the
+    (key, value) pairs and all of the JSON around the dimension values,
+    property_id and account_id included, are worked out once. Each row
+    only escapes its values with the encoder json.dumps uses.
+
+    Dimension values repeat a lot, so the hasher also keeps a dictionary
+    of the values it has seen. lookup() returns one shared string per
+    value and its escaped fragment. The dictionary keeps
+    VALUE_CACHE_SIZE entries and evicts the least recently used.
+
+    When two keys are equal the sort order depends on the values, so
+    hash_entries falls back to generate_sdc_record_hash.
+
+    WARNING: This must hash exactly the bytes generate_sdc_record_hash
+    does, see its docstring.
+    """
+
+    # Dimension values kept per stream in the value dictionary
+    VALUE_CACHE_SIZE = 65536
+
+    def __init__(self, property_id, account_id, dimension_keys):
+        self.ids = {"property_id": property_id, "account_id": account_id}
+        self.dimension_keys = list(dimension_keys)
+        # value -> (the first string seen equal to value, its JSON fragment)
+        self.lookup = functools.lru_cache(maxsize=self.VALUE_CACHE_SIZE)(
+            lambda value: (value, encode_basestring_ascii(value)))
+        keys = ["property_id", "account_id", *self.dimension_keys]
+        self.is_compiled = len(set(keys)) == len(keys)
+        if not self.is_compiled:
+            return
+        constants = {"property_id": json.dumps(property_id), "account_id": json.dumps(account_id)}
+        positions = {key: position for position, key in enumerate(self.dimension_keys)}
+        # Text before each dimension value, with the constant pairs folded in
+        self.fragments = []
+        self.value_positions = []
+        fragment = "["
+        for index, key in enumerate(sorted(keys)):
+            fragment += ("" if index == 0 else ", ") + "[" + json.dumps(key) + ", "
+            if key in constants:
+                fragment += constants[key] + "]"
+            else:
+                self.fragments.append(fragment)
+                self.value_positions.append(positions[key])
+                fragment = "]"
+        self.tail = fragment + "]"
+
+
+    def hash_entries(self, entries):
+        """
+        Returns the _sdc_record_hash of a record from the (value, fragment)
+        entries lookup() returned for its dimension values, in
+        dimension_keys order.
+        """
+        if not self.is_compiled:
+            return generate_sdc_record_hash(self.ids,
+                                            [(key, value) for key, (value, _) in zip(self.dimension_keys, entries)])
+        parts = []
+        for fragment, position in zip(self.fragments, self.value_positions):
+            parts.append(fragment)
+            parts.append(entries[position][1])
+        parts.append(self.tail)
+        return hashlib.sha256("".join(parts).encode("utf-8")).hexdigest()
+
+
 def generate_report_dates(start_date, end_date, request_window_size):
     """
     Splits date range from start_date to end_date into chunks of request_window_size
@@ -71,26 +185,74 @@ def generate_report_dates(start_date, end_date, request_window_size):
         range_start = range_end + timedelta(days=1)
 
 
-def transform_headers(dimension_headers, metric_headers):
-    dim_headers = [to_snake_case(dimension) for dimension in dimension_headers]
-    metric_headers = [to_snake_case(metric) for metric in metric_headers]
-    return dim_headers, metric_headers
-
-
-def row_to_record(report, row, dimension_headers, metric_headers):
+class RecordBuilder:
     """
-    Parse a RunReportResponse row into a single Singer record, with added
-    runtime info and PK.
+    Turns the rows of responses with the same headers into records, with
+    the header work done once.
+
+    The snake_case keys, the positions of the values that go in a record
+    (dateRange left out) and the property and account ids are worked out
+    when the builder is made, so every row only fills one dict. The
+    record hash goes through a RecordHasher built for the same keys, whose
+    value dictionary also interns the dimension values.
+
+    build_records also converts the DATETIME_FORMATS dimensions, picked
+    out once from the headers, through a memoized parser, and warns once
+    per page when the row limit of the report was reached.
     """
-    record = {}
-    dimension_headers, metric_headers = transform_headers(dimension_headers, metric_headers)
-    dimension_pairs = list(zip(dimension_headers, [dimension.value for dimension in row.dimension_values]))
-    record.update(dimension_pairs)
-    record.update(zip(metric_headers, [metric.value for metric in row.metric_values]))
-    record["property_id"] = report["property_id"]
-    record["account_id"] = report["account_id"]
-    record["_sdc_record_hash"] = generate_sdc_record_hash(record, dimension_pairs)
-    return record
+
+    def __init__(self, report_name, property_id, account_id, dimension_headers, metric_headers):
+        self.report_name = report_name
+        self.dimension_positions = [position for position, header in enumerate(dimension_headers)
+                                    if header != DATE_RANGE_DIMENSION]
+        self.dimension_keys = [to_snake_case(dimension_headers[position]) for position in self.dimension_positions]
+        self.metric_columns = [(to_snake_case(header), position) for position, header in enumerate(metric_headers)]
+        self.datetime_keys = [key for key in self.dimension_keys if key in DATETIME_FORMATS]
+        self.ids = {"property_id": property_id, "account_id": account_id}
+        self.hasher = RecordHasher(property_id, account_id, self.dimension_keys)
+
+
+    def build_record(self, dimension_values, metric_values):
+        """Builds the record of a protobuf row from its dimension and metric values."""
+        lookup = self.hasher.lookup
+        entries = [lookup(dimension_values[position].value) for position in self.dimension_positions]
+        record = {key: value for key, (value, _) in zip(self.dimension_keys, entries)}
+        for key, position in self.metric_columns:
+            record[key] = metric_values[position].value
+        record.update(self.ids)
+        record["_sdc_record_hash"] = self.hasher.hash_entries(entries)
+        return record
+
+
+    def build_records(self, response):
+        """
+        Yields the record of every row of a RunReportResponse, with its
+        DATETIME_FORMATS dimensions parsed by parse_datetime.
+        """
+        build_record = self.build_record
+        datetime_keys = self.datetime_keys
+        row_limit_rows = 0
+        for row in RunReportResponse.pb(response).rows:
+            record = build_record(row.dimension_values, row.metric_values)
+            row_limit_reached = False
+            for key in datetime_keys:
+                value = record[key]
+                if value:
+                    record[key], is_valid_datetime = parse_datetime_cached(key, value)
+                    row_limit_reached = row_limit_reached or (not is_valid_datetime and value == "(other)")
+            row_limit_rows += row_limit_reached
+            yield record
+        if row_limit_rows:
+            LOGGER.warning("Row limit reached for report: %s, %s rows of the page are (other). "
+                           "See https://support.google.com/analytics/answer/9309767 for more info.",
+                           self.report_name,
+                           row_limit_rows)
+
+
+@functools.lru_cache(maxsize=256)
+def get_record_builder(report_name, property_id, account_id, dimension_headers, metric_headers):
+    """Returns the RecordBuilder of a stream for responses with these header tuples."""
+    return RecordBuilder(report_name, property_id, account_id, dimension_headers, metric_headers)
 
 
 DATETIME_FORMATS = {
@@ -119,16 +281,13 @@ def parse_datetime(field_name, value, fmt=singer.utils.DATETIME_FMT):
         return value, is_valid_datetime
 
 
-def transform_datetimes(report_name, rec):
-    """ Datetimes have a compressed format, so this ensures they parse correctly. """
-    row_limit_reached = False
-    for field_name, value in rec.items():
-        if value and field_name in DATETIME_FORMATS:
-            rec[field_name], is_valid_datetime = parse_datetime(field_name, value)
-            row_limit_reached = row_limit_reached or (not is_valid_datetime and value == "(other)")
-    if row_limit_reached:
-        LOGGER.warning("Row limit reached for report: %s. See https://support.google.com/analytics/answer/9309767 for more info.", report_name)
-    return rec
+@functools.lru_cache(maxsize=16384)
+def parse_datetime_cached(field_name, value):
+    """
+    parse_datetime with the default format, memoized, as a window only
+    has a few distinct dates (168 date_hour values in a week).
+    """
+    return parse_datetime(field_name, value)
 
 
 def get_report_start_date(config, property_id, state, tap_stream_id):
@@ -170,11 +329,147 @@ def get_end_date(config):
     return utils.now().replace(hour=0, minute=0, second=0, microsecond=0)
 
 
-def sync_report(client, schema, report, start_date, end_date, request_window_size, state):
+def get_date_range_indexes(response):
+    """
+    Returns the indexes of the date ranges of the first and last rows of
+    a multiple date range page, from the dateRange dimension GA4 names
+    date_range_0, date_range_1 and so on, or None for an empty page.
+    """
+    headers = [dimension.name for dimension in response.dimension_headers]
+    rows = RunReportResponse.pb(response).rows
+    if not rows or DATE_RANGE_DIMENSION not in headers:
+        return None
+    position = headers.index(DATE_RANGE_DIMENSION)
+    return tuple(int(rows[i].dimension_values[position].value.rsplit("_", 1)[1]) for i in (0, -1))
+
+
+def get_report_pages(client, report, start_date, end_date, request_window_size, date_ranges_per_request=1):
+    """
+    Yields (range_end_date, response) for every page of every date window
+    between start_date and end_date. Once all pages of a window have been
+    yielded, (range_end_date, None) is yielded to mark the window complete.
+
+    With date_ranges_per_request greater than 1, that many consecutive
+    windows are packed into each request as separate date ranges. As rows
+    are ordered by date, the rows of each window come out in window order.
+    A page is yielded under the window of its first row, and a window is
+    marked complete as soon as a page has rows of a later window, so
+    every finished window gets bookmarked even if the request is cut
+    short.
+    """
+    windows = generate_report_dates(start_date, end_date, request_window_size)
+    while date_ranges := list(islice(windows, date_ranges_per_request)):
+        if len(date_ranges) == 1:
+            for response in client.get_report(report, *date_ranges[0]):
+                yield date_ranges[0][1], response
+            yield date_ranges[0][1], None
+            continue
+
+        # Index of the first window not marked complete yet
+        current = 0
+        for response in client.get_date_ranges_report(report, date_ranges):
+            indexes = get_date_range_indexes(response)
+            if indexes is None:
+                yield date_ranges[current][1], response
+                continue
+            first, last = indexes
+            for _, range_end_date in date_ranges[current:first]:
+                yield range_end_date, None
+            current = max(current, first)
+            yield date_ranges[current][1], response
+            for _, range_end_date in date_ranges[current:last]:
+                yield range_end_date, None
+            current = max(current, last)
+        for _, range_end_date in date_ranges[current:]:
+            yield range_end_date, None
+
+
+def get_adaptive_report_pages(client, report, start_date, end_date, window_planner):
+    """
+    Same as get_report_pages, but every window is sized by window_planner.
+    A window whose first page makes the planner shrink the window size is
+    dropped and requested again in smaller windows, before any of its
+    records are written.
+    """
+    range_start = start_date
+    while range_start <= end_date:
+        range_end = min(end_date, range_start + timedelta(days=window_planner.get_window_size() - 1))
+        window_days = (range_end - range_start).days + 1
+        range_start_date = range_start.strftime("%Y-%m-%d")
+        range_end_date = range_end.strftime("%Y-%m-%d")
+
+        # get_report always yields at least the first page
+        responses = client.get_report(report, range_start_date, range_end_date)
+        first_page = next(responses, None)
+        if first_page is not None:
+            if window_planner.should_refetch(first_page, window_days):
+                responses.close()
+                continue
+            yield range_end_date, first_page
+            window_planner.observe(first_page, window_days)
+
+        for response in responses:
+            yield range_end_date, response
+        yield range_end_date, None
+        range_start = range_end + timedelta(days=1)
+
+
+def get_page_size(page):
+    """Serialized size in bytes of a (range_end_date, response) page."""
+    _, response = page
+    if response is None:
+        return 0
+    return RunReportResponse.pb(response).ByteSize()
+
+
+def get_prefetch_settings(config):
+    """Returns (depth, max_bytes) for the page prefetch stage."""
+    depth = int(config.get("prefetch_depth", DEFAULT_PREFETCH_DEPTH))
+    max_bytes = int(config.get("prefetch_max_mb", DEFAULT_PREFETCH_MAX_MB)) * 1024 * 1024
+    return depth, max_bytes
+
+
+def write_response_records(writer, schema, report, response):
+    """
+    Turns every row of a RunReportResponse into a record and writes it.
+    All records of the page share the time it was extracted, and go
+    through the SchemaTransformer of the stream schema.
+    """
+    record_builder = get_record_builder(report["name"],
+                                        report["property_id"],
+                                        report["account_id"],
+                                        tuple(dimension.name for dimension in response.dimension_headers),
+                                        tuple(metric.name for metric in response.metric_headers))
+    schema_transformer = get_schema_transformer(schema)
+    time_extracted = singer.utils.now()
+    with singer.metrics.record_counter(report['name']) as counter:
+        with Transformer() as transformer:
+            for rec in record_builder.build_records(response):
+                writer.write_record(report["name"],
+                                    schema_transformer.transform(rec, transformer),
+                                    time_extracted=time_extracted)
+                counter.increment()
+
+
+def sync_report(client, schema, report, start_date, end_date, request_window_size, writer, prefetch_depth=0, prefetch_max_bytes=None,
+                date_ranges_per_request=1, window_planner=None, stop=None):
     """
     Run a sync, beginning from either the start_date, bookmarked date, or
     (now - CONVERSION_WINDOW) requesting a report per day.
 
+    When prefetch_depth is greater than 0, up to that many pages (bounded
+    by prefetch_max_bytes) are requested ahead while the current page is
+    turned into records.
+
+    Up to date_ranges_per_request date windows are requested at once, see
+    get_report_pages. When a window_planner is given, it sizes every window
+    instead, see get_adaptive_report_pages, and its current window size is
+    saved with each bookmark for the next sync to start from.
+
+    Messages and bookmarks are written through `writer`, which owns the
+    sync state. Once `stop` is set, SyncStopped is raised before the next
+    page, leaving the window in progress unbookmarked.
+
     report = {"name": stream.tap_stream_id,
               "property_id": property_id,
               "account_id": account_id,
@@ -183,71 +478,298 @@ def sync_report(client, schema, report, start_date, end_date, request_window_siz
     """
     LOGGER.info("Syncing %s for property_id %s", report['name'], report['property_id'])
 
-    for range_start_date, range_end_date in generate_report_dates(start_date, end_date, request_window_size):
-        for response in client.get_report(report, range_start_date, range_end_date):
-            dimension_headers = [dimension.name for dimension in response.dimension_headers]
-            metric_headers = [metric.name for metric in response.metric_headers]
-            with singer.metrics.record_counter(report['name']) as counter:
-                with Transformer() as transformer:
-                    for row in response.rows:
-                        time_extracted = singer.utils.now()
-                        rec = row_to_record(report, row, dimension_headers, metric_headers)
-                        singer.write_record(report["name"],
-                                            transformer.transform(
-                                                transform_datetimes(report["name"], rec),
-                                                schema),
-                                            time_extracted=time_extracted)
-                        counter.increment()
-        singer.write_bookmark(state,
-                              report["id"],
-                              report["property_id"],
-                              {"last_report_date": range_end_date})
-        singer.write_state(state)
+    if window_planner:
+        report_pages = get_adaptive_report_pages(client, report, start_date, end_date, window_planner)
+    else:
+        report_pages = get_report_pages(client, report, start_date, end_date, request_window_size, date_ranges_per_request)
+    pages = prefetch(report_pages,
+                     prefetch_depth,
+                     prefetch_max_bytes,
+                     get_page_size)
+    for range_end_date, response in pages:
+        check_stop(stop)
+        if response is None:
+            bookmark = {"last_report_date": range_end_date}
+            if window_planner:
+                bookmark["request_window_size"] = window_planner.get_window_size()
+            writer.write_bookmark(report["id"],
+                                  report["property_id"],
+                                  bookmark)
+            continue
+
+        write_response_records(writer, schema, report, response)
     LOGGER.info("Done syncing %s for property_id %s", report["name"], report["property_id"])
 
 
-def sync(client, config, catalog, state):
+def build_report(config, stream):
+    """
+    Builds the report definition for a catalog stream from the dimensions
+    and metrics selected in its metadata, and the filters discovery saved
+    for it.
+    """
+    metrics = []
+    dimensions = []
+    mdata = metadata.to_map(stream.metadata)
+    for field_path, field_mdata in mdata.items():
+        if field_path == tuple():
+            continue
+        if field_mdata.get("inclusion") == "unsupported":
+            continue
+        if field_mdata.get("inclusion") == "automatic" or \
+           field_mdata.get("selected") or \
+           (field_mdata.get("selected-by-default") and field_mdata.get("selected") is None):
+            if field_mdata.get("behavior") == "METRIC":
+                metrics.append(Metric(name=field_mdata.get("tap-ga4.api-field-names")))
+            elif field_mdata.get("behavior") == "DIMENSION":
+                dimensions.append(Dimension(name=field_mdata.get("tap-ga4.api-field-names")))
+
+    report = {"property_id": config["property_id"],
+              "account_id": config["account_id"],
+              "name": stream.stream,
+              "id": stream.tap_stream_id,
+              "metrics": metrics,
+              "dimensions": dimensions}
+    for key in REPORT_FILTERS:
+        expression = mdata.get((), {}).get(FILTER_METADATA_KEYS[key])
+        if expression is not None:
+            report[key] = compile_filter_expression(expression)
+    return report
+
+
+def prepare_stream(config, stream, writer):
+    """
+    Marks the stream as syncing and writes its schema. Returns the report,
+    schema and date range to sync for it.
+    """
+    writer.start_stream(stream.tap_stream_id)
+
+    report = build_report(config, stream)
+    end_date = get_end_date(config)
+    schema = stream.schema.to_dict()
+    writer.write_schema(stream.stream,
+                        schema,
+                        stream.key_properties)
+
+    with writer.lock:
+        start_date = get_report_start_date(config, report["property_id"], writer.state, report["id"])
+    return report, schema, start_date, end_date
+
+
+def get_saved_window_size(writer, report):
+    """Returns the request window size saved in the stream's bookmark, if any."""
+    with writer.lock:
+        bookmark = get_bookmark(writer.state, report["id"], report["property_id"], default={})
+    return bookmark.get("request_window_size")
+
+
+def get_window_planner(client, config, report, writer):
+    """
+    Returns an AdaptiveWindowPlanner when adaptive_request_window is
+    enabled, starting from the window size saved in the stream's bookmark
+    and comparing windows against the page size the client requests.
+    """
+    if str(config.get("adaptive_request_window", False)).lower() != "true":
+        return None
+    window_size = get_saved_window_size(writer, report)
+    if window_size is None:
+        window_size = config.get("request_window_size", DEFAULT_REQUEST_WINDOW_SIZE)
+    max_window_size = int(config.get("max_request_window_size", DEFAULT_MAX_REQUEST_WINDOW_SIZE))
+    return AdaptiveWindowPlanner(report["name"],
+                                 int(window_size),
+                                 max_window_size,
+                                 functools.partial(client.get_page_size, report))
+
+
+def sync_stream(client, config, stream, writer, stop=None):
+    report, schema, start_date, end_date = prepare_stream(config, stream, writer)
+    request_window_size = int(config.get("request_window_size", DEFAULT_REQUEST_WINDOW_SIZE))
+    prefetch_depth, prefetch_max_bytes = get_prefetch_settings(config)
+    date_ranges_per_request = int(config.get("date_ranges_per_request", DEFAULT_DATE_RANGES_PER_REQUEST))
+    date_ranges_per_request = max(1, min(date_ranges_per_request, BaseClient.MAX_DATE_RANGES))
+    window_planner = get_window_planner(client, config, report, writer)
+
+    sync_report(client, schema, report, start_date, end_date, request_window_size, writer,
+                prefetch_depth, prefetch_max_bytes, date_ranges_per_request, window_planner, stop)
+    writer.finish_stream(stream.tap_stream_id)
+
+
+def sync_report_batch(client, schemas, reports, start_date, end_date, request_window_size, writer, stop=None):
+    """
+    Syncs reports that share the same date windows. The first page of every
+    window is requested for all of them in one BatchRunReports call, and the
+    responses are split back into per-report records and bookmarks.
+
+    A report whose window needs more than one page gets the remaining pages
+    with single requests, and falls back to single requests for the rest of
+    its windows.
+
+    Windows here are always request_window_size days, so the bookmarks keep
+    the window size adaptive_request_window saved for each report, if any.
+    Once `stop` is set, SyncStopped is raised before the next page.
+    """
+    LOGGER.info("Syncing %s for property_id %s in batches",
+                ", ".join(report["name"] for report in reports),
+                reports[0]["property_id"])
+
+    batched_ids = {report["id"] for report in reports}
+    saved_window_sizes = {report["id"]: get_saved_window_size(writer, report) for report in reports}
+    for range_start_date, range_end_date in generate_report_dates(start_date, end_date, request_window_size):
+        batched_reports = [report for report in reports if report["id"] in batched_ids]
+        first_pages = {}
+        if len(batched_reports) > 1:
+            first_pages = {report["id"]: response
+                           for report, response in zip(batched_reports,
+                                                       client.batch_get_reports(batched_reports, range_start_date, range_end_date))}
+
+        for schema, report in zip(schemas, reports):
+            if report["id"] in first_pages:
+                first_page = first_pages[report["id"]]
+                responses = chain([first_page],
+                                  client.get_remaining_pages(report, [(range_start_date, range_end_date)], first_page))
+                if first_page.row_count > len(first_page.rows):
+                    LOGGER.info("Report %s paginates, requesting it on its own from now on", report["name"])
+                    batched_ids.discard(report["id"])
+            else:
+                responses = client.get_report(report, range_start_date, range_end_date)
+
+            for response in responses:
+                check_stop(stop)
+                write_response_records(writer, schema, report, response)
+            bookmark = {"last_report_date": range_end_date}
+            if saved_window_sizes[report["id"]] is not None:
+                bookmark["request_window_size"] = saved_window_sizes[report["id"]]
+            writer.write_bookmark(report["id"],
+                                  report["property_id"],
+                                  bookmark)
+
+    LOGGER.info("Done syncing %s for property_id %s",
+                ", ".join(report["name"] for report in reports),
+                reports[0]["property_id"])
+
+
+def sync_stream_batch(client, config, streams, writer, stop=None):
+    """
+    Syncs one stream on its own, or several through sync_report_batch,
+    raising SyncStopped once stop is set.
+    """
+    if len(streams) == 1:
+        sync_stream(client, config, streams[0], writer, stop)
+    else:
+        prepared_streams = [prepare_stream(config, stream, writer) for stream in streams]
+        reports = [report for report, _, _, _ in prepared_streams]
+        schemas = [schema for _, schema, _, _ in prepared_streams]
+        _, _, start_date, end_date = prepared_streams[0]
+        request_window_size = int(config.get("request_window_size", DEFAULT_REQUEST_WINDOW_SIZE))
+
+        sync_report_batch(client, schemas, reports, start_date, end_date, request_window_size, writer, stop)
+        for stream in streams:
+            writer.finish_stream(stream.tap_stream_id)
+    LOGGER.info("GA4 quota after syncing %s: %s",
+                ", ".join(stream.tap_stream_id for stream in streams),
+                client.get_quota_state())
+
+
+def plan_report_batches(config, selected_streams, state, batch_size):
+    """
+    Groups the selected streams into batches of up to batch_size streams
+    that start on the same date, and so request the same date windows.
+    Batches keep the order of their first stream in selected_streams.
+    """
+    batches = {}
+    for stream in selected_streams:
+        start_date = get_report_start_date(config, config["property_id"], state, stream.tap_stream_id)
+        streams = batches.setdefault(start_date, [[]])
+        if len(streams[-1]) == batch_size:
+            streams.append([])
+        streams[-1].append(stream)
+
+    stream_batches = [batch for start_date_batches in batches.values() for batch in start_date_batches]
+    position = {stream.tap_stream_id: i for i, stream in enumerate(selected_streams)}
+    return sorted(stream_batches, key=lambda batch: position[batch[0].tap_stream_id])
+
+
+def sync_streams_concurrently(client, config, stream_batches, writer, stream_concurrency):
+    """
+    Runs sync_stream_batch for up to stream_concurrency batches at once,
+    starting them in the order of stream_batches. The first failure cancels
+    the batches that have not started yet, and stops the running ones
+    before their next page, without bookmarking the windows they were in.
+    It is re-raised once they stopped.
+    """
+    LOGGER.info("Syncing %s stream batches with %s workers", len(stream_batches), stream_concurrency)
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=stream_concurrency, thread_name_prefix="ga4-stream") as executor:
+        futures = [executor.submit(sync_stream_batch, client, config, streams, writer, stop)
+                   for streams in stream_batches]
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+        stop.set()
+        for future in not_done:
+            future.cancel()
+        for future in futures:
+            if future in done and future.exception() is not None:
+                raise future.exception()
+
+
+def get_selected_streams(catalog, state):
+    """Returns the selected streams in the order they should be synced."""
     selected_streams = catalog.get_selected_streams(state)
-    currently_syncing = state.get("currently_syncing", None)
-    selected_streams = sort_and_shuffle_streams(currently_syncing, selected_streams)
+    currently_syncing = state.get("currently_syncing_streams") or state.get("currently_syncing", None)
+    return sort_and_shuffle_streams(currently_syncing, selected_streams)
+
+
+def get_catalog_field_exclusions(stream):
+    """Returns the fieldExclusions discovery saved for every field of a stream."""
+    return {field_path[1]: field_mdata["fieldExclusions"]
+            for field_path, field_mdata in metadata.to_map(stream.metadata).items()
+            if field_path and "fieldExclusions" in field_mdata}
 
+
+def validate_selected_fields(config, selected_streams):
+    """
+    Raises if the filters of a stream use a field its catalog lists as
+    incompatible with a selected field. When the property metadata is
+    cached and fresh, also raises if a selected field no longer exists in
+    the property. Without a cache that check is skipped, to avoid a
+    GetMetadata call on every sync.
+    """
+    metadata_cache = MetadataCache.from_config(config)
+    response = metadata_cache.get() if metadata_cache else None
+    api_names = get_api_names(response) if response is not None else None
     for stream in selected_streams:
-        state = singer.set_currently_syncing(state, stream.tap_stream_id)
-        singer.write_state(state)
-
-        metrics = []
-        dimensions = []
-        mdata = metadata.to_map(stream.metadata)
-        for field_path, field_mdata in mdata.items():
-            if field_path == tuple():
-                continue
-            if field_mdata.get("inclusion") == "unsupported":
-                continue
-            if field_mdata.get("inclusion") == "automatic" or \
-               field_mdata.get("selected") or \
-               (field_mdata.get("selected-by-default") and field_mdata.get("selected") is None):
-                if field_mdata.get("behavior") == "METRIC":
-                    metrics.append(Metric(name=field_mdata.get("tap-ga4.api-field-names")))
-                elif field_mdata.get("behavior") == "DIMENSION":
-                    dimensions.append(Dimension(name=field_mdata.get("tap-ga4.api-field-names")))
-
-        end_date = get_end_date(config)
-        schema = stream.schema.to_dict()
-        singer.write_schema(stream.stream,
-                            schema,
-                            stream.key_properties)
-
-        report = {"property_id": config["property_id"],
-                  "account_id": config["account_id"],
-                  "name": stream.stream,
-                  "id": stream.tap_stream_id,
-                  "metrics": metrics,
-                  "dimensions": dimensions}
-
-        start_date = get_report_start_date(config, report["property_id"], state, report["id"])
-        request_window_size = int(config.get("request_window_size", DEFAULT_REQUEST_WINDOW_SIZE))
+        report = build_report(config, stream)
+        validate_filter_compatibility(report,
+                                      get_catalog_field_exclusions(stream),
+                                      [to_snake_case(field.name) for field in report["dimensions"] + report["metrics"]])
+        if api_names is None:
+            continue
+        missing_fields = [field.name for field in report["dimensions"] + report["metrics"]
+                          if field.name not in api_names]
+        if missing_fields:
+            raise Exception(f"Fields selected for stream {stream.tap_stream_id} no longer exist in property "
+                            f"{config['property_id']}: {', '.join(missing_fields)}. Run discovery again.")
 
-        sync_report(client, schema, report, start_date, end_date, request_window_size, state)
-        singer.write_state(state)
-    state = singer.set_currently_syncing(state, None)
-    singer.write_state(state)
+
+def sync(client, config, catalog, state):
+    selected_streams = get_selected_streams(catalog, state)
+    validate_selected_fields(config, selected_streams)
+    stream_concurrency = int(config.get("stream_concurrency", DEFAULT_STREAM_CONCURRENCY))
+    batch_size = min(int(config.get("report_batch_size", DEFAULT_REPORT_BATCH_SIZE)), BaseClient.MAX_BATCH_REPORTS)
+    stream_batches = plan_report_batches(config, selected_streams, state, max(1, batch_size))
+
+    # More than one stream is in flight at once when streams run
+    # concurrently or are synced together in batches
+    writer = Writer(state, concurrent=stream_concurrency > 1 or batch_size > 1)
+    # Keep emitting STATE while requests are parked on an exhausted quota
+    client.quota_governor.heartbeat = writer.write_state
+    try:
+        if stream_concurrency > 1:
+            sync_streams_concurrently(client, config, stream_batches, writer, stream_concurrency)
+        else:
+            for streams in stream_batches:
+                sync_stream_batch(client, config, streams, writer)
+    except DailyQuotaExhausted:
+        # Every finished window is bookmarked, so the next run resumes
+        # from the last one, and with currently_syncing from this stream
+        writer.write_state()
+        raise
+    writer.finish_sync()
@@ -0,0 +1,173 @@
+import functools
+import json
+from singer.transform import NO_INTEGER_DATETIME_PARSING, string_to_datetime
+
+
+def to_null(value):
+    if value is None or value == "":
+        return None
+    raise ValueError(f"{value!r} is not null")
+
+
+def to_string(value):
+    if value is None:
+        raise ValueError("None is not a string")
+    return str(value)
+
+
+def to_integer(value):
+    if isinstance(value, str):
+        value = value.replace(",", "")
+    return int(value)
+
+
+def to_number(value):
+    if isinstance(value, str):
+        value = value.replace(",", "")
+    return float(value)
+
+
+@functools.lru_cache(maxsize=16384)
+def string_to_datetime_cached(value):
+    """
+    string_to_datetime, memoized, as a window only has a few distinct
+    dates. Records with a value no type of its field accepts go through
+    Transformer, which parses and warns again for each of them.
+    """
+    return string_to_datetime(value)
+
+
+def to_datetime(value):
+    if value is None or value == "":
+        raise ValueError(f"{value!r} is not a date-time")
+    if isinstance(value, str):
+        result = string_to_datetime_cached(value)
+    else:
+        result = string_to_datetime(value)
+    if result is None:
+        raise ValueError(f"{value!r} is not a date-time")
+    return result
+
+
+# Converters of the types Transformer tries for a field, by JSON schema type
+TYPE_CONVERTERS = {"null": to_null,
+                   "string": to_string,
+                   "integer": to_integer,
+                   "number": to_number}
+
+
+def chain_converters(converters):
+    """Returns a converter that returns the result of the first of converters that succeeds."""
+    if len(converters) == 1:
+        return converters[0]
+    *first_converters, last_converter = converters
+
+    def convert(value):
+        for converter in first_converters:
+            try:
+                return converter(value)
+            except Exception:
+                pass
+        return last_converter(value)
+    return convert
+
+
+def get_schema_types(schema):
+    """The types of a schema in the order Transformer tries them, null last."""
+    types = schema["type"]
+    if not isinstance(types, list):
+        types = [types]
+    types = list(types)
+    if "null" in types:
+        types.remove("null")
+        types.append("null")
+    return types
+
+
+def compile_field(schema):
+    """
+    Returns a function converting a value as Transformer does for the
+    field schema, which raises when Transformer would fail. Returns None
+    for schemas using anything besides null, string, integer, number and
+    date-time strings.
+    """
+    if "anyOf" in schema:
+        converters = [compile_field(subschema) for subschema in schema["anyOf"]]
+        if not converters or None in converters:
+            return None
+        return chain_converters(converters)
+    if "type" not in schema:
+        return lambda value: value
+
+    converters = []
+    for typ in get_schema_types(schema):
+        if typ == "string" and schema.get("format") == "date-time":
+            converters.append(to_datetime)
+        elif typ in TYPE_CONVERTERS and not (typ == "string" and schema.get("format") == "singer.decimal"):
+            converters.append(TYPE_CONVERTERS[typ])
+        else:
+            return None
+    if not converters:
+        return None
+    return chain_converters(converters)
+
+
+def compile_schema(schema):
+    """
+    Returns {field: converter} for an object schema, or None when a
+    record of it can't be transformed field by field.
+    """
+    if "anyOf" in schema or "type" not in schema or get_schema_types(schema)[0] != "object":
+        return None
+    properties = schema.get("properties", {})
+    if not properties or schema.get("patternProperties"):
+        return None
+    converters = {field: compile_field(field_schema) for field, field_schema in properties.items()}
+    if None in converters.values():
+        return None
+    return converters
+
+
+class SchemaTransformer:
+    """
+    Transforms records as singer's Transformer does for a stream schema,
+    with the schema walked once instead of for every record.
+
+    Every field of the schema gets a converter for its types, tried in the
+    order Transformer tries them: metrics are parsed straight to int or
+    float, string dimensions pass through, and date-time strings are
+    parsed once per distinct value.
+
+    Records go through the Transformer passed to transform() whenever the
+    compiled path may differ from it: for schemas using other types or
+    keywords, for Transformers with a pre_hook or integer datetime
+    parsing, and for records with a field outside the schema or a value
+    none of the field types accept. Transformer then drops the field or
+    raises SchemaMismatch as usual.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.converters = compile_schema(schema)
+
+
+    def transform(self, record, transformer):
+        if self.converters is None or \
+           transformer.pre_hook is not None or \
+           transformer.integer_datetime_fmt != NO_INTEGER_DATETIME_PARSING:
+            return transformer.transform(record, self.schema)
+        converters = self.converters
+        try:
+            return {key: converters[key](value) for key, value in record.items()}
+        except Exception:
+            return transformer.transform(record, self.schema)
+
+
+def get_schema_transformer(schema):
+    """Returns the SchemaTransformer of a stream schema, compiled once per schema."""
+    return compile_schema_transformer(json.dumps(schema, sort_keys=True))
+
+
+@functools.lru_cache(maxsize=256)
+def compile_schema_transformer(schema_json):
+    return SchemaTransformer(json.loads(schema_json))
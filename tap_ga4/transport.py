@@ -0,0 +1,104 @@
+import functools
+import json
+import grpc
+from google.analytics.data_v1beta.services.beta_analytics_data.transports import (
+    BetaAnalyticsDataGrpcAsyncIOTransport, BetaAnalyticsDataGrpcTransport,
+    BetaAnalyticsDataRestTransport)
+
+TRANSPORTS = ("grpc", "rest")
+
+# Channel options the generated transports always set
+DEFAULT_CHANNEL_OPTIONS = {"grpc.max_send_message_length": -1,
+                           "grpc.max_receive_message_length": -1}
+
+
+class TransportProfile:
+    """
+    How the GA4 Data API client talks to the API.
+
+    `transport` is grpc (the default) or rest. `compression` is gzip or
+    none, or unset to keep the library defaults. Over gRPC it sets the
+    compression of the channel, and GA4 picks the encoding of responses
+    among those the channel accepts, gzip included. Over REST, gzip asks
+    for gzip encoded responses and none for uncompressed ones.
+    `channel_options` are extra gRPC channel arguments, e.g. keepalive or
+    message size limits, and are ignored by the rest transport.
+    """
+
+    COMPRESSIONS = ("gzip", "none")
+
+    def __init__(self, transport="grpc", compression=None, channel_options=None):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"transport must be one of {', '.join(TRANSPORTS)}, got {transport}")
+        if compression is not None and compression not in self.COMPRESSIONS:
+            raise ValueError(f"transport_compression must be one of {', '.join(self.COMPRESSIONS)}, "
+                             f"got {compression}")
+        self.transport = transport
+        self.compression = compression
+        self.channel_options = dict(channel_options or {})
+
+
+    @classmethod
+    def from_config(cls, config):
+        channel_options = config.get("grpc_channel_options") or {}
+        if isinstance(channel_options, str):
+            try:
+                channel_options = json.loads(channel_options)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Error parsing grpc_channel_options string: {e}") from e
+        compression = config.get("transport_compression")
+        return cls(config.get("transport") or "grpc",
+                   compression.lower() if compression else None,
+                   channel_options)
+
+
+    def get_channel_options(self):
+        """Returns the gRPC channel arguments as (key, value) pairs."""
+        options = dict(DEFAULT_CHANNEL_OPTIONS)
+        options.update(self.channel_options)
+        return list(options.items())
+
+
+    def get_grpc_compression(self):
+        if self.compression == "gzip":
+            return grpc.Compression.Gzip
+        if self.compression == "none":
+            return grpc.Compression.NoCompression
+        return None
+
+
+    def create_channel(self, transport_class, host, **kwargs):
+        """Channel factory for the generated transports, with this profile applied."""
+        kwargs["options"] = self.get_channel_options()
+        compression = self.get_grpc_compression()
+        if compression is not None:
+            kwargs["compression"] = compression
+        return transport_class.create_channel(host, **kwargs)
+
+
+    def get_transport(self):
+        """
+        Returns the `transport` argument of BetaAnalyticsDataClient, a
+        callable building the transport with this profile applied.
+        """
+        if self.transport == "rest":
+            return self.make_rest_transport
+        return functools.partial(BetaAnalyticsDataGrpcTransport,
+                                 channel=functools.partial(self.create_channel, BetaAnalyticsDataGrpcTransport))
+
+
+    def get_async_transport(self):
+        """Returns the `transport` argument of BetaAnalyticsDataAsyncClient."""
+        if self.transport == "rest":
+            raise ValueError("The asyncio sync engine only supports the grpc transport")
+        return functools.partial(BetaAnalyticsDataGrpcAsyncIOTransport,
+                                 channel=functools.partial(self.create_channel,
+                                                           BetaAnalyticsDataGrpcAsyncIOTransport))
+
+
+    def make_rest_transport(self, **kwargs):
+        transport = BetaAnalyticsDataRestTransport(**kwargs)
+        # requests asks for gzip responses unless told otherwise
+        if self.compression == "none":
+            transport._session.headers["Accept-Encoding"] = "identity"  # pylint: disable=protected-access
+        return transport
@@ -0,0 +1,82 @@
+import threading
+import singer
+
+LOGGER = singer.get_logger()
+
+
+class AdaptiveWindowPlanner:
+    """
+    Picks the request window size of a stream from what GA4 returns for
+    the first page of each window.
+
+    The window is halved, and the window re-fetched, when its first page
+    shows that it paginates heavily, was sampled, or rolled rows into the
+    "(other)" row (see https://support.google.com/analytics/answer/9309767).
+    It is doubled, up to max_window_size, while a whole window stays well
+    under one page, but never back to the size of a window that had to be
+    shrunk, so a stream that keeps getting sampled or "(other)" rows
+    settles on a size instead of growing and re-fetching forever.
+
+    get_page_size returns the number of rows the client currently requests
+    per page. The planner is used from the thread fetching pages, so the
+    window size is read with get_window_size from other threads.
+    """
+
+    # Grow while a window returns less than this fraction of a page
+    GROW_ROW_FRACTION = 0.25
+    # Shrink when a window needs more than this many pages
+    SHRINK_PAGE_COUNT = 4
+
+    def __init__(self, report_name, window_size, max_window_size, get_page_size):
+        self.report_name = report_name
+        self.max_window_size = max_window_size
+        self.window_size = max(1, min(window_size, max_window_size))
+        # Windows only grow below the smallest size that had to be shrunk
+        self.grow_limit = max_window_size
+        self.get_page_size = get_page_size
+        self.lock = threading.Lock()
+
+    def get_window_size(self):
+        with self.lock:
+            return self.window_size
+
+    def get_shrink_reason(self, response):
+        if response.row_count > self.SHRINK_PAGE_COUNT * self.get_page_size():
+            return f"{response.row_count} rows"
+        if response.metadata.sampling_metadatas:
+            return "sampled data"
+        if response.metadata.data_loss_from_other_row:
+            return "\"(other)\" rows"
+        return None
+
+    def should_refetch(self, response, window_days):
+        """
+        Returns True, after shrinking the window size, if a window of
+        window_days days whose first page is `response` should be requested
+        again in smaller windows.
+        """
+        reason = self.get_shrink_reason(response)
+        if reason is None:
+            return False
+        if window_days == 1:
+            LOGGER.warning("Report %s returned %s for a single day window", self.report_name, reason)
+            return False
+        with self.lock:
+            self.grow_limit = min(self.grow_limit, window_days - 1)
+            self.window_size = max(1, min(self.window_size, window_days) // 2)
+            window_size = self.window_size
+        LOGGER.info("Report %s returned %s, shrinking request window to %s days",
+                    self.report_name, reason, window_size)
+        return True
+
+    def observe(self, response, window_days):
+        """Grows the window size after a full window_days window returned few rows."""
+        with self.lock:
+            if window_days < self.window_size or self.window_size >= min(self.max_window_size, self.grow_limit):
+                return
+            if response.row_count >= self.GROW_ROW_FRACTION * self.get_page_size():
+                return
+            self.window_size = min(self.window_size * 2, self.max_window_size, self.grow_limit)
+            window_size = self.window_size
+        LOGGER.info("Report %s returned %s rows, growing request window to %s days",
+                    self.report_name, response.row_count, window_size)
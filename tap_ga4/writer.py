@@ -0,0 +1,68 @@
+import threading
+import singer
+
+
+class Writer:
+    """
+    Owns the sync state and serializes every Singer message written by the
+    stream workers.
+
+    All messages go through a single lock, so lines from different streams
+    never interleave. Bookmarks are merged into the shared state and the
+    STATE message is emitted under that same lock, after the records of the
+    bookmarked window were written, so every emitted STATE only covers
+    windows that are fully written.
+
+    When `concurrent` is set, the streams being synced are also recorded
+    in `currently_syncing_streams`, oldest first, so an interrupted run can
+    resume all of them. `currently_syncing` keeps pointing at the oldest
+    stream in flight for compatibility with single stream resumption.
+    """
+
+    def __init__(self, state, concurrent=False):
+        self.state = state
+        self.concurrent = concurrent
+        self.in_flight = []
+        self.lock = threading.RLock()
+
+    def write_schema(self, stream_name, schema, key_properties):
+        with self.lock:
+            singer.write_schema(stream_name, schema, key_properties)
+
+    def write_record(self, stream_name, record, time_extracted=None):
+        with self.lock:
+            singer.write_record(stream_name, record, time_extracted=time_extracted)
+
+    def write_bookmark(self, tap_stream_id, property_id, value):
+        with self.lock:
+            singer.write_bookmark(self.state, tap_stream_id, property_id, value)
+            singer.write_state(self.state)
+
+    def write_state(self):
+        with self.lock:
+            singer.write_state(self.state)
+
+    def start_stream(self, tap_stream_id):
+        with self.lock:
+            self.in_flight.append(tap_stream_id)
+            self._update_currently_syncing()
+            singer.write_state(self.state)
+
+    def finish_stream(self, tap_stream_id):
+        with self.lock:
+            self.in_flight.remove(tap_stream_id)
+            if self.concurrent:
+                self._update_currently_syncing()
+            singer.write_state(self.state)
+
+    def finish_sync(self):
+        with self.lock:
+            self.state.pop("currently_syncing_streams", None)
+            singer.set_currently_syncing(self.state, None)
+            singer.write_state(self.state)
+
+    def _update_currently_syncing(self):
+        if self.concurrent:
+            self.state["currently_syncing_streams"] = list(self.in_flight)
+        if self.in_flight:
+            singer.set_currently_syncing(self.state, self.in_flight[0])
@@ -0,0 +1,70 @@
+"""
+Compares building the records of synthetic 100k row pages row by row
+with values_to_record and transform_datetimes from reference.py, which
+snake_case the headers, parse every date and read the clock for every
+row, with the RecordBuilder compiled once per stream and response
+shape, and the record hash on its own.
+
+The wide page has mostly distinct dimension values (20000 landing pages,
+2000 cities), the narrow one few, which is where the value dictionary
+of RecordHasher pays off.
+"""
+import singer
+from reference import decode_rows, transform_datetimes, values_to_record
+from synthetic import DIMENSIONS, METRICS, REPORT, make_response, time_per_row
+
+from tap_ga4.sync import (RecordHasher, generate_sdc_record_hash,
+                          get_record_builder, to_snake_case)
+
+PAGES = {"wide": DIMENSIONS[:6],
+         "narrow": ["date", "country", "deviceCategory", "sessionDefaultChannelGroup"]}
+
+
+def bench_page(label, dimensions):
+    response = make_response(row_count=100000, dimensions=dimensions, metrics=METRICS[:9])
+    dimension_headers = [dimension.name for dimension in response.dimension_headers]
+    metric_headers = [metric.name for metric in response.metric_headers]
+    rows = len(response.rows)
+
+    def per_row_headers():
+        for dimension_values, metric_values in decode_rows(response):
+            singer.utils.now()
+            transform_datetimes(values_to_record(REPORT, dimension_values, metric_values,
+                                                dimension_headers, metric_headers))
+
+    def record_builder():
+        builder = get_record_builder(REPORT["name"],
+                                     REPORT["property_id"],
+                                     REPORT["account_id"],
+                                     tuple(dimension_headers),
+                                     tuple(metric_headers))
+        singer.utils.now()
+        for _ in builder.build_records(response):
+            pass
+
+    dimension_keys = [to_snake_case(header) for header in dimension_headers]
+    dimension_rows = [dimension_values for dimension_values, _ in decode_rows(response)]
+    ids = {"property_id": REPORT["property_id"], "account_id": REPORT["account_id"]}
+    hasher = RecordHasher(REPORT["property_id"], REPORT["account_id"], dimension_keys)
+
+    def sorted_json_hash():
+        for dimension_values in dimension_rows:
+            generate_sdc_record_hash(ids, list(zip(dimension_keys, dimension_values)))
+
+    def compiled_hash():
+        for dimension_values in dimension_rows:
+            hasher.hash_entries([hasher.lookup(value) for value in dimension_values])
+
+    time_per_row(f"{label} generate_sdc_record_hash", sorted_json_hash, rows, repeat=3)
+    time_per_row(f"{label} RecordHasher", compiled_hash, rows, repeat=3)
+    time_per_row(f"{label} values_to_record (before)", per_row_headers, rows, repeat=3)
+    time_per_row(f"{label} RecordBuilder (after)", record_builder, rows, repeat=3)
+
+
+def main():
+    for label, dimensions in PAGES.items():
+        bench_page(label, dimensions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Compares building records through the proto-plus row wrappers with
+decoding the raw protobuf rows of a synthetic 100k row, 15 column page.
+"""
+from reference import decode_rows, row_to_record, values_to_record
+from synthetic import DIMENSIONS, METRICS, REPORT, make_response, time_per_row
+
+
+def main():
+    response = make_response(row_count=100000, dimensions=DIMENSIONS[:6], metrics=METRICS[:9])
+    dimension_headers = [dimension.name for dimension in response.dimension_headers]
+    metric_headers = [metric.name for metric in response.metric_headers]
+    rows = len(response.rows)
+
+    def proto_plus_path():
+        for row in response.rows:
+            row_to_record(REPORT, row, dimension_headers, metric_headers)
+
+    def raw_protobuf_path():
+        for dimension_values, metric_values in decode_rows(response):
+            values_to_record(REPORT, dimension_values, metric_values, dimension_headers, metric_headers)
+
+    def proto_plus_values_only():
+        for row in response.rows:
+            _ = [dimension.value for dimension in row.dimension_values]
+            _ = [metric.value for metric in row.metric_values]
+
+    def raw_protobuf_values_only():
+        for _ in decode_rows(response):
+            pass
+
+    time_per_row("proto-plus values", proto_plus_values_only, rows)
+    time_per_row("raw protobuf values", raw_protobuf_values_only, rows)
+    time_per_row("proto-plus row_to_record", proto_plus_path, rows)
+    time_per_row("raw protobuf values_to_record", raw_protobuf_path, rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compares transforming the records of synthetic 100k row pages with
+singer's Transformer, which walks the schema of every field of every
+record, with the SchemaTransformer compiled once per stream schema.
+"""
+from collections import defaultdict
+
+from google.analytics.data_v1beta.types import DimensionMetadata, MetricMetadata
+from singer import Schema, Transformer
+from synthetic import DIMENSIONS, METRICS, REPORT, make_response, time_per_row
+
+from tap_ga4.discover import generate_schema_and_metadata
+from tap_ga4.sync import get_record_builder
+from tap_ga4.transform import get_schema_transformer
+
+PAGES = {"wide": DIMENSIONS[:6],
+         "narrow": ["date", "country", "deviceCategory", "sessionDefaultChannelGroup"]}
+FLOAT_METRICS = {"engagementRate", "totalRevenue", "userEngagementDuration"}
+
+
+def make_schema():
+    dimensions = [DimensionMetadata(api_name=name, category="Benchmark") for name in DIMENSIONS]
+    metrics = [MetricMetadata(api_name=name,
+                              category="Benchmark",
+                              type_="TYPE_FLOAT" if name in FLOAT_METRICS else "TYPE_INTEGER")
+               for name in METRICS]
+    schema, _ = generate_schema_and_metadata(dimensions, metrics, [], defaultdict(list), REPORT)
+    return Schema.from_dict(schema).to_dict()
+
+
+def bench_page(label, dimensions, schema):
+    response = make_response(row_count=100000, dimensions=dimensions, metrics=METRICS[:9])
+    builder = get_record_builder(REPORT["name"],
+                                 REPORT["property_id"],
+                                 REPORT["account_id"],
+                                 tuple(dimension.name for dimension in response.dimension_headers),
+                                 tuple(metric.name for metric in response.metric_headers))
+    records = list(builder.build_records(response))
+
+    def transformer():
+        with Transformer() as singer_transformer:
+            for record in records:
+                singer_transformer.transform(record, schema)
+
+    def schema_transformer():
+        compiled = get_schema_transformer(schema)
+        with Transformer() as singer_transformer:
+            for record in records:
+                compiled.transform(record, singer_transformer)
+
+    time_per_row(f"{label} Transformer (before)", transformer, len(records), repeat=3)
+    time_per_row(f"{label} SchemaTransformer (after)", schema_transformer, len(records), repeat=3)
+
+
+def main():
+    schema = make_schema()
+    for label, dimensions in PAGES.items():
+        bench_page(label, dimensions, schema)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Compares the transport profiles of tap_ga4.transport against local fake
+GA4 servers: gRPC servers built from a generic handler, with and without
+gzip responses, and a REST server built on http.server that gzips
+responses when asked to, all answering RunReport with a synthetic 100k row
+page. Responses go through a proxy that counts the bytes sent to the
+client and can cap the bandwidth, to mimic an egress-constrained worker.
+
+Run with e.g. `python tests/benchmarks/bench_transport.py --bandwidth-mbps 100`.
+"""
+import argparse
+import gzip
+import socket
+import threading
+import time
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import grpc
+from google.analytics.data_v1beta import BetaAnalyticsDataClient
+from google.analytics.data_v1beta.services.beta_analytics_data.transports import BetaAnalyticsDataGrpcTransport
+from google.analytics.data_v1beta.types import RunReportRequest, RunReportResponse
+from google.auth.credentials import AnonymousCredentials
+from synthetic import DIMENSIONS, METRICS, make_response
+
+from tap_ga4.transport import TransportProfile
+
+SERVICE = "google.analytics.data.v1beta.BetaAnalyticsData"
+# (server, profile) pairs. Over gRPC the server picks the response
+# encoding, so each profile runs against both gRPC servers.
+RUNS = [("grpc", TransportProfile("grpc")),
+        ("grpc", TransportProfile("grpc", "gzip")),
+        ("grpc+gzip", TransportProfile("grpc")),
+        ("grpc+gzip", TransportProfile("grpc", "gzip")),
+        ("rest", TransportProfile("rest", "none")),
+        ("rest", TransportProfile("rest", "gzip"))]
+
+
+class CountingProxy:
+    """Forwards TCP connections to target, counting and pacing the bytes it returns."""
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, target_port, bandwidth_mbps=None):
+        self.target_port = target_port
+        self.bytes_per_second = bandwidth_mbps * 1000 * 1000 / 8 if bandwidth_mbps else None
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            client, _ = self.listener.accept()
+            upstream = socket.create_connection(("127.0.0.1", self.target_port))
+            threading.Thread(target=self.pump, args=(client, upstream, False), daemon=True).start()
+            threading.Thread(target=self.pump, args=(upstream, client, True), daemon=True).start()
+
+    def pump(self, source, destination, count):
+        try:
+            while True:
+                data = source.recv(self.CHUNK_SIZE)
+                if not data:
+                    break
+                if count:
+                    with self.lock:
+                        self.bytes_received += len(data)
+                    if self.bytes_per_second:
+                        time.sleep(len(data) / self.bytes_per_second)
+                destination.sendall(data)
+        except OSError:
+            pass
+        finally:
+            destination.close()
+
+    def take_bytes_received(self):
+        with self.lock:
+            received, self.bytes_received = self.bytes_received, 0
+            return received
+
+
+def start_grpc_server(payload, compression):
+    def run_report(_request, _context):
+        return payload
+
+    handler = grpc.method_handlers_generic_handler(SERVICE, {
+        "RunReport": grpc.unary_unary_rpc_method_handler(
+            run_report,
+            request_deserializer=RunReportRequest.pb().FromString,
+            response_serializer=lambda response: response)})
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4),
+                         compression=compression,
+                         options=[("grpc.max_send_message_length", -1)])
+    server.add_generic_rpc_handlers((handler,))
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    return server, port
+
+
+def start_rest_server(payload):
+    compressed_payload = gzip.compress(payload, compresslevel=6)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            body = payload
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = compressed_payload
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def make_client(profile, port):
+    if profile.transport == "rest":
+        transport = profile.make_rest_transport(host=f"127.0.0.1:{port}",
+                                                credentials=AnonymousCredentials(),
+                                                url_scheme="http")
+    else:
+        channel = grpc.insecure_channel(f"127.0.0.1:{port}",
+                                        options=profile.get_channel_options(),
+                                        compression=profile.get_grpc_compression())
+        transport = BetaAnalyticsDataGrpcTransport(channel=channel, credentials=AnonymousCredentials())
+    return BetaAnalyticsDataClient(transport=transport)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--bandwidth-mbps", type=float, default=None,
+                        help="Caps the bandwidth of responses, unlimited by default")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    response = make_response(row_count=args.rows, dimensions=DIMENSIONS[:6], metrics=METRICS[:9])
+    payload = RunReportResponse.serialize(response)
+    grpc_server, grpc_port = start_grpc_server(payload, grpc.Compression.NoCompression)
+    gzip_server, gzip_port = start_grpc_server(payload, grpc.Compression.Gzip)
+    rest_server, rest_port = start_rest_server(RunReportResponse.to_json(response).encode("utf-8"))
+    proxies = {"grpc": CountingProxy(grpc_port, args.bandwidth_mbps),
+               "grpc+gzip": CountingProxy(gzip_port, args.bandwidth_mbps),
+               "rest": CountingProxy(rest_port, args.bandwidth_mbps)}
+    request = RunReportRequest(property="properties/123")
+
+    print(f"{'server':<10} {'profile':<16} {'bytes received':>16} {'seconds':>10} {'rows/s':>12}")
+    for server, profile in RUNS:
+        proxy = proxies[server]
+        client = make_client(profile, proxy.port)
+        client.run_report(request)
+        proxy.take_bytes_received()
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            page = client.run_report(request)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        assert len(page.rows) == args.rows
+        label = f"{profile.transport}/{profile.compression or 'default'}"
+        print(f"{server:<10} {label:<16} {proxy.take_bytes_received() // args.repeat:>16,} {best:>10.3f} {args.rows / best:>12,.0f}")
+
+    grpc_server.stop(None)
+    gzip_server.stop(None)
+    rest_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
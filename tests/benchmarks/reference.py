@@ -0,0 +1,42 @@
+"""
+The row by row record building sync used before RecordBuilder, kept as
+the baseline the benchmarks in this directory compare against.
+"""
+from google.analytics.data_v1beta.types import RunReportResponse
+
+from tap_ga4.sync import DATETIME_FORMATS, generate_sdc_record_hash, parse_datetime, to_snake_case
+
+
+def decode_rows(response):
+    """Yields (dimension_values, metric_values) lists of strings for every raw protobuf row."""
+    for row in RunReportResponse.pb(response).rows:
+        yield ([dimension.value for dimension in row.dimension_values],
+               [metric.value for metric in row.metric_values])
+
+
+def row_to_record(report, row, dimension_headers, metric_headers):
+    """Same as values_to_record, for a proto-plus row."""
+    return values_to_record(report,
+                            [dimension.value for dimension in row.dimension_values],
+                            [metric.value for metric in row.metric_values],
+                            dimension_headers,
+                            metric_headers)
+
+
+def values_to_record(report, dimension_values, metric_values, dimension_headers, metric_headers):
+    """Builds a record, snake_casing the headers and sorting and JSON encoding its hash for every row."""
+    dimension_pairs = list(zip([to_snake_case(header) for header in dimension_headers], dimension_values))
+    record = dict(dimension_pairs)
+    record.update(zip([to_snake_case(header) for header in metric_headers], metric_values))
+    record["property_id"] = report["property_id"]
+    record["account_id"] = report["account_id"]
+    record["_sdc_record_hash"] = generate_sdc_record_hash(record, dimension_pairs)
+    return record
+
+
+def transform_datetimes(record):
+    """Parses every datetime of a record without memoizing."""
+    for field_name, value in record.items():
+        if value and field_name in DATETIME_FORMATS:
+            record[field_name], _ = parse_datetime(field_name, value)
+    return record
@@ -0,0 +1,64 @@
+"""
+Synthetic GA4 report responses for the benchmarks in this directory.
+
+Run a benchmark with e.g. `python tests/benchmarks/bench_row_decoding.py`.
+"""
+import random
+import time
+
+from google.analytics.data_v1beta.types import RunReportResponse
+
+DIMENSIONS = ["date", "country", "city", "deviceCategory", "sessionDefaultChannelGroup",
+              "landingPage", "browser", "operatingSystem", "language"]
+METRICS = ["sessions", "totalUsers", "newUsers", "engagedSessions", "engagementRate",
+           "eventCount", "keyEvents", "totalRevenue", "screenPageViews", "userEngagementDuration"]
+
+REPORT = {"name": "benchmark_report",
+          "id": "benchmark_report",
+          "property_id": "123456789",
+          "account_id": "123456"}
+
+
+def make_response(row_count=100000, dimensions=DIMENSIONS[:6], metrics=METRICS[:9], seed=0):
+    """
+    Builds a RunReportResponse of row_count rows with realistic value
+    cardinality: few dates and countries, many landing pages.
+    """
+    rng = random.Random(seed)
+    choices = {"date": [f"202201{day:02d}" for day in range(1, 8)],
+               "country": [f"country_{i}" for i in range(150)],
+               "city": [f"city_{i}" for i in range(2000)],
+               "deviceCategory": ["desktop", "mobile", "tablet"],
+               "sessionDefaultChannelGroup": ["Direct", "Organic Search", "Paid Search", "Referral", "Email"],
+               "landingPage": [f"/path/{i}?utm_source=\"news\"" for i in range(20000)],
+               "browser": ["Chrome", "Safari", "Firefox", "Edge"],
+               "operatingSystem": ["Windows", "Macintosh", "iOS", "Android"],
+               "language": ["English", "Deutsch", "Français", "日本語"]}
+    pb = RunReportResponse.pb()()
+    for dimension in dimensions:
+        pb.dimension_headers.add(name=dimension)
+    for metric in metrics:
+        pb.metric_headers.add(name=metric)
+    for _ in range(row_count):
+        row = pb.rows.add()
+        for dimension in dimensions:
+            row.dimension_values.add(value=rng.choice(choices[dimension]))
+        for metric in metrics:
+            if metric in {"engagementRate", "totalRevenue", "userEngagementDuration"}:
+                row.metric_values.add(value=str(round(rng.random() * 100, 4)))
+            else:
+                row.metric_values.add(value=str(rng.randint(0, 5000)))
+    pb.row_count = row_count
+    return RunReportResponse.wrap(pb)
+
+
+def time_per_row(label, func, rows, repeat=1):
+    """Runs func `repeat` times and prints the best rows per second."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<40} {best:8.3f}s  {rows / best:12,.0f} rows/s")
+    return best
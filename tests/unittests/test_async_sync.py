@@ -0,0 +1,209 @@
+import asyncio
+import io
+import json
+import time
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import AsyncMock, patch
+
+from google.analytics.data_v1beta.types import RunReportResponse
+from google.api_core.exceptions import ResourceExhausted, TooManyRequests
+from singer import Catalog, CatalogEntry, Schema
+from tap_ga4.async_client import AsyncClient
+from tap_ga4.async_sync import sync_async
+from tap_ga4.quota import DailyQuotaExhausted, QuotaGovernor
+
+
+CONFIG = {"refresh_token": "refresh_token",
+          "oauth_client_id": "client_id",
+          "oauth_client_secret": "client_secret",
+          "start_date": "2022-01-01T00:00:00Z",
+          "end_date": "2022-01-10T00:00:00Z",
+          "property_id": "123456789",
+          "account_id": "123456"}
+
+REPORT = {"name": "my_report",
+          "id": "my_report",
+          "property_id": "123456789",
+          "account_id": "123456",
+          "dimensions": [],
+          "metrics": []}
+
+
+def make_stream(tap_stream_id):
+    schema = {"type": "object",
+              "properties": {"_sdc_record_hash": {"type": "string"},
+                             "property_id": {"type": "string"},
+                             "account_id": {"type": "string"},
+                             "date": {"type": ["string", "null"]}}}
+    mdata = [{"breadcrumb": [], "metadata": {"selected": True}},
+             {"breadcrumb": ["properties", "date"],
+              "metadata": {"inclusion": "automatic", "behavior": "DIMENSION", "tap-ga4.api-field-names": "date"}}]
+    return CatalogEntry(tap_stream_id=tap_stream_id,
+                        stream=tap_stream_id,
+                        schema=Schema.from_dict(schema),
+                        key_properties=["_sdc_record_hash"],
+                        metadata=mdata)
+
+
+class FakeAsyncClient:
+    """Answers every window with one row per day, finishing later windows first."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.quota_governor = QuotaGovernor()
+
+    async def get_report(self, report, range_start_date, range_end_date):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.02 if range_start_date == "2022-01-01" else 0)
+        self.in_flight -= 1
+        response = RunReportResponse({"dimension_headers": [{"name": "date"}], "row_count": 1})
+        response.rows.append({"dimension_values": [{"value": range_start_date.replace("-", "")}]})
+        yield response
+
+
+class TestAsyncClient(unittest.TestCase):
+
+    def test_pages_are_yielded_in_offset_order(self):
+        with patch("tap_ga4.async_client.BetaAnalyticsDataAsyncClient"):
+            client = AsyncClient({**CONFIG, "page_concurrency": 3})
+        client.PAGE_SIZE = 10
+
+        async def make_request(request):
+            await asyncio.sleep(0.01 * (5 - request.offset // 10))
+            response = RunReportResponse(row_count=45)
+            for _ in range(min(request.limit, 45 - request.offset)):
+                response.rows.append({})
+            response.metadata.currency_code = str(request.offset)
+            return response
+
+        async def get_offsets():
+            return [response.metadata.currency_code
+                    async for response in client.get_report(REPORT, "2022-01-01", "2022-01-07")]
+
+        client._make_request = make_request
+        self.assertEqual(["0", "10", "20", "30", "40"], asyncio.run(get_offsets()))
+
+    def test_slow_channels_do_not_fail_the_warm_up(self):
+        with patch("tap_ga4.async_client.BetaAnalyticsDataAsyncClient"):
+            client = AsyncClient(CONFIG)
+        client.client.transport.grpc_channel.channel_ready = lambda: asyncio.sleep(1)
+
+        async def warm_up():
+            await client.warm_up()
+
+        with patch.object(client.token_refresher, "start") as mock_start, \
+             patch.object(AsyncClient, "CHANNEL_WARM_UP_TIMEOUT", 0.01), \
+             self.assertLogs(level="INFO") as logs:
+            asyncio.run(warm_up())
+        mock_start.assert_called_once()
+        self.assertIn("did not connect within 0.01 seconds", logs.output[0])
+
+    def test_requests_go_through_the_governor_and_limits(self):
+        with patch("tap_ga4.async_client.BetaAnalyticsDataAsyncClient"):
+            client = AsyncClient(CONFIG)
+        client.client.run_report = AsyncMock(return_value=RunReportResponse(
+            property_quota={"tokens_per_hour": {"consumed": 12, "remaining": 3000}}))
+
+        async def get_pages():
+            return [response async for response in client.get_report(REPORT, "2022-01-01", "2022-01-07")]
+
+        asyncio.run(get_pages())
+        state = client.get_quota_state()
+        self.assertEqual(3000, state["budgets"]["tokens_per_hour"]["remaining"])
+        self.assertEqual(0, state["in_flight"])
+        self.assertEqual(0, client.property_concurrency.in_flight)
+        self.assertEqual(0, client.project_concurrency.in_flight)
+
+    @patch("asyncio.sleep", new_callable=AsyncMock)
+    def test_throttling_lowers_the_property_limit(self, _):
+        with patch("tap_ga4.async_client.BetaAnalyticsDataAsyncClient"):
+            client = AsyncClient({**CONFIG, "property_id": "123", "max_concurrent_requests": "8"})
+        client.client.run_report = AsyncMock(side_effect=[TooManyRequests("slow down"), RunReportResponse()])
+        asyncio.run(client._make_request(client.build_report_request(REPORT, [("2022-01-01", "2022-01-07")], 0)))
+        self.assertEqual(2, int(client.property_concurrency.limit))
+        self.assertEqual(2, client.client.run_report.call_count)
+
+    def test_requests_cancelled_while_waiting_free_their_slots(self):
+        with patch("tap_ga4.async_client.BetaAnalyticsDataAsyncClient"):
+            client = AsyncClient(CONFIG)
+        client.client.run_report = AsyncMock(return_value=RunReportResponse())
+
+        async def cancel_request():
+            request = client.build_report_request(REPORT, [("2022-01-01", "2022-01-07")], 0)
+            task = asyncio.ensure_future(client._make_request(request))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            await asyncio.sleep(0.1)
+
+        with patch.object(client.quota_governor, "wait_for_parked_quotas", side_effect=lambda: time.sleep(0.05)):
+            asyncio.run(cancel_request())
+        client.client.run_report.assert_not_called()
+        self.assertEqual(0, client.quota_governor.in_flight)
+        self.assertEqual(0, client.property_concurrency.in_flight)
+
+
+
+class TestAsyncQuotaExhaustion(unittest.TestCase):
+
+    def setUp(self):
+        with patch("tap_ga4.async_client.BetaAnalyticsDataAsyncClient"):
+            self.client = AsyncClient(CONFIG)
+        self.request = self.client.build_report_request(REPORT, [("2022-01-01", "2022-01-07")], 0)
+
+    @patch("asyncio.sleep", new_callable=AsyncMock)
+    def test_hourly_exhaustion_is_retried_after_parking(self, mock_sleep):
+        self.client.client.run_report = AsyncMock(side_effect=[ResourceExhausted("Exhausted property tokens per hour."),
+                                                               RunReportResponse()])
+        with patch("tap_ga4.quota.QuotaGovernor.wait_for_parked_quotas") as wait_for_parked_quotas:
+            asyncio.run(self.client._make_request(self.request))
+        self.assertEqual(2, self.client.client.run_report.call_count)
+        self.assertEqual(2, wait_for_parked_quotas.call_count)
+        self.assertIn("tokens_per_hour", self.client.quota_governor.parked_until)
+        # Parked by the governor, not slept on the event loop
+        self.assertLess(max(call.args[0] for call in mock_sleep.call_args_list), 60)
+
+    def test_daily_exhaustion_is_not_retried(self):
+        self.client.client.run_report = AsyncMock(side_effect=ResourceExhausted("Exhausted property tokens per day."))
+        with self.assertRaises(DailyQuotaExhausted):
+            asyncio.run(self.client._make_request(self.request))
+        self.assertEqual(1, self.client.client.run_report.call_count)
+        self.assertEqual(0, self.client.quota_governor.in_flight)
+
+
+class TestAsyncSync(unittest.TestCase):
+
+    def test_windows_are_written_in_order(self):
+        catalog = Catalog([make_stream("stream1"), make_stream("stream2")])
+        config = {**CONFIG, "stream_concurrency": 2, "window_concurrency": 2}
+        client = FakeAsyncClient()
+        state = {}
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            asyncio.run(sync_async(config, catalog, state, client=client))
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        stream1_dates = [message["record"]["date"] for message in messages
+                         if message["type"] == "RECORD" and message["stream"] == "stream1"]
+        self.assertEqual(["2022-01-01T00:00:00.000000Z", "2022-01-08T00:00:00.000000Z"], stream1_dates)
+        self.assertGreater(client.max_in_flight, 1)
+        self.assertEqual("2022-01-10", state["bookmarks"]["stream2"]["123456789"]["last_report_date"])
+        self.assertIsNone(messages[-1]["value"]["currently_syncing"])
+        # Parked requests keep emitting STATE
+        self.assertIsNotNone(client.quota_governor.heartbeat)
+
+    def test_options_of_the_threaded_engine_are_rejected(self):
+        catalog = Catalog([make_stream("stream1")])
+        for option, value in [("prefetch_depth", "2"), ("report_batch_size", 5),
+                              ("date_ranges_per_request", "4"), ("adaptive_request_window", "true")]:
+            with self.subTest(option=option), self.assertRaisesRegex(ValueError, option):
+                asyncio.run(sync_async({**CONFIG, option: value}, catalog, {}, client=FakeAsyncClient()))
+        # Values that leave them off are fine
+        config = {**CONFIG, "prefetch_depth": 0, "report_batch_size": "1", "adaptive_request_window": False}
+        with redirect_stdout(io.StringIO()):
+            asyncio.run(sync_async(config, catalog, {}, client=FakeAsyncClient()))
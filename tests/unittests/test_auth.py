@@ -0,0 +1,82 @@
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from tap_ga4.auth import TokenRefresher
+
+NOW = datetime(2024, 1, 1, 10, 30)
+
+
+class FakeCredentials:
+    """Credentials whose refreshes hand out tokens valid for an hour, after `failures` errors."""
+
+    def __init__(self, token=None, expiry=None, failures=0):
+        self.token = token
+        self.expiry = expiry
+        self.failures = failures
+        self.refreshes = 0
+        self.refreshed = threading.Event()
+
+    def refresh(self, _request):
+        if self.failures:
+            self.failures -= 1
+            raise Exception("invalid_grant")
+        self.refreshes += 1
+        self.token = f"token-{self.refreshes}"
+        self.expiry = NOW + timedelta(hours=1)
+        self.refreshed.set()
+
+
+class TestTokenRefresher(unittest.TestCase):
+
+    def test_refresh_delay(self):
+        self.assertEqual(0, TokenRefresher(FakeCredentials()).get_refresh_delay(NOW))
+        credentials = FakeCredentials("token", NOW + timedelta(hours=1))
+        self.assertEqual(3600 - TokenRefresher.REFRESH_MARGIN, TokenRefresher(credentials).get_refresh_delay(NOW))
+        credentials = FakeCredentials("token", NOW + timedelta(seconds=10))
+        self.assertEqual(0, TokenRefresher(credentials).get_refresh_delay(NOW))
+        # Tokens without expiry never need a refresh
+        self.assertIsNone(TokenRefresher(FakeCredentials("token")).get_refresh_delay(NOW))
+
+    def test_fetches_a_token_then_waits_for_its_expiry(self):
+        credentials = FakeCredentials()
+        refresher = TokenRefresher(credentials)
+        with patch("tap_ga4.auth.utcnow", return_value=NOW), \
+             patch.object(refresher.stopped, "wait", side_effect=lambda delay: refresher.stop()) as mock_wait:
+            refresher.run()
+        self.assertEqual("token-1", credentials.token)
+        mock_wait.assert_called_once_with(3600 - TokenRefresher.REFRESH_MARGIN)
+
+    def test_failed_refreshes_are_retried(self):
+        credentials = FakeCredentials(failures=2)
+        refresher = TokenRefresher(credentials)
+        waits = []
+
+        def wait(delay):
+            waits.append(delay)
+            if credentials.token:
+                refresher.stop()
+
+        with patch("tap_ga4.auth.utcnow", return_value=NOW), \
+             patch.object(refresher.stopped, "wait", side_effect=wait):
+            refresher.run()
+        self.assertEqual([TokenRefresher.RETRY_INTERVAL,
+                          TokenRefresher.RETRY_INTERVAL,
+                          3600 - TokenRefresher.REFRESH_MARGIN],
+                         waits)
+        self.assertEqual("token-1", credentials.token)
+
+    def test_start_runs_in_the_background_once(self):
+        credentials = FakeCredentials()
+        refresher = TokenRefresher(credentials)
+        with patch("tap_ga4.auth.utcnow", return_value=NOW):
+            refresher.start()
+            thread = refresher.thread
+            refresher.start()
+            self.assertIs(thread, refresher.thread)
+            self.assertTrue(credentials.refreshed.wait(5))
+            refresher.stop()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(1, credentials.refreshes)
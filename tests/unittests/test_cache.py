@@ -0,0 +1,178 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from google.analytics.data_v1beta.types import (CheckCompatibilityResponse,
+                                                DimensionMetadata, Metadata,
+                                                MetricMetadata)
+from singer import CatalogEntry
+from tap_ga4.cache import CompatibilityCache, MetadataCache
+from tap_ga4.discover import get_field_exclusions, get_metadata
+from tap_ga4.sync import validate_selected_fields
+
+
+def make_compatibility_response(dimensions=(), metrics=()):
+    return CheckCompatibilityResponse(
+        dimension_compatibilities=[{"dimension_metadata": {"api_name": name}} for name in dimensions],
+        metric_compatibilities=[{"metric_metadata": {"api_name": name}} for name in metrics])
+
+
+class TestCompatibilityCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.field = DimensionMetadata(api_name="customEvent:foo", category="Custom")
+
+    def test_round_trips_through_disk(self):
+        cache = CompatibilityCache(self.cache_dir, "123", 3600)
+        cache.put(self.field, ["totalUsers"])
+        cache.save("abc", {"customEvent:foo"})
+
+        cache = CompatibilityCache(self.cache_dir, "123", 3600)
+        self.assertEqual("abc", cache.metadata_hash)
+        self.assertEqual(["totalUsers"], cache.get(self.field))
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, "compatibility_123.json")))
+
+    def test_expired_entries_are_misses(self):
+        cache = CompatibilityCache(self.cache_dir, "123", 3600)
+        with patch("tap_ga4.cache.time.time", return_value=0):
+            cache.put(self.field, ["totalUsers"])
+        with patch("tap_ga4.cache.time.time", return_value=3601):
+            self.assertIsNone(cache.get(self.field))
+
+    def test_changed_fields_are_misses(self):
+        cache = CompatibilityCache(self.cache_dir, "123", 3600)
+        cache.put(self.field, ["totalUsers"])
+        changed_field = DimensionMetadata(api_name="customEvent:foo", category="Other")
+        self.assertIsNone(cache.get(changed_field))
+
+    def test_save_drops_removed_fields(self):
+        cache = CompatibilityCache(self.cache_dir, "123", 3600)
+        cache.put(self.field, [])
+        cache.save("abc", set())
+        with open(cache.path, "r", encoding="utf-8") as infile:
+            self.assertEqual({}, json.load(infile)["fields"])
+
+    def test_from_config(self):
+        self.assertIsNone(CompatibilityCache.from_config({"property_id": "123"}))
+        cache = CompatibilityCache.from_config({"property_id": "123",
+                                                "cache_dir": self.cache_dir,
+                                                "compatibility_cache_ttl_hours": "2"})
+        self.assertEqual(7200, cache.ttl)
+
+
+class TestCachedFieldExclusions(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.dimension = DimensionMetadata(api_name="customEvent:foo")
+        self.metric = MetricMetadata(api_name="customEvent:bar")
+        self.client = MagicMock()
+        self.client.check_dimension_compatibility.return_value = make_compatibility_response()
+        self.client.check_metric_compatibility.return_value = make_compatibility_response(dimensions=["customEvent:foo"])
+
+    def test_cached_fields_are_not_checked_again(self):
+        cache = CompatibilityCache(self.cache_dir, "123", 3600)
+        first = get_field_exclusions(self.client, "123", [self.dimension], [self.metric], cache)
+        self.assertEqual(1, self.client.check_dimension_compatibility.call_count)
+        self.assertEqual(1, self.client.check_metric_compatibility.call_count)
+
+        cache = CompatibilityCache(self.cache_dir, "123", 3600)
+        second = get_field_exclusions(self.client, "123", [self.dimension], [self.metric], cache)
+        self.assertEqual(1, self.client.check_dimension_compatibility.call_count)
+        self.assertEqual(1, self.client.check_metric_compatibility.call_count)
+        self.assertEqual(first, second)
+        self.assertEqual(["custom_event_foo"], second["custom_event_bar"])
+
+    def test_new_fields_are_added_to_cached_exclusions(self):
+        cache = CompatibilityCache(self.cache_dir, "123", 3600)
+        get_field_exclusions(self.client, "123", [self.dimension], [], cache)
+
+        cache = CompatibilityCache(self.cache_dir, "123", 3600)
+        field_exclusions = get_field_exclusions(self.client, "123", [self.dimension], [self.metric], cache)
+        self.assertEqual(1, self.client.check_dimension_compatibility.call_count)
+        self.assertEqual(["custom_event_bar"], field_exclusions["custom_event_foo"])
+
+        cache = CompatibilityCache(self.cache_dir, "123", 3600)
+        self.assertEqual(["customEvent:bar"], cache.get(self.dimension))
+
+    def test_fields_compatible_again_are_removed_from_cached_exclusions(self):
+        self.client.check_dimension_compatibility.return_value = make_compatibility_response(metrics=["customEvent:bar"])
+        cache = CompatibilityCache(self.cache_dir, "123", 3600)
+        get_field_exclusions(self.client, "123", [self.dimension], [self.metric], cache)
+        self.assertEqual(["customEvent:bar"], cache.get(self.dimension))
+
+        # GA4 changed the metric, which is now compatible with the dimension
+        changed_metric = MetricMetadata(api_name="customEvent:bar", category="Changed")
+        self.client.check_metric_compatibility.return_value = make_compatibility_response()
+        cache = CompatibilityCache(self.cache_dir, "123", 3600)
+        field_exclusions = get_field_exclusions(self.client, "123", [self.dimension], [changed_metric], cache)
+        self.assertEqual(1, self.client.check_dimension_compatibility.call_count)
+        self.assertEqual(2, self.client.check_metric_compatibility.call_count)
+        self.assertEqual([], field_exclusions["custom_event_foo"])
+        self.assertEqual([], CompatibilityCache(self.cache_dir, "123", 3600).get(self.dimension))
+
+
+METADATA = Metadata(dimensions=[{"api_name": "date"}, {"api_name": "customEvent:foo"}],
+                    metrics=[{"api_name": "totalUsers"}])
+
+
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.client = MagicMock()
+        self.client.get_dimensions_and_metrics.return_value = METADATA
+
+    def test_metadata_is_read_from_disk_while_fresh(self):
+        self.assertEqual(METADATA, get_metadata(self.client, "123", MetadataCache(self.cache_dir, "123", 3600)))
+        self.assertEqual(METADATA, get_metadata(self.client, "123", MetadataCache(self.cache_dir, "123", 3600)))
+        self.assertEqual(1, self.client.get_dimensions_and_metrics.call_count)
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, "metadata_123.pb")))
+
+    def test_expired_and_refreshed_metadata_is_fetched_again(self):
+        get_metadata(self.client, "123", MetadataCache(self.cache_dir, "123", 3600))
+        with patch("tap_ga4.cache.time.time", return_value=time.time() + 3601):
+            get_metadata(self.client, "123", MetadataCache(self.cache_dir, "123", 3600))
+        get_metadata(self.client, "123", MetadataCache(self.cache_dir, "123", 3600, refresh=True))
+        self.assertEqual(3, self.client.get_dimensions_and_metrics.call_count)
+
+    def test_from_config(self):
+        self.assertIsNone(MetadataCache.from_config({"property_id": "123"}))
+        cache = MetadataCache.from_config({"property_id": "123",
+                                           "cache_dir": self.cache_dir,
+                                           "refresh_metadata_cache": "true"})
+        self.assertEqual(24 * 3600, cache.ttl)
+        self.assertTrue(cache.refresh)
+
+
+class TestValidateSelectedFields(unittest.TestCase):
+
+    def setUp(self):
+        self.config = {"property_id": "123", "account_id": "456", "cache_dir": tempfile.mkdtemp()}
+
+    def make_stream(self, dimension):
+        return CatalogEntry(tap_stream_id="my_report",
+                            stream="my_report",
+                            metadata=[{"breadcrumb": ["properties", "date"],
+                                       "metadata": {"inclusion": "automatic",
+                                                    "behavior": "DIMENSION",
+                                                    "tap-ga4.api-field-names": "date"}},
+                                      {"breadcrumb": ["properties", "custom"],
+                                       "metadata": {"selected": True,
+                                                    "behavior": "DIMENSION",
+                                                    "tap-ga4.api-field-names": dimension}}])
+
+    def test_missing_fields_raise_with_cached_metadata(self):
+        MetadataCache.from_config(self.config).put(METADATA)
+        validate_selected_fields(self.config, [self.make_stream("customEvent:foo")])
+        with self.assertRaisesRegex(Exception, "customEvent:bar"):
+            validate_selected_fields(self.config, [self.make_stream("customEvent:bar")])
+
+    def test_nothing_is_validated_without_cached_metadata(self):
+        validate_selected_fields(self.config, [self.make_stream("customEvent:bar")])
+        validate_selected_fields({"property_id": "123", "account_id": "456"},
+                                 [self.make_stream("customEvent:bar")])
@@ -0,0 +1,213 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import grpc
+from google.analytics.data_v1beta.types import RunReportResponse
+from google.api_core.exceptions import ResourceExhausted, TooManyRequests
+from tap_ga4.client import Client
+from tap_ga4.quota import DailyQuotaExhausted
+
+
+CONFIG = {"refresh_token": "refresh_token",
+          "oauth_client_id": "client_id",
+          "oauth_client_secret": "client_secret"}
+
+REPORT = {"name": "my_report",
+          "id": "my_report",
+          "property_id": "123456789",
+          "account_id": "123456",
+          "dimensions": [],
+          "metrics": []}
+
+
+def make_client(**config):
+    """Returns a Client for CONFIG updated with config, without a real Data API client."""
+    with patch("tap_ga4.client.BetaAnalyticsDataClient"):
+        return Client({**CONFIG, **config})
+
+
+def fake_make_request(row_count, delays=None):
+    """Returns a _make_request stand-in that echoes the request offset in row_count order."""
+    in_flight = {"current": 0, "max": 0}
+    lock = threading.Lock()
+
+    def make_request(request):
+        with lock:
+            in_flight["current"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["current"])
+        if delays:
+            time.sleep(delays.get(request.offset, 0))
+        with lock:
+            in_flight["current"] -= 1
+        response = RunReportResponse(row_count=row_count)
+        for _ in range(min(request.limit, row_count - request.offset)):
+            response.rows.append({})
+        response.metadata.currency_code = str(request.offset)
+        return response
+
+    return make_request, in_flight
+
+
+class TestReportPagination(unittest.TestCase):
+
+    def test_sequential_pagination(self):
+        client = make_client()
+        client.PAGE_SIZE = 10
+        client._make_request, in_flight = fake_make_request(row_count=35)
+        offsets = [response.metadata.currency_code
+                   for response in client.get_report(REPORT, "2022-01-01", "2022-01-07")]
+        self.assertEqual(["0", "10", "20", "30"], offsets)
+        self.assertEqual(1, in_flight["max"])
+
+    def test_concurrent_pagination_yields_in_offset_order(self):
+        client = make_client(page_concurrency=3)
+        client.PAGE_SIZE = 10
+        # Later pages finish first, the output must still be in offset order
+        delays = {10: 0.05, 20: 0.02, 30: 0.0, 40: 0.01, 50: 0.0}
+        client._make_request, in_flight = fake_make_request(row_count=60, delays=delays)
+        offsets = [response.metadata.currency_code
+                   for response in client.get_report(REPORT, "2022-01-01", "2022-01-07")]
+        self.assertEqual(["0", "10", "20", "30", "40", "50"], offsets)
+        self.assertLessEqual(in_flight["max"], 3)
+
+    def test_concurrent_pagination_single_page(self):
+        client = make_client(page_concurrency=3)
+        client.PAGE_SIZE = 10
+        client._make_request = MagicMock(side_effect=fake_make_request(row_count=10)[0])
+        responses = list(client.get_report(REPORT, "2022-01-01", "2022-01-07"))
+        self.assertEqual(1, len(responses))
+        self.assertEqual(1, client._make_request.call_count)
+
+
+class TestPageMemoryBudget(unittest.TestCase):
+
+    def test_fixed_page_size_without_budget(self):
+        client = make_client()
+        self.assertEqual(Client.PAGE_SIZE, client.get_page_size(REPORT))
+
+    def test_page_size_follows_observed_row_size(self):
+        client = make_client(page_memory_budget_mb=1)
+        report = {**REPORT, "dimensions": ["date", "country"], "metrics": ["sessions"]}
+        # No page seen yet: 3 values of 32 bytes, times the memory overhead
+        self.assertEqual(1024 * 1024 // (3 * 32 * 4), client.get_page_size(report))
+
+        response = RunReportResponse(row_count=100)
+        for _ in range(100):
+            response.rows.append({"dimension_values": [{"value": "x" * 200}]})
+        client.record_page(report, [("2022-01-01", "2022-01-07")], response)
+
+        row_bytes = client.estimate_page_bytes(response) // 100
+        self.assertEqual(1024 * 1024 // row_bytes, client.get_page_size(report))
+        self.assertEqual(client.estimate_page_bytes(response), client.peak_page_bytes)
+
+    def test_page_size_is_bounded(self):
+        client = make_client(page_memory_budget_mb=100000)
+        self.assertEqual(Client.MAX_PAGE_SIZE, client.get_page_size(REPORT))
+        client = make_client(page_memory_budget_mb=1)
+        client.row_bytes_estimates[REPORT["id"]] = 1024 * 1024
+        self.assertEqual(Client.MIN_PAGE_SIZE, client.get_page_size(REPORT))
+
+
+class TestCompatibilityRateLimit(unittest.TestCase):
+
+    def test_compatibility_requests_are_spaced_out(self):
+        client = make_client(compatibility_requests_per_second="20")
+        start = time.monotonic()
+        for _ in range(5):
+            client.check_dimension_compatibility("123456789", MagicMock(api_name="city"))
+        # The first request goes out immediately, the next four wait 50ms each
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(5, client.client.check_compatibility.call_count)
+
+    def test_rate_limit_is_waited_before_taking_slots(self):
+        client = make_client(compatibility_requests_per_second="20")
+        calls = []
+        with patch.object(client.compatibility_rate_limiter, "acquire", side_effect=lambda: calls.append("rate_limit")), \
+             patch.object(client.quota_governor, "acquire", side_effect=lambda: calls.append("quota")):
+            client.check_dimension_compatibility("123456789", MagicMock(api_name="city"))
+        self.assertEqual(["rate_limit", "quota"], calls)
+
+    def test_no_rate_limit_by_default(self):
+        client = make_client()
+        self.assertIsNone(client.compatibility_rate_limiter)
+        self.assertEqual(1, client.compatibility_concurrency)
+
+
+class TestWarmUp(unittest.TestCase):
+
+    def test_warm_up_refreshes_the_token_and_connects_the_channel(self):
+        client = make_client()
+        with patch.object(client.token_refresher, "start") as mock_start, \
+             patch("tap_ga4.client.threading.Thread") as mock_thread:
+            client.warm_up()
+        mock_start.assert_called_once_with()
+        self.assertEqual(client.connect_channel, mock_thread.call_args.kwargs["target"])
+        self.assertEqual((client.client.transport.grpc_channel,), mock_thread.call_args.kwargs["args"])
+        mock_thread.return_value.start.assert_called_once_with()
+
+    def test_slow_channels_do_not_fail_the_warm_up(self):
+        client = make_client()
+        with patch("tap_ga4.client.grpc.channel_ready_future") as mock_ready_future:
+            mock_ready_future.return_value.result.side_effect = grpc.FutureTimeoutError()
+            client.connect_channel(client.client.transport.grpc_channel)
+        mock_ready_future.return_value.result.assert_called_once_with(timeout=Client.CHANNEL_WARM_UP_TIMEOUT)
+
+
+class TestQuotaGovernor(unittest.TestCase):
+
+    def test_every_request_updates_the_governor(self):
+        client = make_client()
+        client.client.run_report.return_value = RunReportResponse(
+            property_quota={"tokens_per_hour": {"consumed": 12, "remaining": 3000}})
+        list(client.get_report(REPORT, "2022-01-01", "2022-01-07"))
+        state = client.get_quota_state()
+        self.assertEqual(3000, state["budgets"]["tokens_per_hour"]["remaining"])
+        self.assertEqual(12, state["tokens_per_request"])
+        self.assertEqual(0, state["in_flight"])
+
+
+class TestQuotaExhaustion(unittest.TestCase):
+
+    def setUp(self):
+        self.client = make_client()
+
+    @patch("time.sleep")
+    def test_hourly_exhaustion_is_retried_after_parking(self, _):
+        self.client.client.run_report.side_effect = [ResourceExhausted("Exhausted property tokens per hour."),
+                                                     RunReportResponse()]
+        with patch("tap_ga4.quota.QuotaGovernor.wait_for_parked_quotas") as wait_for_parked_quotas:
+            list(self.client.get_report(REPORT, "2022-01-01", "2022-01-07"))
+        self.assertEqual(2, self.client.client.run_report.call_count)
+        self.assertEqual(2, wait_for_parked_quotas.call_count)
+        self.assertIn("tokens_per_hour", self.client.quota_governor.parked_until)
+
+    def test_daily_exhaustion_is_not_retried(self):
+        self.client.client.run_report.side_effect = ResourceExhausted("Exhausted property tokens per day.")
+        with self.assertRaises(DailyQuotaExhausted):
+            list(self.client.get_report(REPORT, "2022-01-01", "2022-01-07"))
+        self.assertEqual(1, self.client.client.run_report.call_count)
+        self.assertEqual(0, self.client.quota_governor.in_flight)
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+
+    @patch("time.sleep")
+    def test_throttling_lowers_the_property_limit(self, _):
+        client = make_client(property_id="123", max_concurrent_requests="8")
+        client.client.run_report.side_effect = [TooManyRequests("slow down"), RunReportResponse()]
+        list(client.get_report(REPORT, "2022-01-01", "2022-01-07"))
+        self.assertEqual(2, int(client.property_concurrency.limit))
+        self.assertEqual(0, client.property_concurrency.in_flight)
+        self.assertEqual(0, client.project_concurrency.in_flight)
+
+    def test_latency_is_measured_from_the_rpc(self):
+        client = make_client(property_id="123")
+        client.client.run_report.return_value = RunReportResponse()
+        # Pacing waits must not count as latency
+        with patch.object(client.quota_governor, "acquire", side_effect=lambda: time.sleep(0.05)), \
+             patch.object(client.property_concurrency, "release") as mock_release:
+            before = time.monotonic()
+            list(client.get_report(REPORT, "2022-01-01", "2022-01-07"))
+        self.assertGreaterEqual(mock_release.call_args.args[0] - before, 0.05)
@@ -0,0 +1,136 @@
+import json
+import os
+import random
+import unittest
+
+from google.analytics.data_v1beta.types import (CheckCompatibilityResponse,
+                                                DimensionMetadata,
+                                                MetricMetadata)
+from google.api_core.exceptions import BadRequest
+import tap_ga4
+from tap_ga4.compatibility import GroupCompatibilitySolver
+from tap_ga4.discover import check_compatibilities
+from tap_ga4.reports import PREMADE_REPORTS
+
+
+def load_recorded_exclusions():
+    path = os.path.join(os.path.dirname(tap_ga4.__file__), "field_exclusions.json")
+    with open(path, "r", encoding="utf-8") as infile:
+        return json.load(infile)
+
+
+class RecordedCompatibilityClient:
+    """
+    Answers CheckCompatibility requests from recorded exclusions, listing
+    every field incompatible with at least one requested field.
+    """
+
+    def __init__(self, exclusions, metric_names):
+        self.exclusions = {}
+        for api_name, incompatible_fields in exclusions.items():
+            for field in incompatible_fields:
+                self.exclusions.setdefault(api_name, set()).add(field)
+                self.exclusions.setdefault(field, set()).add(api_name)
+        self.order = {api_name: i for i, api_name in enumerate(sorted(self.exclusions))}
+        self.metric_names = metric_names
+        self.request_count = 0
+
+    def check_fields_compatibility(self, _, dimension_names, metric_names):
+        self.request_count += 1
+        incompatible_fields = set()
+        for api_name in dimension_names + metric_names:
+            incompatible_fields.update(self.exclusions.get(api_name, set()))
+        incompatible_fields = sorted(incompatible_fields, key=self.order.get)
+        return CheckCompatibilityResponse(
+            dimension_compatibilities=[{"dimension_metadata": {"api_name": name}}
+                                       for name in incompatible_fields if name not in self.metric_names],
+            metric_compatibilities=[{"metric_metadata": {"api_name": name}}
+                                    for name in incompatible_fields if name in self.metric_names])
+
+    def check_dimension_compatibility(self, property_id, dimension):
+        return self.check_fields_compatibility(property_id, [dimension.api_name], [])
+
+    def check_metric_compatibility(self, property_id, metric):
+        return self.check_fields_compatibility(property_id, [], [metric.api_name])
+
+
+class TestGroupCompatibilitySolver(unittest.TestCase):
+
+    def setUp(self):
+        recorded_exclusions = load_recorded_exclusions()
+        metric_names = {metric for report in PREMADE_REPORTS for metric in report["metrics"]}
+        metric_names.update(name for name in recorded_exclusions if name.startswith(("advertiser", "organic")))
+        self.client = RecordedCompatibilityClient(recorded_exclusions, metric_names)
+        self.dimensions = [DimensionMetadata(api_name=name) for name in recorded_exclusions
+                           if name not in metric_names]
+        self.metrics = [MetricMetadata(api_name=name) for name in recorded_exclusions
+                        if name in metric_names]
+
+    def test_matches_per_field_checks_on_recorded_metadata(self):
+        expected = check_compatibilities(self.client, "123", self.dimensions, self.metrics)
+        per_field_requests = self.client.request_count
+
+        for group_size in [4, 16, 64]:
+            for seed in range(2):
+                rng = random.Random(seed)
+                dimensions = rng.sample(self.dimensions, len(self.dimensions))
+                metrics = rng.sample(self.metrics, len(self.metrics))
+                solver = GroupCompatibilitySolver(self.client, "123", group_size)
+                exclusions = solver.solve(dimensions, metrics)
+                self.assertEqual(expected, {name: exclusions[name] for name in expected})
+                self.assertEqual([field.api_name for field in dimensions + metrics], list(exclusions))
+                if group_size == 16:
+                    self.assertLess(solver.request_count, per_field_requests / 2)
+
+    def test_known_exclusions_are_not_checked_again(self):
+        expected = check_compatibilities(self.client, "123", self.dimensions, self.metrics)
+        known_exclusions = {name: exclusions for i, (name, exclusions) in enumerate(expected.items()) if i % 2}
+        dimensions = [field for field in self.dimensions if field.api_name not in known_exclusions]
+        metrics = [field for field in self.metrics if field.api_name not in known_exclusions]
+
+        solver = GroupCompatibilitySolver(self.client, "123", 16)
+        solver.solve(dimensions, metrics)
+        seeded_solver = GroupCompatibilitySolver(self.client, "123", 16, known_exclusions)
+        exclusions = seeded_solver.solve(dimensions, metrics)
+        self.assertEqual({field.api_name: expected[field.api_name] for field in dimensions + metrics}, exclusions)
+        self.assertLess(seeded_solver.request_count, solver.request_count)
+
+    def test_fields_without_exclusions(self):
+        fields = [DimensionMetadata(api_name=f"customEvent:dimension{i}") for i in range(20)]
+        solver = GroupCompatibilitySolver(self.client, "123", 10)
+        self.assertEqual({field.api_name: [] for field in fields}, solver.solve(fields, []))
+        self.assertEqual(2, solver.request_count)
+
+    def test_ambiguous_groups_are_checked_one_by_one(self):
+        # b lists a, but a does not list b
+        client = RecordedCompatibilityClient({}, set())
+        client.exclusions = {"a": {"x"}, "b": {"a", "x"}, "x": {"a", "b"}}
+        client.order = {"a": 0, "b": 1, "x": 2}
+        solver = GroupCompatibilitySolver(client, "123", 2)
+        exclusions = solver.solve([DimensionMetadata(api_name="a"), DimensionMetadata(api_name="b")], [])
+        self.assertEqual({"a": ["x"], "b": ["a", "x"]}, exclusions)
+
+    def test_rejected_groups_are_checked_one_by_one(self):
+        calls = []
+
+        class RejectingClient(RecordedCompatibilityClient):
+            def check_fields_compatibility(self, property_id, dimension_names, metric_names):
+                calls.append(dimension_names + metric_names)
+                if len(calls) == self.rejected_call:
+                    raise BadRequest("invalid group")
+                return super().check_fields_compatibility(property_id, dimension_names, metric_names)
+
+        client = RejectingClient({"a": ["x"]}, set())
+        client.rejected_call = 1
+        solver = GroupCompatibilitySolver(client, "123", 2)
+        exclusions = solver.solve([DimensionMetadata(api_name="a"), DimensionMetadata(api_name="b")], [])
+        self.assertEqual({"a": ["x"], "b": []}, exclusions)
+        self.assertEqual([["a", "b"], ["a"], ["b"]], calls)
+
+        # The re-request of a group shrunk by a checked member is rejected
+        calls.clear()
+        client.rejected_call = 3
+        solver = GroupCompatibilitySolver(client, "123", 3)
+        exclusions = solver.solve([DimensionMetadata(api_name=name) for name in ["a", "x", "b"]], [])
+        self.assertEqual({"a": ["x"], "x": ["a"], "b": []}, exclusions)
+        self.assertEqual([["a", "x", "b"], ["a"], ["x", "b"], ["x"], ["b"]], calls)
@@ -0,0 +1,107 @@
+import random
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from tap_ga4.concurrency import AIMDController, get_project_controller
+
+
+def send(controller, congestion=None, kind="RunReportRequest"):
+    controller.acquire()
+    controller.release(time.monotonic(), kind, congestion)
+
+
+def send_with_latencies(controller, latencies):
+    """Sends one request per latency, one after the other, on a fake clock."""
+    clock = 0
+    times = []
+    for latency in latencies:
+        times += [clock, clock + latency]
+        clock += latency
+    with patch("tap_ga4.concurrency.time.monotonic", side_effect=times):
+        for _ in latencies:
+            send(controller)
+
+
+class TestAIMDController(unittest.TestCase):
+
+    def test_successes_increase_the_limit_additively(self):
+        controller = AIMDController("property:1", max_limit=10, initial_limit=2)
+        for _ in range(5):
+            send(controller)
+        # 2 -> 2.5 -> 2.9 -> 3.24 -> 3.55 -> 3.83
+        self.assertEqual(3, int(controller.limit))
+        for _ in range(200):
+            send(controller)
+        self.assertEqual(10, controller.limit)
+
+    def test_throttling_halves_the_limit_once_per_burst(self):
+        controller = AIMDController("property:1", max_limit=10, initial_limit=8)
+        for _ in range(4):
+            controller.acquire()
+        start_times = [time.monotonic() for _ in range(4)]
+        for start_time in start_times:
+            controller.release(start_time, "RunReportRequest", "too_many_requests")
+        self.assertEqual(4, controller.limit)
+        send(controller, "too_many_requests")
+        self.assertEqual(2, controller.limit)
+
+    def test_sustained_slow_requests_decrease_the_limit(self):
+        controller = AIMDController("property:1", max_limit=100, initial_limit=2)
+        send_with_latencies(controller, [1] * 50)
+        limit = controller.limit
+        # Two slow requests in a row are not enough
+        send_with_latencies(controller, [10, 10, 1])
+        self.assertGreater(controller.limit, limit)
+        limit = controller.limit
+        send_with_latencies(controller, [10, 10, 10])
+        self.assertEqual((limit + 1 / limit + 1 / (limit + 1 / limit)) * 0.75, controller.limit)
+        # Other kinds of requests have their own latencies
+        self.assertEqual({"RunReportRequest"}, set(controller.latency_monitors))
+
+    def test_mixed_page_latencies_do_not_collapse_the_limit(self):
+        controller = AIMDController("property:1", max_limit=10, initial_limit=5)
+        rng = random.Random(0)
+        # Mostly small pages, with full pages taking several seconds more
+        latencies = [rng.uniform(2, 6) if rng.random() < 0.3 else rng.uniform(0.2, 0.5) for _ in range(500)]
+        with patch.object(controller, "decrease", wraps=controller.decrease) as mock_decrease:
+            send_with_latencies(controller, latencies)
+        mock_decrease.assert_not_called()
+        self.assertEqual(10, controller.limit)
+
+    def test_limit_bounds_in_flight_requests(self):
+        controller = AIMDController("property:1", max_limit=3, initial_limit=3)
+        in_flight = {"current": 0, "max": 0}
+        lock = threading.Lock()
+
+        def request():
+            controller.acquire()
+            start_time = time.monotonic()
+            with lock:
+                in_flight["current"] += 1
+                in_flight["max"] = max(in_flight["max"], in_flight["current"])
+            time.sleep(0.01)
+            with lock:
+                in_flight["current"] -= 1
+            controller.release(start_time, "RunReportRequest")
+
+        threads = [threading.Thread(target=request) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(3, in_flight["max"])
+
+    def test_limit_changes_are_logged_as_metrics(self):
+        controller = AIMDController("property:1", max_limit=10, initial_limit=4)
+        with self.assertLogs(level="INFO") as logs:
+            send(controller, "server_error")
+        self.assertIn('"metric": "concurrency_limit", "value": 2', logs.output[0])
+        self.assertIn('"reason": "server_error"', logs.output[0])
+
+    def test_project_controllers_are_shared(self):
+        self.assertIs(get_project_controller("client_a", 10), get_project_controller("client_a", 10))
+        self.assertIsNot(get_project_controller("client_a", 10), get_project_controller("client_b", 10))
+        # Metrics are tagged with a hash of the OAuth client id
+        self.assertNotIn("client_a", get_project_controller("client_a", 10).scope)
@@ -1,5 +1,10 @@
 import unittest
-from tap_ga4 import maybe_parse_report_definitions
+from argparse import Namespace
+from unittest.mock import patch
+
+from singer import Catalog
+from tap_ga4 import main_impl, maybe_parse_report_definitions
+from tap_ga4.quota import DailyQuotaExhausted
 
 
 class TestMaybeParseReportDefinitions(unittest.TestCase):
@@ -46,3 +51,15 @@ class TestMaybeParseReportDefinitions(unittest.TestCase):
         maybe_parse_report_definitions(self.config_with_bad_type)
         self.assertIsInstance(self.config_with_bad_type["report_definitions"], int)
         self.assertEqual(self.config_with_bad_type["start_date"], '2024-02-24T00:00:00Z')
+
+
+class TestMainImpl(unittest.TestCase):
+
+    @patch("tap_ga4.Client")
+    @patch("tap_ga4.sync", side_effect=DailyQuotaExhausted(0))
+    def test_daily_quota_exhaustion_fails_the_sync(self, mock_sync, _):
+        args = Namespace(config={"property_id": "123"}, catalog=Catalog([]), state={}, discover=False)
+        with patch("tap_ga4.utils.parse_args", return_value=args), self.assertRaises(SystemExit) as context:
+            main_impl()
+        self.assertEqual(1, context.exception.code)
+        mock_sync.assert_called_once()
@@ -0,0 +1,96 @@
+import json
+import multiprocessing
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from google.analytics.data_v1beta.types import PropertyQuota
+from tap_ga4.coordinator import QuotaCoordinator
+from tap_ga4.quota import DailyQuotaExhausted, QuotaGovernor
+
+# 2024-01-01 10:30:00 UTC
+NOW = datetime(2024, 1, 1, 10, 30, tzinfo=timezone.utc).timestamp()
+TOP_OF_HOUR = NOW + 1800
+
+
+def make_coordinator(coordination_dir, property_id="123"):
+    return QuotaCoordinator(coordination_dir, property_id, "oauth_client", 0.2)
+
+
+def reserve_many(coordination_dir, count):
+    coordinator = make_coordinator(coordination_dir)
+    for _ in range(count):
+        coordinator.reserve(0)
+
+
+class TestQuotaCoordinator(unittest.TestCase):
+
+    def setUp(self):
+        self.coordination_dir = tempfile.mkdtemp()
+
+    def test_budgets_are_shared_between_processes(self):
+        first, second = make_coordinator(self.coordination_dir), make_coordinator(self.coordination_dir)
+        with patch("tap_ga4.coordinator.time.time", return_value=NOW):
+            first.release([PropertyQuota(tokens_per_hour={"consumed": 10, "remaining": 5000})])
+            first.release([PropertyQuota(tokens_per_hour={"consumed": 10, "remaining": 90})])
+        # 90 tokens are 9 requests over the 30 minutes until the top of the hour
+        self.assertEqual(NOW, second.reserve(NOW))
+        # The 10 tokens reserved by the last request leave 8 requests
+        self.assertEqual(NOW + 200, second.reserve(NOW))
+        self.assertEqual(NOW + 200 + 225, first.reserve(NOW))
+
+    def test_project_quotas_are_shared_between_properties(self):
+        first = make_coordinator(self.coordination_dir, "123")
+        second = make_coordinator(self.coordination_dir, "456")
+        with patch("tap_ga4.coordinator.time.time", return_value=NOW):
+            first.release([PropertyQuota(tokens_per_hour={"consumed": 10, "remaining": 5000},
+                                         tokens_per_project_per_hour={"consumed": 10, "remaining": 2})])
+        second.reserve(NOW)
+        self.assertEqual(TOP_OF_HOUR, second.reserve(NOW))
+        with open(second.paths["property"], "r", encoding="utf-8") as infile:
+            self.assertEqual({}, json.load(infile)["budgets"])
+
+    def test_exhausted_quotas_are_parked_for_every_process(self):
+        first, second = make_coordinator(self.coordination_dir), make_coordinator(self.coordination_dir)
+        first.exhaust("tokens_per_hour", TOP_OF_HOUR)
+        self.assertEqual(TOP_OF_HOUR, second.reserve(NOW))
+        self.assertEqual(TOP_OF_HOUR + 1, second.reserve(TOP_OF_HOUR + 1))
+
+        first.exhaust("tokens_per_day", TOP_OF_HOUR)
+        with self.assertRaises(DailyQuotaExhausted):
+            second.reserve(NOW)
+
+    def test_nothing_is_reserved_when_the_property_ran_out_of_daily_quota(self):
+        coordinator = make_coordinator(self.coordination_dir)
+        with patch("tap_ga4.coordinator.time.time", return_value=NOW):
+            coordinator.release([PropertyQuota(tokens_per_project_per_hour={"consumed": 10, "remaining": 5000})])
+        coordinator.exhaust("tokens_per_day", TOP_OF_HOUR)
+        with open(coordinator.paths["project"], "r", encoding="utf-8") as infile:
+            project_state = json.load(infile)
+        with self.assertRaises(DailyQuotaExhausted):
+            coordinator.reserve(NOW)
+        with open(coordinator.paths["project"], "r", encoding="utf-8") as infile:
+            self.assertEqual(project_state, json.load(infile))
+
+    def test_reservations_are_serialized_across_processes(self):
+        coordinator = make_coordinator(self.coordination_dir)
+        with patch("tap_ga4.coordinator.time.time", return_value=NOW):
+            coordinator.release([PropertyQuota(tokens_per_hour={"consumed": 1, "remaining": 100000})])
+        processes = [multiprocessing.Process(target=reserve_many, args=(self.coordination_dir, 25))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        with open(coordinator.paths["property"], "r", encoding="utf-8") as infile:
+            self.assertEqual(100000 - 100, json.load(infile)["budgets"]["tokens_per_hour"]["remaining"])
+
+    def test_governor_waits_for_the_shared_schedule(self):
+        make_coordinator(self.coordination_dir).exhaust("tokens_per_hour", TOP_OF_HOUR)
+        governor = QuotaGovernor(coordinator=make_coordinator(self.coordination_dir))
+        with patch("tap_ga4.quota.time.time", return_value=NOW), \
+             patch("tap_ga4.quota.time.sleep") as mock_sleep:
+            governor.acquire()
+            governor.release()
+        self.assertEqual(1800, sum(call.args[0] for call in mock_sleep.call_args_list))
@@ -1,6 +1,14 @@
+import threading
+import time
 import unittest
+from unittest.mock import MagicMock
 
-from tap_ga4.discover import is_valid_alphanumeric_name, to_snake_case
+from google.analytics.data_v1beta.types import (CheckCompatibilityResponse,
+                                                DimensionMetadata,
+                                                MetricMetadata)
+from google.api_core.exceptions import BadRequest
+from tap_ga4.discover import (check_compatibilities, is_valid_alphanumeric_name,
+                              to_snake_case)
 
 
 class TestCanonicalization(unittest.TestCase):
@@ -44,3 +52,43 @@ class TestInvalidMetrics(unittest.TestCase):
     def test_invalid_metric_non_ascii(self):
         api_name = "ÜwÜ"
         self.assertFalse(is_valid_alphanumeric_name(api_name))
+
+
+class TestCheckCompatibilities(unittest.TestCase):
+
+    def setUp(self):
+        self.dimensions = [DimensionMetadata(api_name=f"customEvent:dimension{i}") for i in range(8)]
+        self.metrics = [MetricMetadata(api_name=f"customEvent:metric{i}") for i in range(8)]
+        self.in_flight = {"current": 0, "max": 0}
+        lock = threading.Lock()
+
+        def check_compatibility(_, field):
+            with lock:
+                self.in_flight["current"] += 1
+                self.in_flight["max"] = max(self.in_flight["max"], self.in_flight["current"])
+            # Later fields finish first
+            time.sleep(0.01 * (8 - int(field.api_name[-1])))
+            with lock:
+                self.in_flight["current"] -= 1
+            return CheckCompatibilityResponse(
+                dimension_compatibilities=[{"dimension_metadata": {"api_name": f"{field.api_name}:incompatible"}}])
+
+        self.client = MagicMock()
+        self.client.check_dimension_compatibility.side_effect = check_compatibility
+        self.client.check_metric_compatibility.side_effect = check_compatibility
+
+    def test_results_follow_field_order(self):
+        sequential = check_compatibilities(self.client, "123", self.dimensions, self.metrics)
+        concurrent = check_compatibilities(self.client, "123", self.dimensions, self.metrics, max_workers=4)
+        self.assertEqual(list(sequential.items()), list(concurrent.items()))
+        self.assertEqual([field.api_name for field in self.dimensions + self.metrics], list(concurrent))
+        self.assertEqual(["customEvent:metric3:incompatible"], concurrent["customEvent:metric3"])
+
+    def test_concurrency_is_bounded(self):
+        check_compatibilities(self.client, "123", self.dimensions, self.metrics, max_workers=4)
+        self.assertEqual(4, self.in_flight["max"])
+
+    def test_failures_are_raised(self):
+        self.client.check_metric_compatibility.side_effect = BadRequest("invalid metric")
+        with self.assertRaises(BadRequest):
+            check_compatibilities(self.client, "123", self.dimensions, self.metrics, max_workers=4)
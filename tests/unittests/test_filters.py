@@ -0,0 +1,114 @@
+from collections import defaultdict
+import json
+import unittest
+
+from google.analytics.data_v1beta.types import DimensionMetadata, FilterExpression, MetricMetadata
+from singer import Catalog, metadata
+from tap_ga4.client import BaseClient
+from tap_ga4.discover import generate_catalog, validate_filter_compatibility
+from tap_ga4.filters import compile_filter_expression, get_filter_field_names, validate_report_filters
+from tap_ga4.sync import build_report, validate_selected_fields
+
+EVENT_FILTER = {"orGroup": {"expressions": [
+    {"filter": {"fieldName": "eventName", "inListFilter": {"values": ["purchase", "refund"]}}},
+    {"notExpression": {"filter": {"field_name": "country",
+                                  "string_filter": {"value": "US", "match_type": "EXACT"}}}}]}}
+SESSIONS_FILTER = {"filter": {"fieldName": "sessions",
+                              "numericFilter": {"operation": "GREATER_THAN", "value": {"int64Value": "10"}}}}
+
+
+class TestCompileFilterExpression(unittest.TestCase):
+
+    def test_compiles_json_filters(self):
+        expression = compile_filter_expression(EVENT_FILTER)
+        self.assertIsInstance(expression, FilterExpression)
+        self.assertEqual(["eventName", "country"], get_filter_field_names(expression))
+        self.assertEqual(expression, compile_filter_expression(json.dumps(EVENT_FILTER)))
+
+    def test_invalid_filters_raise(self):
+        for expression in [{"filtr": {"fieldName": "eventName"}},
+                           {},
+                           {"andGroup": {"expressions": [{}]}},
+                           {"filter": {"stringFilter": {"value": "purchase"}}},
+                           "{not json"]:
+            with self.subTest(expression=expression), self.assertRaises(ValueError):
+                compile_filter_expression(expression)
+
+
+class TestValidateReportFilters(unittest.TestCase):
+
+    def test_valid_filters(self):
+        validate_report_filters({"name": "events", "dimension_filter": EVENT_FILTER, "metric_filter": SESSIONS_FILTER},
+                                ["eventName", "country"],
+                                ["sessions"])
+
+    def test_filters_must_use_fields_of_their_kind(self):
+        with self.assertRaisesRegex(ValueError, "not dimensions of the property: country"):
+            validate_report_filters({"name": "events", "dimension_filter": EVENT_FILTER}, ["eventName"], ["sessions"])
+        with self.assertRaisesRegex(ValueError, "not metrics of the property: sessions"):
+            validate_report_filters({"name": "events", "metric_filter": SESSIONS_FILTER}, ["sessions"], [])
+
+    def test_invalid_filters_name_the_report(self):
+        with self.assertRaisesRegex(ValueError, "Report events has an invalid dimension_filter"):
+            validate_report_filters({"name": "events", "dimension_filter": {}}, [], [])
+
+
+class TestValidateFilterCompatibility(unittest.TestCase):
+
+    def test_compatible_filters(self):
+        validate_filter_compatibility({"name": "events", "dimension_filter": EVENT_FILTER, "metric_filter": SESSIONS_FILTER},
+                                      {"event_name": ["item_name"], "item_name": ["event_name"]},
+                                      ["date", "sessions"])
+
+    def test_filter_fields_must_be_compatible_with_each_other(self):
+        with self.assertRaisesRegex(ValueError, "report events use country, which is incompatible with sessions"):
+            validate_filter_compatibility({"name": "events", "dimension_filter": EVENT_FILTER,
+                                           "metric_filter": SESSIONS_FILTER},
+                                          {"country": ["sessions"], "sessions": ["country"]})
+
+    def test_filter_fields_must_be_compatible_with_the_requested_fields(self):
+        with self.assertRaisesRegex(ValueError, "use event_name, which is incompatible with item_name"):
+            validate_filter_compatibility({"name": "events", "dimension_filter": EVENT_FILTER},
+                                          {"event_name": ["item_name"], "item_name": ["event_name"]},
+                                          ["date", "item_name"])
+
+
+class TestFilterPushDown(unittest.TestCase):
+
+    def test_filters_go_from_report_definitions_to_requests(self):
+        dimensions = [DimensionMetadata(api_name=name, category="Event") for name in ["date", "eventName", "country"]]
+        metrics = [MetricMetadata(api_name="sessions", category="Session", type_="TYPE_INTEGER")]
+        field_exclusions = defaultdict(list)
+        report_definition = {"name": "events", "id": "events_id",
+                             "dimension_filter": EVENT_FILTER, "metric_filter": SESSIONS_FILTER}
+        catalog = generate_catalog([report_definition], dimensions, metrics, [], field_exclusions)
+        stream = Catalog.from_dict(catalog.to_dict()).get_stream("events_id")
+
+        self.assertEqual(EVENT_FILTER, metadata.to_map(stream.metadata)[()]["tap-ga4.dimension-filter"])
+        self.assertEqual(SESSIONS_FILTER, metadata.to_map(stream.metadata)[()]["tap-ga4.metric-filter"])
+
+        report = build_report({"property_id": "123", "account_id": "456"}, stream)
+        request = BaseClient({}).build_report_request(report, [("2024-01-01", "2024-01-07")], 0)
+        self.assertEqual(compile_filter_expression(EVENT_FILTER), request.dimension_filter)
+        self.assertEqual(compile_filter_expression(SESSIONS_FILTER), request.metric_filter)
+
+    def test_reports_without_filters(self):
+        request = BaseClient({}).build_report_request({"name": "events", "id": "events", "property_id": "123",
+                                                       "dimensions": [], "metrics": []},
+                                                      [("2024-01-01", "2024-01-07")], 0)
+        self.assertNotIn("dimension_filter", request)
+        self.assertNotIn("metric_filter", request)
+
+    def test_selected_fields_incompatible_with_a_filter_are_rejected(self):
+        dimensions = [DimensionMetadata(api_name=name, category="Event") for name in ["date", "eventName", "itemName"]]
+        field_exclusions = defaultdict(list, {"event_name": ["item_name"], "item_name": ["event_name"]})
+        catalog = generate_catalog([{"name": "events", "id": "events_id", "dimension_filter": EVENT_FILTER}],
+                                   dimensions, [], [], field_exclusions)
+        stream = Catalog.from_dict(catalog.to_dict()).get_stream("events_id")
+        config = {"property_id": "123", "account_id": "456"}
+        validate_selected_fields(config, [stream])
+
+        stream.metadata = metadata.to_list(metadata.write(metadata.to_map(stream.metadata),
+                                                          ("properties", "item_name"), "selected", True))
+        with self.assertRaisesRegex(ValueError, "use event_name, which is incompatible with item_name"):
+            validate_selected_fields(config, [stream])
@@ -0,0 +1,48 @@
+import time
+import unittest
+
+from tap_ga4.prefetch import Prefetcher, prefetch
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def test_disabled_returns_iterable(self):
+        items = [1, 2, 3]
+        self.assertIs(items, prefetch(items, 0))
+
+    def test_preserves_order(self):
+        self.assertEqual(list(range(50)), list(prefetch(iter(range(50)), 3)))
+
+    def test_depth_bounds_read_ahead(self):
+        produced = []
+        def source():
+            for i in range(10):
+                produced.append(i)
+                yield i
+
+        prefetcher = Prefetcher(source(), depth=2)
+        iterator = iter(prefetcher)
+        self.assertEqual(0, next(iterator))
+        # Wait for the producer to block on the full buffer
+        time.sleep(0.1)
+        # 2 buffered items plus the one waiting for room
+        self.assertLessEqual(len(produced), 4)
+        self.assertEqual(list(range(1, 10)), list(iterator))
+
+    def test_memory_cap_bounds_read_ahead(self):
+        prefetcher = Prefetcher(iter([5, 5, 5, 5, 20, 5]), depth=10, max_bytes=10, sizeof=lambda item: item)
+        self.assertEqual([5, 5, 5, 5, 20, 5], list(prefetcher))
+        # The 20 byte item is only let through once the buffer is empty
+        self.assertLessEqual(prefetcher.peak_buffered_bytes, 20)
+
+    def test_errors_are_raised_after_buffered_items(self):
+        def source():
+            yield 1
+            yield 2
+            raise ValueError("boom")
+
+        consumed = []
+        with self.assertRaises(ValueError):
+            for item in prefetch(source(), 5):
+                consumed.append(item)
+        self.assertEqual([1, 2], consumed)
@@ -0,0 +1,156 @@
+import threading
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+from google.analytics.data_v1beta.types import (BatchRunReportsResponse,
+                                                PropertyQuota,
+                                                RunReportResponse)
+from google.api_core.exceptions import ResourceExhausted
+from tap_ga4.quota import (DailyQuotaExhausted, QuotaGovernor,
+                           classify_quota_error, get_property_quotas,
+                           get_reset_time)
+
+# 2024-01-01 10:30:00 UTC
+NOW = datetime(2024, 1, 1, 10, 30, tzinfo=timezone.utc).timestamp()
+
+
+def make_quota(hourly_remaining, hourly_consumed=10, daily_remaining=100000, concurrent_remaining=9):
+    return PropertyQuota(tokens_per_hour={"consumed": hourly_consumed, "remaining": hourly_remaining},
+                         tokens_per_day={"consumed": hourly_consumed, "remaining": daily_remaining},
+                         concurrent_requests={"consumed": 1, "remaining": concurrent_remaining})
+
+
+class TestQuotaGovernor(unittest.TestCase):
+
+    def test_reset_times(self):
+        self.assertEqual(datetime(2024, 1, 1, 11, tzinfo=timezone.utc).timestamp(),
+                         get_reset_time("tokens_per_hour", NOW))
+        # Midnight in Los Angeles
+        self.assertEqual(datetime(2024, 1, 2, 8, tzinfo=timezone.utc).timestamp(),
+                         get_reset_time("tokens_per_day", NOW))
+
+    def test_no_pacing_while_budgets_are_healthy(self):
+        governor = QuotaGovernor()
+        governor.acquire()
+        governor.release([make_quota(hourly_remaining=5000)])
+        self.assertEqual(0, governor.get_request_interval(NOW))
+
+    def test_pacing_spreads_remaining_tokens_until_reset(self):
+        governor = QuotaGovernor()
+        with patch("tap_ga4.quota.time.time", return_value=NOW):
+            governor.acquire()
+            governor.release([make_quota(hourly_remaining=5000)])
+            governor.acquire()
+            # 90 tokens left at 10 tokens per request is 9 requests in the
+            # 30 minutes before the hourly reset
+            governor.release([make_quota(hourly_remaining=90)])
+            self.assertEqual(200, governor.get_request_interval(NOW))
+            state = governor.get_state()
+        self.assertEqual({"remaining": 90, "capacity": 5010, "resets_in": 1800},
+                         state["budgets"]["tokens_per_hour"])
+        self.assertEqual(10, state["tokens_per_request"])
+
+    def test_acquire_sleeps_between_paced_requests(self):
+        governor = QuotaGovernor()
+        with patch("tap_ga4.quota.time.time", return_value=NOW), \
+             patch("tap_ga4.quota.time.sleep") as mock_sleep:
+            governor.acquire()
+            governor.release([make_quota(hourly_remaining=5000)])
+            governor.acquire()
+            governor.release([make_quota(hourly_remaining=90)])
+            governor.acquire()
+            governor.release()
+            governor.acquire()
+            governor.release()
+        # Slept in heartbeat intervals
+        self.assertEqual([60, 60, 60, 20], [call.args[0] for call in mock_sleep.call_args_list])
+
+    def test_budgets_are_forgotten_after_reset(self):
+        governor = QuotaGovernor()
+        with patch("tap_ga4.quota.time.time", return_value=NOW):
+            governor.acquire()
+            governor.release([make_quota(hourly_remaining=0)])
+        self.assertEqual(0, governor.get_request_interval(NOW + 1800))
+
+    def test_concurrent_requests_cap_in_flight_requests(self):
+        governor = QuotaGovernor()
+        governor.acquire()
+        governor.release([make_quota(hourly_remaining=5000, concurrent_remaining=1)])
+        self.assertEqual(2, governor.concurrency_limit)
+
+        in_flight = {"current": 0, "max": 0}
+        lock = threading.Lock()
+
+        def request():
+            governor.acquire()
+            with lock:
+                in_flight["current"] += 1
+                in_flight["max"] = max(in_flight["max"], in_flight["current"])
+            time.sleep(0.01)
+            with lock:
+                in_flight["current"] -= 1
+            governor.release()
+
+        threads = [threading.Thread(target=request) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2, in_flight["max"])
+
+    def test_get_property_quotas(self):
+        self.assertEqual([], get_property_quotas(None))
+        self.assertEqual([], get_property_quotas(RunReportResponse()))
+        response = RunReportResponse(property_quota=make_quota(hourly_remaining=1))
+        self.assertEqual([response.property_quota], get_property_quotas(response))
+        batch_response = BatchRunReportsResponse(reports=[response, response])
+        self.assertEqual(2, len(get_property_quotas(batch_response)))
+
+
+class TestQuotaExhaustion(unittest.TestCase):
+
+    def test_classify_quota_error(self):
+        cases = {"Exhausted property tokens per hour.": "tokens_per_hour",
+                 "Exhausted property tokens per day.": "tokens_per_day",
+                 "Exhausted property tokens for a project per hour.": "tokens_per_project_per_hour",
+                 "Exhausted concurrent requests quota.": "concurrent_requests",
+                 "Exhausted server errors per project per hour.": "server_errors_per_project_per_hour",
+                 "Exhausted potentially thresholded requests per hour.": "potentially_thresholded_requests_per_hour"}
+        for message, quota_name in cases.items():
+            self.assertEqual(quota_name, classify_quota_error(ResourceExhausted(message)))
+
+    def test_hourly_exhaustion_parks_requests_until_reset(self):
+        governor = QuotaGovernor()
+        governor.heartbeat = MagicMock()
+        clock = {"now": NOW}
+
+        def sleep(seconds):
+            clock["now"] += seconds
+
+        with patch("tap_ga4.quota.time.time", side_effect=lambda: clock["now"]), \
+             patch("tap_ga4.quota.time.sleep", side_effect=sleep):
+            governor.exhaust("tokens_per_hour")
+            self.assertEqual({"tokens_per_hour": NOW + 1800}, governor.get_state()["parked_until"])
+            governor.acquire()
+            governor.release()
+        # Parked for the 30 minutes until the top of the hour
+        self.assertEqual(NOW + 1800, clock["now"])
+        self.assertEqual(30, governor.heartbeat.call_count)
+
+    def test_concurrent_request_exhaustion_is_not_parked(self):
+        governor = QuotaGovernor()
+        governor.exhaust("concurrent_requests")
+        self.assertEqual({}, governor.parked_until)
+
+    def test_daily_exhaustion_raises(self):
+        governor = QuotaGovernor()
+        with patch("tap_ga4.quota.time.time", return_value=NOW):
+            with self.assertRaises(DailyQuotaExhausted) as context:
+                governor.exhaust("tokens_per_day")
+            self.assertEqual(datetime(2024, 1, 2, 8, tzinfo=timezone.utc).timestamp(),
+                             context.exception.reset_time)
+            # Later requests fail right away instead of waiting
+            with self.assertRaises(DailyQuotaExhausted):
+                governor.acquire()
@@ -0,0 +1,92 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+from google.analytics.data_v1beta.types import RunReportResponse
+from singer import CatalogEntry
+from tap_ga4.sync import plan_report_batches, sync_report_batch
+from tap_ga4.writer import Writer
+
+
+def make_response(report, range_start_date, row_count=1):
+    response = RunReportResponse({"dimension_headers": [{"name": "date"}], "row_count": row_count})
+    response.rows.append({"dimension_values": [{"value": range_start_date.replace("-", "")}]})
+    response.metadata.currency_code = report["name"]
+    return response
+
+
+class TestPlanReportBatches(unittest.TestCase):
+    config = {"start_date": "2022-01-01T00:00:00Z", "property_id": "123456789"}
+
+    def test_batches_group_streams_by_start_date(self):
+        streams = [CatalogEntry(tap_stream_id=f"stream{i}") for i in range(1, 8)]
+        state = {"bookmarks": {"stream3": {"123456789": {"last_report_date": "2021-06-01"}}}}
+
+        batches = plan_report_batches(self.config, streams, state, 3)
+        actual = [[stream.tap_stream_id for stream in batch] for batch in batches]
+        self.assertEqual([["stream1", "stream2", "stream4"],
+                          ["stream3"],
+                          ["stream5", "stream6", "stream7"]],
+                         actual)
+
+
+class TestSyncReportBatch(unittest.TestCase):
+
+    def test_paginating_report_falls_back_to_single_requests(self):
+        reports = [{"name": name, "id": name, "property_id": "123456789", "account_id": "123456"}
+                   for name in ["small1", "big", "small2"]]
+        schema = {"type": "object", "properties": {}}
+        client = MagicMock()
+        client.PAGE_SIZE = 10
+        client.batch_get_reports.side_effect = lambda batch, range_start, range_end: [
+            make_response(report, range_start, row_count=25 if report["name"] == "big" else 1)
+            for report in batch]
+        client.get_remaining_pages.side_effect = lambda report, date_ranges, first_page: [
+            make_response(report, date_ranges[0][0]) for _ in range(first_page.row_count // 10)]
+        client.get_report.side_effect = lambda report, range_start, range_end: [make_response(report, range_start)]
+
+        state = {}
+        output = io.StringIO()
+        with redirect_stdout(output):
+            sync_report_batch(client,
+                              [schema] * 3,
+                              reports,
+                              datetime(2022, 1, 1, tzinfo=timezone.utc),
+                              datetime(2022, 1, 14, tzinfo=timezone.utc),
+                              7,
+                              Writer(state))
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        batches = [[report["name"] for report in call.args[0]] for call in client.batch_get_reports.call_args_list]
+        self.assertEqual([["small1", "big", "small2"], ["small1", "small2"]], batches)
+        client.get_report.assert_called_once()
+        self.assertEqual("big", client.get_report.call_args.args[0]["name"])
+
+        record_streams = [message["stream"] for message in messages if message["type"] == "RECORD"]
+        self.assertEqual(["small1", "big", "big", "big", "small2", "small1", "big", "small2"], record_streams)
+        for report in reports:
+            self.assertEqual("2022-01-14", state["bookmarks"][report["id"]]["123456789"]["last_report_date"])
+
+    def test_saved_window_sizes_are_kept(self):
+        reports = [{"name": name, "id": name, "property_id": "123456789", "account_id": "123456"}
+                   for name in ["adaptive", "fixed"]]
+        client = MagicMock()
+        client.batch_get_reports.side_effect = lambda batch, range_start, range_end: [
+            make_response(report, range_start) for report in batch]
+        client.get_remaining_pages.return_value = []
+
+        state = {"bookmarks": {"adaptive": {"123456789": {"last_report_date": "2021-12-31", "request_window_size": 14}}}}
+        with redirect_stdout(io.StringIO()):
+            sync_report_batch(client,
+                              [{"type": "object", "properties": {}}] * 2,
+                              reports,
+                              datetime(2022, 1, 1, tzinfo=timezone.utc),
+                              datetime(2022, 1, 7, tzinfo=timezone.utc),
+                              7,
+                              Writer(state))
+        self.assertEqual({"last_report_date": "2022-01-07", "request_window_size": 14},
+                         state["bookmarks"]["adaptive"]["123456789"])
+        self.assertEqual({"last_report_date": "2022-01-07"}, state["bookmarks"]["fixed"]["123456789"])
@@ -1,11 +1,20 @@
+import random
 import unittest
 from datetime import datetime, timedelta, timezone
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
+from google.analytics.data_v1beta.types import RunReportResponse
 from singer import CatalogEntry, utils
-from tap_ga4.sync import (DEFAULT_CONVERSION_WINDOW, generate_sdc_record_hash,
-                          get_report_start_date, generate_report_dates,
-                          sort_and_shuffle_streams)
+from tap_ga4.sync import (DATETIME_FORMATS, DEFAULT_CONVERSION_WINDOW,
+                          RecordHasher, generate_sdc_record_hash,
+                          get_record_builder, get_report_start_date,
+                          generate_report_dates, get_report_pages,
+                          parse_datetime, sort_and_shuffle_streams,
+                          to_snake_case)
+
+
+def hash_values(hasher, dimension_values):
+    return hasher.hash_entries([hasher.lookup(value) for value in dimension_values])
 
 
 class TestRecordHashing(unittest.TestCase):
@@ -28,6 +37,72 @@ class TestRecordHashing(unittest.TestCase):
         expected_hash = "0854e5a26abcccf6990128ab5581b429698e05a6436fc09defe5a22d7f479f9e"
         self.assertEqual(expected_hash, generate_sdc_record_hash(test_record, dimension_pairs))
 
+        hasher = RecordHasher("123456789", "123456", [key for key, _ in dimension_pairs])
+        self.assertEqual(expected_hash, hash_values(hasher, [value for _, value in dimension_pairs]))
+
+        response = RunReportResponse(dimension_headers=[{"name": key} for key, _ in dimension_pairs])
+        response.rows.append({"dimension_values": [{"value": value} for _, value in dimension_pairs]})
+        builder = get_record_builder("my_report", "123456789", "123456",
+                                     tuple(key for key, _ in dimension_pairs), ())
+        # Records hash their snake_case keys
+        self.assertEqual("f5515da2a16a6280deb7331b907173ebba40fb2296abef9a7776221df86bc679",
+                         next(builder.build_records(response))["_sdc_record_hash"])
+
+
+class TestRecordHasher(unittest.TestCase):
+    """
+    Property-based check that RecordHasher hashes the same bytes as
+    generate_sdc_record_hash, over random keys, values and ids.
+    """
+    ALPHABET = ("abcxyz_09 \"\\/\b\f\n\r\t\x00\x1f\x7f"
+                "\u00e9\u00df\u65e5\u672c\u2028\u2029\ufeff\U0001f600\U00010348")
+    # Keys that sort right around the constant pairs
+    KEYS = ["account_i", "account_ids", "accounts", "property", "property_id0", "a", "z", "date", "country"]
+
+    def random_string(self, rng, max_length=12):
+        return "".join(rng.choice(self.ALPHABET) for _ in range(rng.randint(0, max_length)))
+
+    def test_matches_generate_sdc_record_hash(self):
+        rng = random.Random(0)
+        for _ in range(500):
+            keys = rng.sample(self.KEYS, rng.randint(0, 4))
+            keys += [self.random_string(rng) for _ in range(rng.randint(0, 4))]
+            keys = [key for key in dict.fromkeys(keys) if key not in ("property_id", "account_id")]
+            property_id = rng.choice(["123456789", 123456789, self.random_string(rng)])
+            account_id = rng.choice(["123456", 123456, self.random_string(rng)])
+            hasher = RecordHasher(property_id, account_id, keys)
+            for _ in range(5):
+                values = [self.random_string(rng) for _ in keys]
+                with self.subTest(keys=keys, values=values, property_id=property_id, account_id=account_id):
+                    expected = generate_sdc_record_hash({"property_id": property_id, "account_id": account_id},
+                                                        list(zip(keys, values)))
+                    self.assertEqual(expected, hash_values(hasher, values))
+
+    def test_values_are_interned_in_a_bounded_dictionary(self):
+        hasher = RecordHasher("123", "456", ["country"])
+        first = "".join(["United ", "States"])
+        second = "".join(["United ", "States"])
+        self.assertIsNot(first, second)
+        self.assertIs(first, hasher.lookup(first)[0])
+        self.assertIs(first, hasher.lookup(second)[0])
+        self.assertEqual('"United States"', hasher.lookup(second)[1])
+
+        with patch.object(RecordHasher, "VALUE_CACHE_SIZE", 2):
+            hasher = RecordHasher("123", "456", ["country"])
+        for country in ["a", "b", "c", "a"]:
+            hash_values(hasher, [country])
+        self.assertEqual(2, hasher.lookup.cache_info().currsize)
+        self.assertEqual(0, hasher.lookup.cache_info().hits)
+
+    def test_duplicate_keys_fall_back_to_sorting_values(self):
+        for keys in (["date", "date"], ["account_id"], ["property_id", "date"]):
+            hasher = RecordHasher("123", "456", keys)
+            self.assertFalse(hasher.is_compiled)
+            for values in (["b", "a"][:len(keys)], ["a", "b"][:len(keys)]):
+                expected = generate_sdc_record_hash({"property_id": "123", "account_id": "456"},
+                                                    list(zip(keys, values)))
+                self.assertEqual(expected, hash_values(hasher, values))
+
 
 class TestConversionWindow(unittest.TestCase):
     """
@@ -148,6 +223,165 @@ class TestGenerateReportDates(unittest.TestCase):
 
         self.assertEqual(expected_ranges, actual_ranges)
 
+class TestGetReportPages(unittest.TestCase):
+
+    def test_window_completion_markers(self):
+        start_date = datetime(2022, 1, 1, 0, 0, 0, 0, tzinfo=timezone.utc)
+        end_date = datetime(2022, 1, 12, 0, 0, 0, 0, tzinfo=timezone.utc)
+        client = MagicMock()
+        client.get_report.side_effect = lambda report, range_start, range_end: [f"{range_start}-1", f"{range_start}-2"]
+
+        expected_pages = [("2022-01-07", "2022-01-01-1"),
+                          ("2022-01-07", "2022-01-01-2"),
+                          ("2022-01-07", None),
+                          ("2022-01-12", "2022-01-08-1"),
+                          ("2022-01-12", "2022-01-08-2"),
+                          ("2022-01-12", None)]
+        self.assertEqual(expected_pages, list(get_report_pages(client, {}, start_date, end_date, 7)))
+
+
+    def test_multiple_date_ranges_per_request(self):
+        start_date = datetime(2022, 1, 1, 0, 0, 0, 0, tzinfo=timezone.utc)
+        end_date = datetime(2022, 1, 14, 0, 0, 0, 0, tzinfo=timezone.utc)
+        client = MagicMock()
+        # One page per window with rows, the 2nd window of the 1st request has none
+        client.get_date_ranges_report.side_effect = lambda report, date_ranges: [
+            make_date_ranges_page(date_ranges[0][0], [i] * 2)
+            for i in range(len(date_ranges)) if (date_ranges[0][0], i) != ("2022-01-01", 1)]
+        client.get_report.side_effect = lambda report, range_start, range_end: [f"{range_start}-1"]
+
+        pages = [(range_end_date, get_page_label(response))
+                 for range_end_date, response in get_report_pages(client, {}, start_date, end_date, 2, 3)]
+        self.assertEqual([("2022-01-02", "2022-01-01 [0, 0]"),
+                          ("2022-01-02", None),
+                          ("2022-01-04", None),
+                          ("2022-01-06", "2022-01-01 [2, 2]"),
+                          ("2022-01-06", None),
+                          ("2022-01-08", "2022-01-07 [0, 0]"),
+                          ("2022-01-08", None),
+                          ("2022-01-10", "2022-01-07 [1, 1]"),
+                          ("2022-01-10", None),
+                          ("2022-01-12", "2022-01-07 [2, 2]"),
+                          ("2022-01-12", None),
+                          ("2022-01-14", "2022-01-13-1"),
+                          ("2022-01-14", None)],
+                         pages)
+        self.assertEqual([("2022-01-01", "2022-01-02"), ("2022-01-03", "2022-01-04"), ("2022-01-05", "2022-01-06")],
+                         client.get_date_ranges_report.call_args_list[0].args[1])
+
+    def test_windows_are_completed_as_soon_as_rows_move_past_them(self):
+        start_date = datetime(2022, 1, 1, 0, 0, 0, 0, tzinfo=timezone.utc)
+        end_date = datetime(2022, 1, 8, 0, 0, 0, 0, tzinfo=timezone.utc)
+        client = MagicMock()
+        # Pages that straddle windows, and an empty last page
+        client.get_date_ranges_report.return_value = [make_date_ranges_page("2022-01-01", [0, 0, 0]),
+                                                      make_date_ranges_page("2022-01-01", [0, 2, 3]),
+                                                      make_date_ranges_page("2022-01-01", [3]),
+                                                      make_date_ranges_page("2022-01-01", [])]
+
+        pages = [(range_end_date, get_page_label(response))
+                 for range_end_date, response in get_report_pages(client, {}, start_date, end_date, 2, 4)]
+        self.assertEqual([("2022-01-02", "2022-01-01 [0, 0, 0]"),
+                          ("2022-01-02", "2022-01-01 [0, 2, 3]"),
+                          ("2022-01-02", None),
+                          ("2022-01-04", None),
+                          ("2022-01-06", None),
+                          ("2022-01-08", "2022-01-01 [3]"),
+                          ("2022-01-08", "2022-01-01 []"),
+                          ("2022-01-08", None)],
+                         pages)
+
+
+def make_date_ranges_page(label, date_range_indexes):
+    """A multiple date range page with one row per date range index, labeled in its metadata."""
+    response = RunReportResponse(dimension_headers=[{"name": "date"}, {"name": "dateRange"}])
+    response.metadata.currency_code = label
+    for i in date_range_indexes:
+        response.rows.append({"dimension_values": [{"value": "20220101"}, {"value": f"date_range_{i}"}]})
+    return response
+
+
+def get_page_label(response):
+    if response is None or isinstance(response, str):
+        return response
+    indexes = [int(row.dimension_values[1].value.rsplit("_", 1)[1]) for row in response.rows]
+    return f"{response.metadata.currency_code} {indexes}"
+
+
+def make_record(dimension_headers, metric_headers, dimension_values, metric_values):
+    """Builds a record from scratch, as RecordBuilder should for the report of TestRecordBuilder."""
+    dimension_pairs = [(to_snake_case(header), value) for header, value in zip(dimension_headers, dimension_values)
+                       if header != "dateRange"]
+    record = dict(dimension_pairs)
+    record.update((to_snake_case(header), value) for header, value in zip(metric_headers, metric_values))
+    record["property_id"] = "123456789"
+    record["account_id"] = "123456"
+    record["_sdc_record_hash"] = generate_sdc_record_hash(record, dimension_pairs)
+    for key, value in record.items():
+        if value and key in DATETIME_FORMATS:
+            record[key], _ = parse_datetime(key, value)
+    return record
+
+
+class TestRecordBuilder(unittest.TestCase):
+
+    def make_response(self, dimension_headers, metric_headers):
+        response = RunReportResponse(dimension_headers=[{"name": name} for name in dimension_headers],
+                                     metric_headers=[{"name": name} for name in metric_headers])
+        values = {"date": ["20220906", "20220907", "(other)", "20220906", ""],
+                  "dateHour": ["2022090600", "2022090723", "(other)", "(other)", "2022090600"]}
+        for i in range(5):
+            response.rows.append({"dimension_values": [{"value": values[name][i] if name in values else f"{name}_{i}"}
+                                                       for name in dimension_headers],
+                                  "metric_values": [{"value": str(i)} for _ in metric_headers]})
+        return response
+
+    def test_matches_records_built_from_scratch(self):
+        dimension_headers = ["date", "country", "customEvent:Campaign"]
+        metric_headers = ["sessions", "engagementRate"]
+        response = self.make_response(dimension_headers, metric_headers)
+        builder = get_record_builder("my_report", "123456789", "123456", tuple(dimension_headers), tuple(metric_headers))
+
+        expected = [make_record(dimension_headers, metric_headers,
+                                [value.value for value in row.dimension_values],
+                                [value.value for value in row.metric_values])
+                    for row in response.rows]
+        actual = list(builder.build_records(response))
+        self.assertEqual(expected, actual)
+        self.assertEqual([list(record) for record in expected], [list(record) for record in actual])
+
+    def test_date_range_dimension_is_dropped(self):
+        response = self.make_response(["date", "dateRange", "country"], ["sessions"])
+        builder = get_record_builder("my_report", "123456789", "123456", ("date", "dateRange", "country"), ("sessions",))
+
+        expected = [make_record(["date", "dateRange", "country"], ["sessions"],
+                                [value.value for value in row.dimension_values],
+                                [value.value for value in row.metric_values])
+                    for row in response.rows]
+        records = list(builder.build_records(response))
+        self.assertEqual(expected, records)
+        self.assertNotIn("date_range", records[0])
+
+    def test_datetimes_are_converted_and_row_limits_counted(self):
+        response = self.make_response(["date", "dateHour", "country"], ["sessions"])
+        builder = get_record_builder("my_report", "123456789", "123456", ("date", "dateHour", "country"), ("sessions",))
+        self.assertEqual(["date", "date_hour"], builder.datetime_keys)
+
+        with self.assertLogs(level="WARNING") as logs:
+            records = list(builder.build_records(response))
+        self.assertEqual(["2022-09-06T00:00:00.000000Z", "2022-09-07T00:00:00.000000Z", "(other)",
+                          "2022-09-06T00:00:00.000000Z", ""],
+                         [record["date"] for record in records])
+        self.assertEqual("2022-09-07T23:00:00.000000Z", records[1]["date_hour"])
+        self.assertEqual(1, len(logs.output))
+        self.assertIn("my_report, 2 rows of the page are (other)", logs.output[0])
+
+    def test_builders_are_reused_per_stream_and_headers(self):
+        builder = get_record_builder("my_report", "123456789", "123456", ("date",), ("sessions",))
+        self.assertIs(builder, get_record_builder("my_report", "123456789", "123456", ("date",), ("sessions",)))
+        self.assertIsNot(builder, get_record_builder("my_report", "123456789", "123456", ("date",), ("totalUsers",)))
+
+
 class TestStreamShuffling(unittest.TestCase):
     stream_ids = ["stream5", "stream4", "stream3", "stream2", "stream1"]
     def get_selected_streams(self):
@@ -189,3 +423,10 @@ class TestStreamShuffling(unittest.TestCase):
         actual_streams = [stream.tap_stream_id for stream in actual]
         expected_streams = ["stream5", "stream1", "stream2", "stream3", "stream4"]
         self.assertEqual(expected_streams, actual_streams)
+
+    def test_concurrent_currently_syncing(self):
+        state = {"currently_syncing": "stream4", "currently_syncing_streams": ["stream4", "stream2"], "bookmarks": {}}
+        actual = sort_and_shuffle_streams(state["currently_syncing_streams"], self.get_selected_streams())
+        actual_streams = [stream.tap_stream_id for stream in actual]
+        expected_streams = ["stream4", "stream2", "stream5", "stream1", "stream3"]
+        self.assertEqual(expected_streams, actual_streams)
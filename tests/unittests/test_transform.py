@@ -0,0 +1,128 @@
+import copy
+import random
+import unittest
+from collections import defaultdict
+from unittest.mock import MagicMock
+
+from google.analytics.data_v1beta.types import DimensionMetadata, MetricMetadata, RunReportResponse
+from singer import Schema, Transformer
+from singer.transform import SchemaMismatch
+from tap_ga4.discover import generate_schema_and_metadata
+from tap_ga4.sync import get_record_builder
+from tap_ga4.transform import SchemaTransformer, get_schema_transformer
+
+DIMENSIONS = ["date", "dateHour", "firstSessionDate", "country", "hour", "week", "landingPage"]
+METRICS = {"sessions": "TYPE_INTEGER",
+           "eventCount": "TYPE_INTEGER",
+           "engagementRate": "TYPE_FLOAT",
+           "userEngagementDuration": "TYPE_SECONDS",
+           "totalRevenue": "TYPE_CURRENCY"}
+
+# Values GA4 returns, and some it shouldn't, for every kind of field
+DIMENSION_VALUES = {"date": ["20240101", "20240229", "(other)", "", "2024013", "20241301"],
+                    "dateHour": ["2024010100", "2024010123", "(other)", ""],
+                    "firstSessionDate": ["20231231", "(other)", "(not set)", ""],
+                    "hour": ["00", "7", "23", "(other)", "", "1,024", " 5 "]}
+OTHER_DIMENSION_VALUES = ["", "(not set)", "(other)", "12", "1,5", "/path?q=\"café\"", "日本語"]
+INTEGER_VALUES = ["0", "42", "-7", "1,234", "12.5", "1e3", "", "inf", "007"]
+FLOAT_VALUES = ["0", "0.5", "-1.25", "3", "1,234.5", "", "1e-3", "inf", "12."]
+
+
+def make_schema():
+    dimensions = [DimensionMetadata(api_name=name, category="Test") for name in DIMENSIONS]
+    metrics = [MetricMetadata(api_name=name, category="Test", type_=type_) for name, type_ in METRICS.items()]
+    schema, _ = generate_schema_and_metadata(dimensions, metrics, [], defaultdict(list), {"name": "my_report"})
+    # As sync_stream gets it from the catalog
+    return Schema.from_dict(schema).to_dict()
+
+
+def make_response(row_count, seed):
+    rng = random.Random(seed)
+    response = RunReportResponse.pb()()
+    for dimension in DIMENSIONS:
+        response.dimension_headers.add(name=dimension)
+    for metric in METRICS:
+        response.metric_headers.add(name=metric)
+    for _ in range(row_count):
+        row = response.rows.add()
+        for dimension in DIMENSIONS:
+            row.dimension_values.add(value=rng.choice(DIMENSION_VALUES.get(dimension, OTHER_DIMENSION_VALUES)))
+        for metric, type_ in METRICS.items():
+            row.metric_values.add(value=rng.choice(INTEGER_VALUES if type_ == "TYPE_INTEGER" else FLOAT_VALUES))
+    return RunReportResponse.wrap(response)
+
+
+def typed(record):
+    # 1 == 1.0, so compare the types of the values too
+    return [(key, type(value), value) for key, value in record.items()]
+
+
+class TestSchemaTransformer(unittest.TestCase):
+
+    def assert_transforms_like_transformer(self, schema, records):
+        schema_transformer = SchemaTransformer(copy.deepcopy(schema))
+        for record in records:
+            with self.subTest(record=record):
+                try:
+                    expected = typed(Transformer().transform(copy.deepcopy(record), copy.deepcopy(schema)))
+                except SchemaMismatch:
+                    with self.assertRaises(SchemaMismatch):
+                        schema_transformer.transform(copy.deepcopy(record), Transformer())
+                    continue
+                self.assertEqual(expected, typed(schema_transformer.transform(copy.deepcopy(record), Transformer())))
+
+    def test_matches_transformer_on_synthetic_responses(self):
+        schema = make_schema()
+        self.assertIsNotNone(SchemaTransformer(schema).converters)
+        for seed in range(5):
+            response = make_response(200, seed)
+            builder = get_record_builder("my_report", "123456789", 123456,
+                                         tuple(DIMENSIONS), tuple(METRICS))
+            records = list(builder.build_records(response))
+            self.assert_transforms_like_transformer(schema, records)
+            # None of these records need Transformer
+            transformer = Transformer()
+            transformer.transform = MagicMock(side_effect=AssertionError)
+            for record in records:
+                SchemaTransformer(schema).transform(record, transformer)
+
+    def test_matches_transformer_on_raw_values(self):
+        # Values that didn't go through the record builder, None included
+        schema = make_schema()
+        records = [{"date": value, "hour": value, "country": value, "sessions": value, "engagement_rate": value}
+                   for value in ["2024-01-01T00:00:00Z", "2024-01-01", None, 5, 2.5, True, "(other)", ""]]
+        self.assert_transforms_like_transformer(schema, records)
+
+    def test_values_the_schema_rejects_raise_schema_mismatch(self):
+        schema = make_schema()
+        for record in [{"sessions": "many"}, {"engagement_rate": "n/a"}, {"property_id": None}]:
+            with self.subTest(record=record), self.assertRaises(SchemaMismatch):
+                SchemaTransformer(schema).transform(record, Transformer())
+
+    def test_fields_outside_the_schema_are_removed_by_transformer(self):
+        transformer = Transformer()
+        record = SchemaTransformer(make_schema()).transform({"country": "US", "city": "Paris"}, transformer)
+        self.assertEqual({"country": "US"}, record)
+        self.assertEqual({"city"}, transformer.removed)
+
+    def test_other_schemas_fall_back_to_transformer(self):
+        schemas = [{"type": "object", "properties": {"is_new": {"type": ["boolean", "null"]}}},
+                   {"type": "object", "properties": {"amount": {"type": "string", "format": "singer.decimal"}}},
+                   {"type": "object", "properties": {"tags": {"type": "array", "items": {"type": "string"}}}},
+                   {"type": "object"},
+                   {"anyOf": [{"type": "object", "properties": {"a": {"type": "string"}}}]}]
+        records = [{"is_new": "false", "amount": "1.50", "tags": ["a", 1], "a": 1}]
+        for schema in schemas:
+            with self.subTest(schema=schema):
+                self.assertIsNone(SchemaTransformer(schema).converters)
+                self.assert_transforms_like_transformer(schema, records)
+
+    def test_transformers_with_options_are_used_as_is(self):
+        pre_hook = MagicMock(side_effect=lambda data, typ, schema: data)
+        SchemaTransformer(make_schema()).transform({"country": "US"}, Transformer(pre_hook=pre_hook))
+        pre_hook.assert_called()
+
+    def test_compiled_once_per_schema(self):
+        schema = make_schema()
+        self.assertIs(get_schema_transformer(schema), get_schema_transformer(copy.deepcopy(schema)))
+        self.assertIsNot(get_schema_transformer(schema), get_schema_transformer({"type": "object"}))
@@ -0,0 +1,54 @@
+import unittest
+from unittest.mock import patch
+
+import grpc
+from google.analytics.data_v1beta.services.beta_analytics_data.transports import (
+    BetaAnalyticsDataGrpcTransport, BetaAnalyticsDataRestTransport)
+from google.auth.credentials import AnonymousCredentials
+from tap_ga4.transport import TransportProfile
+
+
+class TestTransportProfile(unittest.TestCase):
+
+    def test_defaults_keep_the_library_settings(self):
+        profile = TransportProfile.from_config({})
+        self.assertEqual("grpc", profile.transport)
+        self.assertIsNone(profile.get_grpc_compression())
+        self.assertEqual([("grpc.max_send_message_length", -1), ("grpc.max_receive_message_length", -1)],
+                         profile.get_channel_options())
+
+    def test_from_config(self):
+        profile = TransportProfile.from_config({
+            "transport_compression": "GZIP",
+            "grpc_channel_options": '{"grpc.keepalive_time_ms": 30000, "grpc.max_receive_message_length": 1024}'})
+        self.assertEqual(grpc.Compression.Gzip, profile.get_grpc_compression())
+        self.assertEqual({"grpc.max_send_message_length": -1,
+                          "grpc.max_receive_message_length": 1024,
+                          "grpc.keepalive_time_ms": 30000},
+                         dict(profile.get_channel_options()))
+
+    def test_invalid_settings_raise(self):
+        with self.assertRaises(ValueError):
+            TransportProfile.from_config({"transport": "http3"})
+        with self.assertRaises(ValueError):
+            TransportProfile.from_config({"transport_compression": "brotli"})
+        with self.assertRaises(ValueError):
+            TransportProfile.from_config({"grpc_channel_options": "{keepalive"})
+        with self.assertRaises(ValueError):
+            TransportProfile("rest").get_async_transport()
+
+    def test_grpc_channel_gets_options_and_compression(self):
+        profile = TransportProfile("grpc", "gzip", {"grpc.keepalive_time_ms": 30000})
+        with patch.object(BetaAnalyticsDataGrpcTransport, "create_channel") as mock_create_channel:
+            transport = profile.get_transport()(credentials=AnonymousCredentials())
+        self.assertIsInstance(transport, BetaAnalyticsDataGrpcTransport)
+        kwargs = mock_create_channel.call_args.kwargs
+        self.assertEqual(grpc.Compression.Gzip, kwargs["compression"])
+        self.assertIn(("grpc.keepalive_time_ms", 30000), kwargs["options"])
+
+    def test_rest_transport_compression(self):
+        transport = TransportProfile("rest", "none").get_transport()(credentials=AnonymousCredentials())
+        self.assertIsInstance(transport, BetaAnalyticsDataRestTransport)
+        self.assertEqual("identity", transport._session.headers["Accept-Encoding"])
+        transport = TransportProfile("rest", "gzip").get_transport()(credentials=AnonymousCredentials())
+        self.assertIn("gzip", transport._session.headers["Accept-Encoding"])
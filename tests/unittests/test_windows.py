@@ -0,0 +1,96 @@
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+from google.analytics.data_v1beta.types import RunReportResponse
+from tap_ga4.sync import get_adaptive_report_pages, get_window_planner
+from tap_ga4.windows import AdaptiveWindowPlanner
+from tap_ga4.writer import Writer
+
+
+def get_page_size():
+    return 100
+
+
+def make_response(row_count=0, sampled=False, other_row=False):
+    response = RunReportResponse(row_count=row_count)
+    if sampled:
+        response.metadata.sampling_metadatas.append({"samples_read_count": 1, "sampling_space_size": 10})
+    response.metadata.data_loss_from_other_row = other_row
+    return response
+
+
+class TestAdaptiveWindowPlanner(unittest.TestCase):
+
+    def test_grows_on_small_windows(self):
+        planner = AdaptiveWindowPlanner("my_report", 7, 30, get_page_size)
+        planner.observe(make_response(row_count=10), 7)
+        self.assertEqual(14, planner.window_size)
+        planner.observe(make_response(row_count=10), 14)
+        self.assertEqual(28, planner.window_size)
+        planner.observe(make_response(row_count=10), 28)
+        self.assertEqual(30, planner.window_size)
+
+    def test_does_not_grow_on_partial_or_full_windows(self):
+        planner = AdaptiveWindowPlanner("my_report", 7, 30, get_page_size)
+        planner.observe(make_response(row_count=10), 3)
+        planner.observe(make_response(row_count=50), 7)
+        self.assertEqual(7, planner.window_size)
+
+    def test_shrinks_on_heavy_pagination_sampling_and_other_rows(self):
+        for response in [make_response(row_count=1000), make_response(sampled=True), make_response(other_row=True)]:
+            planner = AdaptiveWindowPlanner("my_report", 8, 30, get_page_size)
+            self.assertTrue(planner.should_refetch(response, 8))
+            self.assertEqual(4, planner.window_size)
+
+    def test_does_not_grow_back_to_a_shrunk_size(self):
+        # Windows of 8 days or more roll rows into "(other)"
+        planner = AdaptiveWindowPlanner("my_report", 8, 30, get_page_size)
+        self.assertTrue(planner.should_refetch(make_response(other_row=True), 8))
+        self.assertEqual(4, planner.window_size)
+        for _ in range(3):
+            planner.observe(make_response(row_count=10), planner.window_size)
+        self.assertEqual(7, planner.window_size)
+        self.assertFalse(planner.should_refetch(make_response(row_count=10), 7))
+
+    def test_page_size_comes_from_the_client(self):
+        client = MagicMock()
+        client.get_page_size.return_value = 1000
+        report = {"id": "my_report", "name": "my_report", "property_id": "123"}
+        state = {"bookmarks": {"my_report": {"123": {"request_window_size": 14}}}}
+        planner = get_window_planner(client, {"adaptive_request_window": "true"}, report, Writer(state))
+        self.assertEqual(14, planner.get_window_size())
+        # 300 rows are more than 4 pages of 100 rows, but not of 1000
+        self.assertFalse(planner.should_refetch(make_response(row_count=300), 14))
+        client.get_page_size.assert_called_with(report)
+
+    def test_single_day_windows_are_kept(self):
+        planner = AdaptiveWindowPlanner("my_report", 1, 30, get_page_size)
+        self.assertFalse(planner.should_refetch(make_response(other_row=True), 1))
+        self.assertEqual(1, planner.window_size)
+
+
+class TestAdaptiveReportPages(unittest.TestCase):
+
+    def test_refetches_smaller_windows(self):
+        # Any window longer than 2 days rolls rows into "(other)"
+        def get_report(report, range_start_date, range_end_date):
+            days = (datetime.strptime(range_end_date, "%Y-%m-%d") - datetime.strptime(range_start_date, "%Y-%m-%d")).days + 1
+            yield make_response(row_count=30, other_row=days > 2)
+
+        client = MagicMock()
+        client.get_report.side_effect = get_report
+        planner = AdaptiveWindowPlanner("my_report", 8, 30, get_page_size)
+        pages = get_adaptive_report_pages(client,
+                                          {},
+                                          datetime(2022, 1, 1, tzinfo=timezone.utc),
+                                          datetime(2022, 1, 4, tzinfo=timezone.utc),
+                                          planner)
+        bookmarks = [range_end_date for range_end_date, response in pages if response is None]
+
+        self.assertEqual(["2022-01-02", "2022-01-04"], bookmarks)
+        requested = [call.args[1:] for call in client.get_report.call_args_list]
+        self.assertEqual([("2022-01-01", "2022-01-04"),
+                          ("2022-01-01", "2022-01-02"),
+                          ("2022-01-03", "2022-01-04")],
+                         requested)
@@ -0,0 +1,132 @@
+import io
+import json
+import time
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import MagicMock
+
+from google.analytics.data_v1beta.types import RunReportResponse
+from singer import Catalog, CatalogEntry, Schema
+from tap_ga4.sync import sync
+from tap_ga4.writer import Writer
+
+
+def read_messages(output):
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def make_stream(tap_stream_id):
+    schema = {"type": "object",
+              "properties": {"_sdc_record_hash": {"type": "string"},
+                             "property_id": {"type": "string"},
+                             "account_id": {"type": "string"},
+                             "date": {"type": ["string", "null"]},
+                             "sessions": {"type": ["integer", "number", "null"]}}}
+    mdata = [{"breadcrumb": [], "metadata": {"selected": True}},
+             {"breadcrumb": ["properties", "date"],
+              "metadata": {"inclusion": "automatic", "behavior": "DIMENSION", "tap-ga4.api-field-names": "date"}},
+             {"breadcrumb": ["properties", "sessions"],
+              "metadata": {"inclusion": "available", "selected": True, "behavior": "METRIC", "tap-ga4.api-field-names": "sessions"}}]
+    return CatalogEntry(tap_stream_id=tap_stream_id,
+                        stream=tap_stream_id,
+                        schema=Schema.from_dict(schema),
+                        key_properties=["_sdc_record_hash"],
+                        metadata=mdata)
+
+
+def fake_get_report(report, range_start_date, range_end_date):
+    response = RunReportResponse({"dimension_headers": [{"name": "date"}],
+                                  "metric_headers": [{"name": "sessions"}],
+                                  "row_count": 2})
+    for value in ["1", "2"]:
+        response.rows.append({"dimension_values": [{"value": range_start_date.replace("-", "")}],
+                              "metric_values": [{"value": value}]})
+    return [response]
+
+
+class TestWriter(unittest.TestCase):
+
+    def test_sequential_currently_syncing(self):
+        state = {}
+        writer = Writer(state)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            writer.start_stream("stream1")
+            writer.finish_stream("stream1")
+            writer.finish_sync()
+        states = [message["value"] for message in read_messages(output)]
+        self.assertEqual([{"currently_syncing": "stream1"},
+                          {"currently_syncing": "stream1"},
+                          {"currently_syncing": None}],
+                         states)
+
+    def test_concurrent_currently_syncing(self):
+        state = {}
+        writer = Writer(state, concurrent=True)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            writer.start_stream("stream1")
+            writer.start_stream("stream2")
+            writer.finish_stream("stream1")
+            writer.finish_sync()
+        states = [message["value"] for message in read_messages(output)]
+        self.assertEqual({"currently_syncing": "stream1", "currently_syncing_streams": ["stream1"]}, states[0])
+        self.assertEqual({"currently_syncing": "stream1", "currently_syncing_streams": ["stream1", "stream2"]}, states[1])
+        self.assertEqual({"currently_syncing": "stream2", "currently_syncing_streams": ["stream2"]}, states[2])
+        self.assertEqual({"currently_syncing": None}, states[3])
+
+
+class TestConcurrentSync(unittest.TestCase):
+    config = {"start_date": "2022-01-01T00:00:00Z",
+              "end_date": "2022-01-10T00:00:00Z",
+              "property_id": "123456789",
+              "account_id": "123456",
+              "stream_concurrency": 3}
+
+    def test_states_only_cover_written_windows(self):
+        stream_ids = ["stream1", "stream2", "stream3", "stream4"]
+        catalog = Catalog([make_stream(tap_stream_id) for tap_stream_id in stream_ids])
+        client = MagicMock()
+        client.get_report.side_effect = fake_get_report
+        state = {}
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            sync(client, self.config, catalog, state)
+        messages = read_messages(output)
+
+        written_dates = {tap_stream_id: set() for tap_stream_id in stream_ids}
+        for message in messages:
+            if message["type"] == "RECORD":
+                written_dates[message["stream"]].add(message["record"]["date"])
+            elif message["type"] == "STATE":
+                for tap_stream_id, bookmark in message["value"].get("bookmarks", {}).items():
+                    last_report_date = bookmark[self.config["property_id"]]["last_report_date"]
+                    window_start = "2022-01-01T00:00:00.000000Z" if last_report_date == "2022-01-07" else "2022-01-08T00:00:00.000000Z"
+                    self.assertIn(window_start, written_dates[tap_stream_id])
+
+        self.assertEqual({"2022-01-01T00:00:00.000000Z", "2022-01-08T00:00:00.000000Z"}, written_dates["stream4"])
+        self.assertEqual(None, messages[-1]["value"]["currently_syncing"])
+        self.assertNotIn("currently_syncing_streams", messages[-1]["value"])
+        for tap_stream_id in stream_ids:
+            self.assertEqual("2022-01-10", state["bookmarks"][tap_stream_id]["123456789"]["last_report_date"])
+
+    def test_a_failed_stream_stops_the_running_ones(self):
+        catalog = Catalog([make_stream("stream1"), make_stream("stream2")])
+        config = {**self.config, "end_date": "2022-12-31T00:00:00Z", "stream_concurrency": 2}
+        requested_windows = []
+
+        def get_report(report, range_start_date, range_end_date):
+            if report["id"] == "stream1":
+                time.sleep(0.05)
+                raise ValueError("invalid filter")
+            requested_windows.append(range_start_date)
+            time.sleep(0.01)
+            return fake_get_report(report, range_start_date, range_end_date)
+
+        client = MagicMock()
+        client.get_report.side_effect = get_report
+        with redirect_stdout(io.StringIO()), self.assertRaisesRegex(ValueError, "invalid filter"):
+            sync(client, config, catalog, {})
+        # stream2 has 53 windows, but stops at its next page
+        self.assertLess(len(requested_windows), 20)